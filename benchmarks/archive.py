@@ -0,0 +1,91 @@
+"""Benchmark of time-range queries on the daily text files in ``ref_data/``.
+
+Compares TextArchive (with the index built from scratch, and cached) with
+parsing whole files with ``np.loadtxt`` and filtering, for one-hour
+queries at random times and for a query covering all of ``ref_data/``.
+
+Run from the top-level directory with::
+
+    python -m benchmarks.archive
+"""
+
+import os
+import glob
+import shutil
+import timeit
+from tempfile import mkdtemp
+from datetime import datetime, timedelta
+import numpy as np
+
+from clocklogger.archive import TextArchive
+
+REF_DATA = os.path.join(os.path.dirname(__file__), '..', 'ref_data')
+EPOCH = datetime(1970, 1, 1)
+
+
+def loadtxt_query(path, start, end):
+    """Load the files for the days in the range and filter them"""
+    t0, t1 = (start - EPOCH).total_seconds(), (end - EPOCH).total_seconds()
+    blocks = []
+    day = start.date() - timedelta(days=1)
+    while day <= end.date():
+        fn = os.path.join(path, day.strftime('clock%Y-%m-%d.txt'))
+        if os.path.exists(fn):
+            data = np.loadtxt(fn)
+            blocks.append(data[(data[:, 0] >= t0) & (data[:, 0] < t1)])
+        day += timedelta(days=1)
+    return np.concatenate(blocks)
+
+
+def best_time(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    # Work on a copy, so the index files aren't left in ref_data/
+    path = mkdtemp()
+    try:
+        for fn in glob.glob(os.path.join(REF_DATA, 'clock*.txt')):
+            shutil.copy(fn, path)
+        archive = TextArchive(path)
+        num_lines = len(archive.load(datetime(2012, 10, 1), datetime(2013, 5, 1)))
+        print("%d lines in ref_data\n" % num_lines)
+
+        rng = np.random.RandomState(1)
+        days = [datetime(2012, 10, 28), datetime(2013, 3, 30),
+                datetime(2013, 3, 31), datetime(2013, 4, 1)]
+        queries = [(days[d] + timedelta(hours=h), days[d] + timedelta(hours=h + 1))
+                   for d, h in zip(rng.randint(0, 4, 20).tolist(),
+                                   rng.randint(0, 14, 20).tolist())]
+        for start, end in queries:
+            assert np.array_equal(archive.load(start, end)['drift'],
+                                  loadtxt_query(path, start, end)[:, 1])
+
+        def run(query):
+            for start, end in queries:
+                query(start, end)
+
+        def cold():
+            for fn in glob.glob(os.path.join(path, '*.idx')):
+                os.remove(fn)
+            run(TextArchive(path).load)
+
+        print("%-24s %12s" % ("one-hour queries", "per query"))
+        for name, func in [
+                ("np.loadtxt + filter", lambda: run(lambda s, e: loadtxt_query(path, s, e))),
+                ("index built", cold),
+                ("index cached on disk", lambda: run(TextArchive(path).load)),
+                ("index in memory", lambda: run(archive.load))]:
+            print("%-24s %9.2f ms" % (name, best_time(func, 1) / len(queries) * 1e3))
+
+        start, end = datetime(2012, 10, 1), datetime(2013, 5, 1)
+        t_loadtxt = best_time(lambda: loadtxt_query(path, start, end), 1)
+        t_archive = best_time(lambda: archive.load(start, end), 1)
+        print("\nWhole range: np.loadtxt %.1f ms, TextArchive %.1f ms" %
+              (t_loadtxt * 1e3, t_archive * 1e3))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
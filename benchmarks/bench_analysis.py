@@ -0,0 +1,151 @@
+"""Benchmarks of the stages of ClockAnalyser on synthetic signals
+(see ``benchmarks/run.py``)"""
+
+import numpy as np
+
+from clocklogger.analysis import ClockAnalyser, DataError
+from clocklogger.streaming import StreamingClockAnalyser
+from clocklogger.multiclock import SharedSource, SharedPPSClockAnalyser, run_clocks
+from clocklogger.synthetic import SyntheticDataSource, clock_signal
+
+FS = 44100
+
+# Signals from clean to difficult
+SIGNALS = {
+    'clean': dict(noise=0.0001),
+    'ringing': dict(noise=0.0001, ringing=2.0),
+    'noisy': dict(noise=0.05, ringing=2.0, missing_ticks=0.01, missing_pps=0.02),
+}
+
+
+class Source(object):
+    fs = FS
+
+
+class TimeFindEdges(object):
+    params = list(SIGNALS)
+    audio_seconds = 6.0
+
+    def setup(self, signal):
+        self.analyser = ClockAnalyser(Source())
+        self.samples = clock_signal(FS, 6.0, seed=1, **SIGNALS[signal])[:, 1].copy()
+
+    def time_find_edges(self, signal):
+        self.analyser.find_edges(self.samples)
+
+
+class TimeFitDecays(object):
+    params = list(SIGNALS)
+    audio_seconds = 6.0
+
+    def setup(self, signal):
+        self.analyser = ClockAnalyser(Source())
+        self.samples = clock_signal(FS, 6.0, seed=1, **SIGNALS[signal])[:, 1].copy()
+        self.i_pos, self.i_neg = self.analyser.find_edges(self.samples)
+
+    def time_fit_decays(self, signal):
+        self.analyser.fit_decays(self.samples, self.i_pos)
+        self.analyser.fit_decays(self.samples, self.i_neg, sign=-1)
+
+
+class TimeInterpolateEdges(object):
+    params = ['linear', 'cubic']
+    audio_seconds = 6.0
+
+    def setup(self, method):
+        self.analyser = ClockAnalyser(Source())
+        self.analyser.edge_interpolation = method
+        self.samples = clock_signal(FS, 6.0, seed=1, noise=0.0001, rise=1e-4)[:, 1].copy()
+        self.i_pos, self.i_neg = self.analyser.find_edges(self.samples)
+
+    def time_interpolate_edges(self, method):
+        self.analyser.interpolate_edges(self.samples, self.i_pos)
+        self.analyser.interpolate_edges(self.samples, self.i_neg, sign=-1)
+
+
+class TimeProcessing(object):
+    """The whole loop over a minute of signal, with and without fitting
+    decays. Like the logger, processing starts again after a DataError
+    (caused by missing PPS pulses)."""
+    params = ['clean', 'noisy']
+    audio_seconds = 60.0
+
+    def setup(self, signal):
+        self.source = SyntheticDataSource(FS, self.audio_seconds, seed=1, phase=0.4,
+                                          rate=2.0, **SIGNALS[signal])
+
+    def _analyser(self):
+        self.source.i = 0
+        return ClockAnalyser(self.source)
+
+    def time_generate_edge_groups(self, signal):
+        for group in self._analyser().generate_edge_groups():
+            pass
+
+    def time_generate_edge_groups_fit_decay(self, signal):
+        for group in self._analyser().generate_edge_groups(fit_decay=True):
+            pass
+
+    def _process(self, fit_decay):
+        analyser = self._analyser()
+        while True:
+            try:
+                for data in analyser.process(pps_edge='down', fit_decay=fit_decay):
+                    pass
+                return
+            except DataError:
+                pass
+
+    def time_process(self, signal):
+        self._process(fit_decay=False)
+
+    def time_process_fit_decay(self, signal):
+        self._process(fit_decay=True)
+
+
+class TimeStreaming(TimeProcessing):
+    """The same with StreamingClockAnalyser, yielding groups early or
+    (``whole``) only from whole windows"""
+    params = ['early', 'whole']
+
+    def setup(self, mode):
+        super().setup('clean')
+        self.mode = mode
+
+    def _analyser(self):
+        self.source.i = 0
+        analyser = StreamingClockAnalyser(self.source)
+        if self.mode == 'early':
+            analyser.group_duration = 3.5
+        return analyser
+
+
+class TimeRawSamples(TimeProcessing):
+    """The same with the samples as floats or as the sound card's int16
+    frames"""
+    params = ['float', 'int16']
+
+    def setup(self, dtype):
+        self.source = SyntheticDataSource(FS, self.audio_seconds, seed=1, phase=0.4,
+                                          rate=2.0, raw=dtype == 'int16',
+                                          **SIGNALS['clean'])
+
+
+class TimeMultiClock(object):
+    """A minute of signal from one to four clocks sharing a PPS input"""
+    params = [1, 2, 4]
+    audio_seconds = 60.0
+
+    def setup(self, clocks):
+        signals = [clock_signal(FS, self.audio_seconds, seed=k, phase=0.4 + 0.5 * k,
+                                rate=2.0 * k, **SIGNALS['clean'])
+                   for k in range(clocks)]
+        self.y = np.column_stack([signal[:, 0] for signal in signals] + [signals[0][:, 1]])
+
+    def time_run_clocks(self, clocks):
+        source = SyntheticDataSource(FS, 1.0)
+        source.y = self.y
+        source.stop = len(self.y)
+        shared = SharedSource(source, pps_channel=clocks)
+        run_clocks({k: SharedPPSClockAnalyser(shared.clock(k)) for k in range(clocks)},
+                   lambda data: None)
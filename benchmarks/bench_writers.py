@@ -0,0 +1,67 @@
+"""Benchmarks of the writers (see ``benchmarks/run.py``).
+
+Each call writes 1000 records, i.e. 3000 seconds of audio. The records are
+made as they are written, which costs the same as the ``null`` writer.
+Writers to remote services aren't included, apart from RetryingWriter
+batching for a writer which does nothing.
+"""
+
+import shutil
+from tempfile import mkdtemp
+from datetime import datetime, timedelta
+
+from clocklogger.output.textfile import TextFileWriter
+from clocklogger.output.binary import BinaryFileWriter
+from clocklogger.output.retry import RetryingWriter
+from clocklogger.output.dispatch import WriterDispatcher
+from clocklogger.stats import OnlineStats
+from clocklogger.pyramid import PyramidWriter
+
+RECORDS_PER_CALL = 1000
+COLUMNS = ['time', 'drift', 'amplitude']
+
+
+class NullWriter(object):
+    def write(self, data):
+        pass
+
+    def write_batch(self, records):
+        pass
+
+
+WRITERS = {
+    'null': lambda path: NullWriter(),
+    'textfile': lambda path: TextFileWriter(path, 'clock', COLUMNS),
+    'textfile-buffered': lambda path: TextFileWriter(path, 'clock', COLUMNS,
+                                                     flush_interval=60),
+    'binary': lambda path: BinaryFileWriter(path, 'clock', COLUMNS),
+    'stats': lambda path: OnlineStats({}),
+    'pyramid': lambda path: PyramidWriter(path),
+    'retrying': lambda path: RetryingWriter(NullWriter()),
+    'dispatcher': lambda path: WriterDispatcher([NullWriter()], max_queue=10**6),
+}
+
+
+class TimeWriters(object):
+    params = list(WRITERS)
+    audio_seconds = 3.0 * RECORDS_PER_CALL
+
+    def setup(self, name):
+        self.path = mkdtemp()
+        self.writer = WRITERS[name](self.path)
+        self.t = datetime(2014, 2, 3)
+
+    def teardown(self, name):
+        close = getattr(self.writer, 'close', None)
+        if close is not None:
+            close()
+        shutil.rmtree(self.path)
+
+    def time_write(self, name):
+        write = self.writer.write
+        t = self.t
+        step = timedelta(seconds=3)
+        for i in range(RECORDS_PER_CALL):
+            write({'time': t, 'drift': 1e-6 * i, 'amplitude': 46.0})
+            t += step
+        self.t = t
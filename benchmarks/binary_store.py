@@ -0,0 +1,79 @@
+"""Load-time benchmark of the daily binary files against the text files.
+
+Writes a simulated year of clock records (one every 3 seconds, like
+``ref_data/``) as daily text files, converts them to binary files, and
+times loading the whole year back as arrays with ``np.loadtxt`` and with
+BinaryFileReader.
+
+Run from the top-level directory with::
+
+    python -m benchmarks.binary_store [days]
+"""
+
+import os
+import sys
+import time
+import glob
+import shutil
+from tempfile import mkdtemp
+from datetime import date, timedelta
+import numpy as np
+
+from clocklogger.output.binary import BinaryFileReader, convert_text_archive
+
+
+def write_text_archive(path, days, start=date(2015, 1, 1)):
+    rng = np.random.RandomState(1)
+    t0 = (start - date(1970, 1, 1)).days * 86400
+    for d in range(days):
+        day = start + timedelta(days=d)
+        fn = os.path.join(path, day.strftime("%Y/%m/clock%Y-%m-%d.txt"))
+        if not os.path.exists(os.path.dirname(fn)):
+            os.makedirs(os.path.dirname(fn))
+        t = t0 + 86400 * d + 3 * np.arange(28800)
+        drift = -1.3 + np.cumsum(rng.normal(0, 1e-4, 28800))
+        amplitude = 46 + rng.normal(0, 0.1, 28800)
+        with open(fn, 'w') as f:
+            f.writelines("%d %.6f %.6f\n" % row for row in
+                         zip(t.tolist(), drift.tolist(), amplitude.tolist()))
+
+
+def timed(func):
+    t0 = time.perf_counter()
+    result = func()
+    return time.perf_counter() - t0, result
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    path = mkdtemp()
+    try:
+        text_path = os.path.join(path, 'text')
+        binary_path = os.path.join(path, 'binary')
+        print("Writing %d days of text files..." % days)
+        write_text_archive(text_path, days)
+        files = sorted(glob.glob(os.path.join(text_path, '*/*/clock*.txt')))
+
+        t_convert, n = timed(lambda: convert_text_archive(text_path, binary_path))
+        print("Converted %d records in %.2f s\n" % (n, t_convert))
+
+        def loadtxt():
+            return np.concatenate([np.loadtxt(fn) for fn in files])
+
+        reader = BinaryFileReader(binary_path, 'clock')
+        start = date(2015, 1, 1)
+
+        def binary():
+            return reader.load(start, start + timedelta(days=days))
+
+        print("%-12s %10s" % ("loader", "time"))
+        for name, func in [("np.loadtxt", loadtxt), ("binary", binary)]:
+            elapsed, result = timed(func)
+            assert len(result) == n
+            print("%-12s %8.3f s" % (name, elapsed))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark of ClockAnalyser.fit_decays.
+
+Compares the batched least-squares fit with the original implementation
+(``np.vstack`` of segments and ``np.polyfit``), for the edges found in a
+6-second window and for larger numbers of edges, and shows the cost of
+``fit_decay=True`` relative to edge detection alone.
+
+Run from the top-level directory with::
+
+    python -m benchmarks.decay_fit
+"""
+
+import timeit
+import numpy as np
+
+from clocklogger.analysis import ClockAnalyser
+from clocklogger.synthetic import clock_signal
+
+
+class Source(object):
+    fs = 44100
+
+
+def legacy_fit_decays(analyser, y, i_edges):
+    """The original fit_decays"""
+    Nfit = int(analyser.decay_fit_duration * analyser.source.fs)
+    Nlag = int(analyser.decay_fit_delay * analyser.source.fs)
+    segments = np.vstack([y[i+Nlag:i+Nlag+Nfit] for i in i_edges
+                          if (i+Nlag+Nfit) < len(y)]).T
+    K, A_log = np.polyfit(np.arange(Nfit), np.log(segments), 1)
+    i_decay = (np.log(0.5) - A_log) / K
+    return i_edges[:len(i_decay)] + Nlag + i_decay
+
+
+def best_time(func, number=50):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    analyser = ClockAnalyser(Source())
+    signal = clock_signal(Source.fs, 6.0, noise=0.0001, seed=1)
+    tick = signal[:, 0].copy()
+    pps = signal[:, 1].copy()
+    edges = analyser.find_edges(pps)[0]
+
+    new = analyser.fit_decays(pps, edges)
+    old = legacy_fit_decays(analyser, pps, edges)
+    print("Max difference from original: %.2g samples\n" % abs(new - old).max())
+
+    print("%-22s %12s %12s %8s" % ("edges", "original", "batched", "speedup"))
+    for repeat in (1, 10, 100):
+        # Many windows' worth of edges, as when reanalysing recordings
+        y = np.tile(pps, repeat)
+        i = np.concatenate([edges + k * len(pps) for k in range(repeat)])
+        t_old = best_time(lambda: legacy_fit_decays(analyser, y, i), 10)
+        t_new = best_time(lambda: analyser.fit_decays(y, i), 10)
+        print("%-22d %9.3f ms %9.3f ms %7.1fx" %
+              (len(i), t_old * 1e3, t_new * 1e3, t_old / t_new))
+
+    # Cost per 6-second window of the four fits, relative to edge detection
+    def find_edges():
+        return analyser.find_edges(pps), analyser.find_edges(tick)
+    (pp, pn), (tp, tn) = find_edges()
+
+    def fit_all(fit):
+        fit(pps, pp); fit(pps, pn, -1); fit(tick, tp); fit(tick, tn, -1)
+
+    def legacy(y, i, sign=1):
+        return legacy_fit_decays(analyser, sign * y, i)
+
+    print("\nPer 6 s window: find_edges %.2f ms, original fits %.2f ms, "
+          "batched fits %.2f ms" %
+          (best_time(find_edges) * 1e3,
+           best_time(lambda: fit_all(legacy)) * 1e3,
+           best_time(lambda: fit_all(analyser.fit_decays)) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Accuracy and cost of the ways of timing edges in ClockAnalyser.
+
+Compares whole-sample edges (the default), linear and cubic interpolation
+of the threshold crossing (``edge_interpolation``) and fitting the pulse
+decays (``fit_decay=True``) on synthetic signals whose pulses rise over
+a given time, as they do after the sound card's input filters, so the
+true edge times are known to better than a sample.
+
+Accuracy is shown for the tick edges of one 6-second window and for the
+drift over two minutes, as the spread of the errors about their mean (a
+constant error cancels out in the drift, or is just an offset). Cost is
+the time per 6-second window of refining all four sets of edges, with
+that of finding them for comparison.
+
+Run from the top-level directory with::
+
+    python -m benchmarks.edge_interpolation
+"""
+
+import timeit
+import logging
+import numpy as np
+
+from clocklogger.analysis import ClockAnalyser, DataError
+from clocklogger.synthetic import SyntheticDataSource, clock_signal, pendulum_edges
+
+FS = 44100
+RATE = 37.0       # s/day, so the edges fall at every fraction of a sample
+PHASE = 0.4
+PERIOD = 3.0 / (1 + RATE / 86400)
+PPS_DOWN = 0.4    # time of the falling PPS edges after each second
+
+MODES = ['none', 'linear', 'cubic', 'fit_decay']
+
+
+class Source(object):
+    fs = FS
+
+
+def make_analyser(source, mode):
+    analyser = ClockAnalyser(source)
+    if mode in ('linear', 'cubic'):
+        analyser.edge_interpolation = mode
+    return analyser
+
+
+def refine(analyser, mode, y, i_edges, sign=1):
+    if mode == 'fit_decay':
+        return analyser.fit_decays(y, i_edges, sign)
+    if mode == 'none':
+        return i_edges
+    return analyser.interpolate_edges(y, i_edges, sign)
+
+
+def edge_errors(mode, rise, noise):
+    """Errors (s) in the rising tick edges of a 6-second window"""
+    analyser = make_analyser(Source(), mode)
+    tick = clock_signal(FS, 6.0, noise=noise, seed=1, rate=RATE, rise=rise,
+                        phase=PHASE)[:, 0].copy()
+    times, signs = pendulum_edges(6.0, period=PERIOD, phase=PHASE)
+    i_pos = analyser.find_edges(tick)[0]
+    refined = refine(analyser, mode, tick, i_pos)
+    true = times[signs > 0][:len(refined)]
+    return refined / FS - true
+
+
+def drift_errors(mode, rise, noise, duration=120.0):
+    """Errors (s) in the drift over ``duration`` seconds"""
+    source = SyntheticDataSource(FS, duration, seed=1, phase=PHASE, rate=RATE,
+                                 noise=noise, rise=rise)
+    analyser = make_analyser(source, mode)
+    records = []
+    while True:
+        try:
+            for data in analyser.process(pps_edge='down', fit_decay=mode == 'fit_decay'):
+                records.append(data)
+            break
+        except DataError:
+            pass
+
+    times, signs = pendulum_edges(duration, period=PERIOD, phase=PHASE)
+    ticks = times[signs > 0]
+    errors = []
+    for data in records:
+        # The true drift of the nearest tick to the one the record is for
+        t = (data['time'] - source.start_time).total_seconds()
+        candidates = ticks[(ticks > t - 3) & (ticks < t + 4)]
+        diff = (PPS_DOWN - candidates) % 1 - data['drift'] % 1
+        errors.append(diff[np.argmin(abs(diff))])
+    return np.array(errors)
+
+
+def best_time(func, number=20):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def window_cost(mode):
+    """Time to refine the edges of both channels of a 6-second window"""
+    analyser = make_analyser(Source(), mode)
+    signal = clock_signal(FS, 6.0, noise=0.0001, seed=1, rate=RATE, rise=1e-4,
+                          phase=PHASE)
+    tick = signal[:, 0].copy()
+    pps = signal[:, 1].copy()
+    (pp, pn), (tp, tn) = analyser.find_edges(pps), analyser.find_edges(tick)
+
+    def run():
+        refine(analyser, mode, pps, pp); refine(analyser, mode, pps, pn, -1)
+        refine(analyser, mode, tick, tp); refine(analyser, mode, tick, tn, -1)
+    return best_time(run), best_time(lambda: (analyser.find_edges(pps),
+                                              analyser.find_edges(tick)))
+
+
+def spread(errors):
+    errors = errors - errors.mean()
+    return "%6.2f %6.2f" % (errors.std() * 1e6, abs(errors).max() * 1e6)
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    print("Errors about the mean in us (rms, max), fs = %d Hz (1 sample = %.1f us)\n"
+          % (FS, 1e6 / FS))
+    print("%-10s %-9s %-7s %-14s %-14s" % ("mode", "rise", "noise", "edges", "drift"))
+    for rise in (2e-5, 1e-4, 3e-4):
+        for noise in (0.0001, 0.001):
+            for mode in MODES:
+                print("%-10s %-9g %-7g %-14s %-14s" % (
+                    mode, rise, noise, spread(edge_errors(mode, rise, noise)),
+                    spread(drift_errors(mode, rise, noise))))
+            print()
+
+    print("Per 6 s window:")
+    for mode in MODES[1:]:
+        refining, finding = window_cost(mode)
+        print("  %-10s %8.3f ms (find_edges %.3f ms)" % (mode, refining * 1e3, finding * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Microbenchmark of ClockAnalyser.find_edges on ringing signals.
+
+Compares the vectorised edge detection with the original implementation,
+which debounced candidate edges in a Python loop, on 6-second windows of
+synthetic signals with increasing amounts of ringing and noise.
+
+Run from the top-level directory with::
+
+    python -m benchmarks.edges
+"""
+
+import timeit
+import numpy as np
+
+from clocklogger.analysis import ClockAnalyser
+from clocklogger.synthetic import clock_signal
+
+
+class Source(object):
+    fs = 44100
+
+
+def legacy_find_edges(analyser, samples):
+    """The original find_edges and debounce"""
+    def debounce(edges):
+        mask_to = 0
+        cleaned = []
+        for e in edges:
+            if e >= mask_to:
+                cleaned.append(e)
+                mask_to = e + analyser.debounce_interval * analyser.source.fs
+        return cleaned
+
+    above = (samples > analyser.edge_level).astype(int)
+    below = (samples < -analyser.edge_level).astype(int)
+    i_pos = np.where(np.diff(above) > 0)[0]
+    i_neg = np.where(np.diff(below) > 0)[0]
+    return debounce(i_pos), debounce(i_neg)
+
+
+def count_candidates(analyser, samples):
+    above = samples > analyser.edge_level
+    below = samples < -analyser.edge_level
+    return (np.count_nonzero(~above[:-1] & above[1:]) +
+            np.count_nonzero(~below[:-1] & below[1:]))
+
+
+def main():
+    analyser = ClockAnalyser(Source())
+    cases = [
+        ("clean", dict(noise=0.0001)),
+        ("ringing", dict(noise=0.0001, ringing=2.0)),
+        ("ringing+noise", dict(noise=0.05, ringing=2.0)),
+        ("heavy noise", dict(noise=0.1, ringing=4.0)),
+    ]
+    print("%-14s %10s %12s %12s %8s" % ("signal", "candidates", "original",
+                                        "vectorised", "speedup"))
+    for name, options in cases:
+        samples = clock_signal(Source.fs, 6.0, seed=1, **options)[:, 0].copy()
+        new = analyser.find_edges(samples)
+        old = legacy_find_edges(analyser, samples)
+        assert all(np.array_equal(a, b) for a, b in zip(new, old))
+
+        number = 20
+        t_old = min(timeit.repeat(lambda: legacy_find_edges(analyser, samples),
+                                  number=number, repeat=3)) / number
+        t_new = min(timeit.repeat(lambda: analyser.find_edges(samples),
+                                  number=number, repeat=3)) / number
+        print("%-14s %10d %9.2f ms %9.2f ms %7.1fx" %
+              (name, count_candidates(analyser, samples),
+               t_old * 1e3, t_new * 1e3, t_old / t_new))
+
+
+if __name__ == '__main__':
+    main()
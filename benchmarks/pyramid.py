@@ -0,0 +1,100 @@
+"""Benchmark of plotting queries on the pyramid against the daily files.
+
+Builds the pyramid for a simulated year of clock records (one every 3
+seconds) and times adding records one at a time as the logger does. Then
+times queries for about 1000 points over spans from an hour to the whole
+year: from the pyramid, and by loading the daily binary files with
+BinaryFileReader and reducing them to min/mean/max per bin.
+
+Run from the top-level directory with::
+
+    python -m benchmarks.pyramid [days]
+"""
+
+import os
+import sys
+import time
+import shutil
+import timeit
+from tempfile import mkdtemp
+from datetime import datetime, timedelta
+import numpy as np
+
+from clocklogger.output.binary import BinaryFileReader, record_dtype, day_filename
+from clocklogger.pyramid import PyramidWriter, Pyramid
+
+START = datetime(2015, 1, 1)
+
+
+def write_binary_archive(path, days):
+    rng = np.random.RandomState(1)
+    t0 = int((START - datetime(1970, 1, 1)).total_seconds())
+    drift = -1.3
+    for d in range(days):
+        records = np.zeros(28800, record_dtype())
+        records['time'] = t0 + 86400 * d + 3 * np.arange(28800)
+        records['drift'] = drift + np.cumsum(rng.normal(0, 1e-4, 28800))
+        records['amplitude'] = 46 + rng.normal(0, 0.1, 28800)
+        drift = records['drift'][-1]
+        fn = day_filename(path, 'clock', START + timedelta(days=d))
+        if not os.path.exists(os.path.dirname(fn)):
+            os.makedirs(os.path.dirname(fn))
+        records.tofile(fn)
+
+
+def raw_query(reader, start, end, num_points):
+    """Load every record and reduce them to ``num_points`` bins"""
+    records = reader.load(start, end)
+    bins = np.linspace(0, len(records), num_points + 1).astype(int)[:-1]
+    return (np.minimum.reduceat(records['drift'], bins),
+            np.add.reduceat(records['drift'], bins) / np.diff(np.r_[bins, len(records)]),
+            np.maximum.reduceat(records['drift'], bins))
+
+
+def best_time(func):
+    return min(timeit.repeat(func, number=1, repeat=3))
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    path = mkdtemp()
+    try:
+        print("Writing %d days of binary files..." % days)
+        write_binary_archive(path, days)
+        reader = BinaryFileReader(path, 'clock')
+
+        t0 = time.perf_counter()
+        writer = PyramidWriter(os.path.join(path, 'pyramid'))
+        for d in range(days):
+            writer.write_records(reader.day(START + timedelta(days=d)))
+        writer.close()
+        print("Built pyramid in %.1f s" % (time.perf_counter() - t0))
+
+        live = PyramidWriter(os.path.join(path, 'live'))
+        records = [{'time': START + timedelta(seconds=3 * i), 'drift': 0.001 * i,
+                    'amplitude': 46.0} for i in range(28800)]
+        t0 = time.perf_counter()
+        for data in records:
+            live.write(data)
+        live.close()
+        print("Live updates: %.1f us per record" %
+              ((time.perf_counter() - t0) / len(records) * 1e6))
+        pyramid = Pyramid(os.path.join(path, 'pyramid'))
+
+        print("\n%-10s %9s %8s %14s %14s" % ("span", "interval", "points",
+                                             "pyramid", "daily files"))
+        for span in [timedelta(hours=1), timedelta(days=1), timedelta(days=30),
+                     timedelta(days=days)]:
+            end = START + span
+            interval, level = pyramid.query(START, end, 1000)
+            t_pyramid = best_time(lambda: pyramid.query(START, end, 1000))
+            t_raw = best_time(lambda: raw_query(reader, START, end, 1000))
+            print("%-10s %8ds %8d %11.2f ms %11.2f ms" % (
+                "%g h" % (span.total_seconds() / 3600), interval, len(level),
+                t_pyramid * 1e3, t_raw * 1e3))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Memory and CPU used per window with and without converting the sound
+card's int16 frames to floats.
+
+Each 6-second window of two-channel 44.1 kHz audio, as the logger handles
+it on a Raspberry Pi, is written into the sound card source's ring buffer
+(converting it to floats, or not with ``raw``), and then its edges are
+found and refined by fitting decays, which converts only the segments
+fitted. Memory is the size of the ring buffer (10 seconds) and the peak
+of the arrays allocated while analysing one window, as seen by
+``tracemalloc``; time is the best per window.
+
+Run from the top-level directory with::
+
+    python -m benchmarks.raw_samples
+"""
+
+import timeit
+import platform
+import tracemalloc
+import numpy as np
+
+from clocklogger.analysis import ClockAnalyser
+from clocklogger.recording import float_to_int16
+from clocklogger.ringbuffer import RingBuffer
+from clocklogger.synthetic import clock_signal
+
+FS = 44100
+WINDOW = 6 * FS
+BUFFER_DURATION = 10
+
+
+class Source(object):
+    fs = FS
+
+
+def make_buffer(raw):
+    return RingBuffer(BUFFER_DURATION * FS, channels=2,
+                      dtype=np.int16 if raw else float)
+
+
+def read(buffer, frames, raw):
+    buffer.clear()
+    buffer.write(frames, scale=None if raw else 1.0 / 2**15)
+    return buffer.view(len(frames))
+
+
+def find(analyser, samples):
+    return [analyser.find_edges(samples[:, channel]) for channel in (0, 1)]
+
+
+def refine(analyser, samples, edges):
+    for channel, (i_pos, i_neg) in zip((0, 1), edges):
+        analyser.fit_decays(samples[:, channel], i_pos)
+        analyser.fit_decays(samples[:, channel], i_neg, -1)
+
+
+def best_time(func, number=10):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(raw, frames):
+    analyser = ClockAnalyser(Source())
+    buffer = make_buffer(raw)
+    samples = read(buffer, frames, raw)
+    edges = find(analyser, samples)
+    return {
+        'buffer': buffer.data.nbytes,
+        'peak': peak_memory(lambda: refine(analyser, samples, find(analyser, samples))),
+        'read': best_time(lambda: read(buffer, frames, raw)),
+        'find_edges': best_time(lambda: find(analyser, samples)),
+        'fit_decays': best_time(lambda: refine(analyser, samples, edges)),
+    }
+
+
+def main():
+    frames = float_to_int16(clock_signal(FS, 6.0, noise=0.001, seed=1, rise=1e-4))
+    print("Per 6 s window of 2 x %d Hz audio (%s, numpy %s)\n"
+          % (FS, platform.machine(), np.__version__))
+    print("%-8s %10s %10s %10s %12s %12s %10s" % (
+        "samples", "buffer", "peak", "read", "find_edges", "fit_decays", "total"))
+    results = {}
+    for raw in (False, True):
+        r = results[raw] = measure(raw, frames)
+        total = r['read'] + r['find_edges'] + r['fit_decays']
+        print("%-8s %7.2f MB %7.2f MB %7.2f ms %9.2f ms %9.2f ms %7.2f ms" % (
+            'int16' if raw else 'float', r['buffer'] / 2**20, r['peak'] / 2**20,
+            r['read'] * 1e3, r['find_edges'] * 1e3, r['fit_decays'] * 1e3, total * 1e3))
+    total = {raw: sum(results[raw][k] for k in ('read', 'find_edges', 'fit_decays'))
+             for raw in results}
+    print("\nint16 uses %.0f%% of the buffer memory, %.0f%% of the peak and %.0f%% of "
+          "the time" % (100.0 * results[True]['buffer'] / results[False]['buffer'],
+                        100.0 * results[True]['peak'] / results[False]['peak'],
+                        100.0 * total[True] / total[False]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Memory and allocation benchmark for the sound card sample buffer.
+
+Compares the original ``np.r_`` concatenation buffer with ``RingBuffer`` for
+the steady-state pattern used by ``ClockAnalyser``: request a 6 second window,
+then consume about 3 seconds of it.
+
+Run from the top-level directory with::
+
+    python -m benchmarks.ringbuffer
+"""
+
+import time
+import tracemalloc
+import numpy as np
+
+from clocklogger.ringbuffer import RingBuffer
+
+WINDOW = 6.0   # seconds requested by ClockAnalyser
+CONSUME = 2.8  # seconds consumed per chunk (3 s less pretrigger)
+
+
+class ConcatBuffer(object):
+    """The original SoundCardDataSource buffering"""
+    def __init__(self, fs):
+        self.buffer = np.empty((0, 2))
+
+    def __len__(self):
+        return self.buffer.shape[0]
+
+    def write(self, frames):
+        samples = frames.astype(float) / 2**15
+        self.buffer = np.r_[self.buffer, samples]
+
+    def view(self, n):
+        return self.buffer[:n]
+
+    def consume(self, n):
+        self.buffer = self.buffer[n:]
+
+
+class RingBufferAdaptor(object):
+    def __init__(self, fs):
+        self.buffer = RingBuffer(10 * fs, channels=2)
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def write(self, frames):
+        self.buffer.write(frames, scale=1.0 / 2**15)
+
+    def view(self, n):
+        return self.buffer.view(n)
+
+    def consume(self, n):
+        self.buffer.consume(n)
+
+
+def run(buffer_class, fs, num_chunks):
+    window = int(WINDOW * fs)
+    step = int(CONSUME * fs)
+
+    # Pre-generate raw frames so the fake "stream" itself does not allocate
+    raw = np.random.randint(-2**15, 2**15, size=(window, 2)).astype(np.int16)
+
+    buf = buffer_class(fs)
+    peaks = []
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for i in range(num_chunks):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        num_to_read = window - len(buf)
+        if num_to_read > 0:
+            buf.write(raw[:num_to_read])
+        samples = buf.view(window)
+        samples = None
+        buf.consume(step)
+        _, peak = tracemalloc.get_traced_memory()
+        if i > 0:  # ignore the initial fill
+            peaks.append(peak - before)
+    elapsed = time.perf_counter() - t0
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / num_chunks, max(peaks), retained
+
+
+def main():
+    num_chunks = 50
+    print("%-12s %8s %14s %18s %14s" % ("buffer", "fs (Hz)", "time/chunk",
+                                         "peak alloc/chunk", "retained"))
+    for fs in (44100, 96000):
+        for name, cls in [("np.r_", ConcatBuffer),
+                          ("RingBuffer", RingBufferAdaptor)]:
+            dt, peak, retained = run(cls, fs, num_chunks)
+            print("%-12s %8d %11.3f ms %15.1f kB %11.1f kB" %
+                  (name, fs, dt * 1e3, peak / 1e3, retained / 1e3))
+
+
+if __name__ == '__main__':
+    main()
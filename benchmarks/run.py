@@ -0,0 +1,125 @@
+"""Runner for the benchmark suite in ``benchmarks/bench_*.py``.
+
+Benchmarks are written in the style of asv: classes whose names start
+with ``Time``, with ``time_*`` methods to be timed, an optional ``setup``
+(and ``teardown``) run before (and after) them, and optionally ``params``,
+a list of values each passed to ``setup`` and the methods in turn. Each
+class also sets ``audio_seconds``, the seconds of audio (or of clock
+records, 3 s each) one call of a method handles, so results are shown as
+throughput in audio-seconds per second as well as time per call.
+
+Run from the top-level directory with::
+
+    python -m benchmarks.run [-k PATTERN] [--json results.json]
+                             [--compare baseline.json]
+
+``--json`` saves the results so a later run can be compared with them.
+"""
+
+import sys
+import json
+import timeit
+import inspect
+import logging
+import argparse
+import importlib
+import pkgutil
+import platform
+from datetime import datetime
+
+import benchmarks
+
+
+def discover(pattern=None):
+    """Generate (name, class, method name) for each benchmark"""
+    for module_info in sorted(pkgutil.iter_modules(benchmarks.__path__), key=lambda m: m.name):
+        if not module_info.name.startswith('bench_'):
+            continue
+        module = importlib.import_module('benchmarks.' + module_info.name)
+        for class_name, cls in inspect.getmembers(module, inspect.isclass):
+            if not class_name.startswith('Time') or cls.__module__ != module.__name__:
+                continue
+            for method_name in sorted(m for m in dir(cls) if m.startswith('time_')):
+                name = '%s.%s.%s' % (module_info.name[len('bench_'):], class_name, method_name)
+                if pattern is None or pattern in name:
+                    yield name, cls, method_name
+
+
+def time_call(func, repeat=5, min_time=0.2):
+    """Best time per call, calling ``func`` enough times to take at least
+    ``min_time`` in each of ``repeat`` rounds"""
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1000000:
+            break
+        number *= 2 if elapsed > min_time / 10 else 10
+    best = elapsed / number
+    for i in range(repeat - 1):
+        best = min(best, timer.timeit(number) / number)
+    return best
+
+
+def run_benchmark(cls, method_name, repeat):
+    """Results for each of the class's params (or one, without params)"""
+    params = getattr(cls, 'params', [None])
+    results = []
+    for param in params:
+        args = () if param is None else (param,)
+        bench = cls()
+        if hasattr(bench, 'setup'):
+            bench.setup(*args)
+        try:
+            method = getattr(bench, method_name)
+            t = time_call(lambda: method(*args), repeat)
+        finally:
+            if hasattr(bench, 'teardown'):
+                bench.teardown(*args)
+        results.append({'param': param, 'time': t,
+                        'throughput': getattr(bench, 'audio_seconds', 0) / t})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the clocklogger benchmarks')
+    parser.add_argument('-k', dest='pattern', help='only run benchmarks with this in their name')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--compare', help='compare with results saved by --json')
+    args = parser.parse_args()
+    # The analysis warns about every incomplete swing in the signals
+    logging.basicConfig(level=logging.ERROR)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r['name'], str(r['param'])): r for r in json.load(f)['results']}
+
+    print("%-70s %12s %16s %8s" % ("benchmark", "time", "audio-s per s",
+                                   "ratio" if baseline else ""))
+    results = []
+    for name, cls, method_name in discover(args.pattern):
+        for result in run_benchmark(cls, method_name, args.repeat):
+            result['name'] = name
+            results.append(result)
+            label = name if result['param'] is None else '%s(%s)' % (name, result['param'])
+            line = "%-70s %9.3f ms %16.1f" % (label, result['time'] * 1e3,
+                                              result['throughput'])
+            base = baseline.get((name, str(result['param'])))
+            if base is not None:
+                # Above 1 means slower than the baseline
+                line += " %7.2fx" % (result['time'] / base['time'])
+            print(line)
+            sys.stdout.flush()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'date': datetime.now().isoformat(),
+                       'python': platform.python_version(),
+                       'machine': platform.machine(),
+                       'results': results}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Throughput benchmark of TextFileWriter.
+
+Writes a simulated year of clock records (one every 3 seconds) with the
+original writer, which flushed after every record and worked out the
+filename each time, and with the buffered writer at a few flush settings.
+
+Run from the top-level directory with::
+
+    python -m benchmarks.textfile [days]
+"""
+
+import os
+import sys
+import time
+import shutil
+from tempfile import mkdtemp
+from datetime import datetime, timedelta
+import numpy as np
+
+from clocklogger.output.textfile import TextFileWriter, datetime_to_epoch
+
+
+class LegacyTextFileWriter(object):
+    """The original TextFileWriter"""
+
+    def __init__(self, path, prefix, columns=None):
+        self.path = path
+        self.columns = columns
+        self.pattern = "%Y/%m/{}%Y-%m-%d.txt".format(prefix)
+        self.file = None
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def write(self, data):
+        cols = self.columns or sorted(data)
+        formats = {
+            np.float64: '%.6f',
+            float: '%.6f',
+        }
+        time = data['time']
+        data = dict(data)
+        data['time'] = datetime_to_epoch(time)
+        fn = os.path.join(self.path, time.strftime(self.pattern))
+        if self.file is None or self.file.name != fn:
+            if self.file is not None: self.file.close()
+            if not os.path.exists(os.path.dirname(fn)):
+                os.makedirs(os.path.dirname(fn))
+            self.file = open(fn, 'at')
+        self.file.write(" ".join(formats.get(type(data[k]), "%s") %
+                                  data[k] for k in cols) + "\n")
+        self.file.flush()
+
+
+def records(days):
+    t = datetime(2015, 1, 1)
+    rng = np.random.RandomState(1)
+    drift = np.cumsum(rng.normal(0, 1e-4, 100000))
+    amplitude = 46 + rng.normal(0, 0.1, 100000)
+    for i in range(days * 28800):
+        yield {'time': t + timedelta(seconds=3 * i),
+               'drift': drift[i % 100000], 'amplitude': amplitude[i % 100000]}
+
+
+def run(make_writer, days):
+    path = mkdtemp()
+    try:
+        data = list(records(days))
+        writer = make_writer(path)
+        t0 = time.perf_counter()
+        for d in data:
+            writer.write(d)
+        writer.close()
+        return time.perf_counter() - t0
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    columns = ['time', 'drift', 'amplitude']
+    cases = [
+        ("original", lambda path: LegacyTextFileWriter(path, 'clock', columns)),
+        ("unbuffered", lambda path: TextFileWriter(path, 'clock', columns)),
+        ("100 records", lambda path: TextFileWriter(
+            path, 'clock', columns, flush_records=100)),
+        ("60 s", lambda path: TextFileWriter(
+            path, 'clock', columns, flush_interval=60)),
+        ("60 s + fsync", lambda path: TextFileWriter(
+            path, 'clock', columns, flush_interval=60, fsync=True)),
+        ("1 hour", lambda path: TextFileWriter(
+            path, 'clock', columns, flush_interval=3600)),
+    ]
+    n = days * 28800
+    print("Writing %d days (%d records)\n" % (days, n))
+    print("%-14s %10s %14s" % ("writer", "time", "records/s"))
+    for name, make_writer in cases:
+        elapsed = run(make_writer, days)
+        print("%-14s %8.2f s %14.0f" % (name, elapsed, n / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,14 @@
 
+import logging
 import numpy as np
 from numpy import sin, cos, pi
+from numpy.lib.stride_tricks import sliding_window_view
 from datetime import timedelta
+from functools import lru_cache
+
+from .timing import timers
+
+logger = logging.getLogger(__name__)
 
 PLOT = False
 try:
@@ -14,12 +21,134 @@ if PLOT:
 
 PPS_RATE_ERROR_THRESHOLD = 50e-6
 
+# Value of one count of raw int16 frames from the sound card
+INT16_SCALE = 1.0 / 2**15
+
 class DataError(Exception):
     pass
 
 def round_time_to_three_seconds(t):
     return t.replace(second = (t.second//3)*3, microsecond = 0)
 
+def is_raw(samples):
+    """Whether ``samples`` are raw int16 frames rather than floats"""
+    return samples.dtype.kind == 'i'
+
+def samples_to_float(samples):
+    """Samples as floats (full scale 1.0), converting raw int16 frames"""
+    if is_raw(samples):
+        return samples * INT16_SCALE
+    return samples
+
+def raw_threshold(level):
+    """Integer threshold ``t`` such that raw frames ``y > t`` (or
+    ``y < -t``) exactly where ``y * INT16_SCALE > level`` (or
+    ``< -level``), and likewise for ``<=`` and ``>=``"""
+    return int(np.floor(level / INT16_SCALE))
+
+def negate(samples):
+    """``-samples``, without full-scale negative raw frames wrapping round"""
+    if is_raw(samples):
+        inverted = np.negative(samples)
+        inverted[samples == np.iinfo(samples.dtype).min] = np.iinfo(samples.dtype).max
+        return inverted
+    return -samples
+
+@lru_cache()
+def decay_fit_projector(n):
+    """Matrix giving the least-squares (slope, intercept) of a line fitted
+    to ``n`` equally-spaced values"""
+    x = np.arange(n)
+    return np.linalg.pinv(np.c_[x, np.ones(n)])
+
+def masked_linear_fit(y, mask):
+    """Least-squares lines fitted to the rows of ``y``, using only the values
+    where ``mask`` is true. Rows with fewer than two such values give NaN."""
+    x = np.arange(y.shape[1])
+    w = mask.astype(float)
+    Sw = w.sum(axis=1)
+    Sx = w @ x
+    Sxx = w @ (x * x)
+    Sy = (w * y).sum(axis=1)
+    Sxy = (w * y) @ x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (Sw * Sxy - Sx * Sy) / (Sw * Sxx - Sx * Sx)
+        intercept = (Sy - slope * Sx) / Sw
+    return slope, intercept
+
+def interpolate_crossings(y, i_edges, level, method='linear', sign=1):
+    """Sub-sample times at which ``sign * y`` rises through ``level``, just
+    after each index in ``i_edges`` (where ``y[i] <= level < y[i + 1]``).
+
+    With ``method='cubic'``, the crossing is found on the cubic through the
+    samples from ``i - 1`` to ``i + 2`` (by Newton's method, starting from
+    the linear estimate); edges at the ends of ``y``, or where the cubic
+    doesn't cross between the samples, are interpolated linearly.
+    """
+    if method not in ('linear', 'cubic'):
+        raise ValueError("Unknown interpolation method %r" % method)
+    i = np.asarray(i_edges).astype(int)
+    y0 = sign * samples_to_float(y[i])
+    y1 = sign * samples_to_float(y[i + 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.clip((level - y0) / (y1 - y0), 0.0, 1.0)
+    x[~np.isfinite(x)] = 0.0
+    if method == 'cubic' and len(i):
+        inner = np.flatnonzero((i >= 1) & (i + 2 < len(y)))
+        j = i[inner]
+        ym, y0, y1, y2 = (sign * samples_to_float(y[j + k]) for k in (-1, 0, 1, 2))
+        # Lagrange cubic through (-1, ym), (0, y0), (1, y1), (2, y2)
+        a1 = -ym / 3 - y0 / 2 + y1 - y2 / 6
+        a2 = ym / 2 - y0 + y1 / 2
+        a3 = (y2 - ym) / 6 + (y0 - y1) / 2
+        xc = x[inner]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for _ in range(2):
+                p = y0 - level + xc * (a1 + xc * (a2 + xc * a3))
+                dp = a1 + xc * (2 * a2 + xc * 3 * a3)
+                xc = xc - p / dp
+        good = (xc >= 0) & (xc <= 1)
+        x[inner[good]] = xc[good]
+    return i + x
+
+def edges_from(edges, start):
+    """``edges`` from ``start`` on. Edges which are NaN (whose decays
+    couldn't be fitted) are kept unless a later edge is before ``start``,
+    so that they aren't mistaken for missing edges."""
+    before = np.flatnonzero(edges < start)
+    return edges[before[-1] + 1:] if len(before) else edges
+
+def edges_before(edges, stop):
+    """``edges`` before ``stop``, keeping NaN edges unless an earlier edge
+    is not before ``stop`` (see ``edges_from``)"""
+    after = np.flatnonzero(edges >= stop)
+    return edges[:after[0]] if len(after) else edges
+
+def fitted_group(pps, tick):
+    """The (pps, tick) edges without unfitted (NaN) ticks, or None if the
+    ticks the drift and amplitude are worked out from couldn't be fitted"""
+    i_pos_tick, i_neg_tick = tick
+    if np.isnan(i_pos_tick[:3]).any() or np.isnan(i_neg_tick[:2]).any():
+        return None
+    return pps, (i_pos_tick[~np.isnan(i_pos_tick)], i_neg_tick[~np.isnan(i_neg_tick)])
+
+def schmitt_edges(on, off=None):
+    """Indices of samples just before a trigger is switched on.
+
+    The trigger is switched on where ``on`` is true and off where ``off`` is
+    true, and otherwise keeps its state. Without ``off``, the trigger is
+    simply on wherever ``on`` is true.
+    """
+    if off is None:
+        return np.flatnonzero(~on[:-1] & on[1:])
+
+    # Only samples which set the state matter: an edge is where a sample
+    # which switches the trigger on follows one which switched it off.
+    i_set = np.flatnonzero(on | off)
+    state = on[i_set]
+    switched_on = np.flatnonzero(~state[:-1] & state[1:]) + 1
+    return i_set[switched_on] - 1
+
 class ClockAnalyser(object):
     def __init__(self, source, initial_drift=0, invert=False):
         self.source = source
@@ -30,30 +159,43 @@ class ClockAnalyser(object):
         self.cache_start_time = None
         self.pretrigger = 0.2 # seconds
         self.edge_level = 0.1
+        self.edge_hysteresis = 0.0 # edges re-arm below edge_level - edge_hysteresis
         self.shim_width = 24.0 # millimetres ~= milliradians (at 1m from pivot)
         self.decay_fit_duration = 0.05  # duration of fit segment (s)
         self.decay_fit_delay = 0.003 # wait after crossing threshold (s)
         self.decay_fit_level = 0.5 # y-value to use as reference point
         self.debounce_interval = 0.02 # Ignore extra transitions for a while (s)
+        self.edge_interpolation = None # 'linear' or 'cubic' for sub-sample edge times
 
     def process(self, pps_edge='up', sampling_rate_from_pps=False, fit_decay=False):
         """Read samples from source and yield drift & amplitude values"""
+        yield from self.process_edge_groups(self.generate_edge_groups(fit_decay=fit_decay),
+                                            pps_edge, sampling_rate_from_pps)
+
+    def process_edge_groups(self, edge_groups, pps_edge='up', sampling_rate_from_pps=False):
+        """Yield drift & amplitude values from edge groups, as generated by
+        ``generate_edge_groups``"""
 
         #pretrigger_samples = self.pretrigger * source.fs
         last_time = None
-        for t, (i_pos_pps, i_neg_pps), (i_pos_tick, i_neg_tick) in self.generate_edge_groups(fit_decay=fit_decay):
+        for t, (i_pos_pps, i_neg_pps), (i_pos_tick, i_neg_tick) in edge_groups:
             i_pps = i_pos_pps if pps_edge == 'up' else i_neg_pps
-            self.sanity_check_pps(i_pps)
+            with timers.time('drift_amplitude'):
+                pps_rate = self.sanity_check_pps(i_pps)
+
+                # Let the source calibrate its sample clock against PPS
+                timebase = getattr(self.source, 'timebase', None)
+                if timebase is not None:
+                    timebase.observe_pps_rate(pps_rate)
 
-            # Find first PPS after down tick & calculate drift
-            drift_delta = self.calculate_drift(i_pos_tick, i_pps, sampling_rate_from_pps)
+                # Find first PPS after down tick & calculate drift
+                drift_delta = self.calculate_drift(i_pos_tick, i_pps, sampling_rate_from_pps)
 
-            # Calculate amplitude
-            amplitude = self.calculate_amplitude(i_pos_tick, i_neg_tick)
+                # Calculate amplitude
+                amplitude = self.calculate_amplitude(i_pos_tick, i_neg_tick)
 
-            print((("Found ticks: PPS  %5d up, %5d down\n" +
-                   "             Tick %5d up, %5d down") \
-                 % tuple([len(_) for _ in [i_pos_pps, i_neg_pps, i_pos_tick, i_neg_tick]])))
+            logger.debug("Found ticks: PPS  %5d up, %5d down; Tick %5d up, %5d down",
+                         len(i_pos_pps), len(i_neg_pps), len(i_pos_tick), len(i_neg_tick))
 
             # Unwrap phase
             if self.last_drift is None:
@@ -62,10 +204,10 @@ class ClockAnalyser(object):
                 self.last_drift = self.drift_offset + drift_delta
             if (self.drift_offset + drift_delta) > (self.last_drift + 0.5):
                 self.drift_offset -= 1
-                print("(offset -1 sec to %d)" % self.drift_offset)
+                logger.info("Drift offset -1 sec to %d", self.drift_offset)
             elif (self.drift_offset + drift_delta) < (self.last_drift - 0.5):
                 self.drift_offset += 1
-                print("(offset +1 sec to %d)" % self.drift_offset)
+                logger.info("Drift offset +1 sec to %d", self.drift_offset)
             self.last_drift = drift = self.drift_offset + drift_delta
 
             # Make the time be neat; multiple of 3 seconds from midnight
@@ -75,10 +217,10 @@ class ClockAnalyser(object):
             t = round_time_to_three_seconds(t)
             if last_time is not None:
                 if t == last_time:
-                    print("------ skipping repeated time %s" % t)
+                    logger.info("Skipping repeated time %s", t)
                     continue
                 if t == last_time + timedelta(seconds=6):
-                    print("------------- filling gap before %s" % t)
+                    logger.info("Filling gap before %s", t)
                     yield {"time": t - timedelta(seconds = 3),
                            "drift": drift, "amplitude": amplitude}
             last_time = t
@@ -92,7 +234,7 @@ class ClockAnalyser(object):
             try:
                 samples = self.source.get_samples(num_samples)
                 if self.invert:
-                    samples *= -1
+                    samples = negate(samples)
                 self.source.consume(num_samples)
             except EOFError:
                 break
@@ -100,14 +242,16 @@ class ClockAnalyser(object):
             # Stats
             pps = samples[:, self.source.CHANNEL_PPS]
             tick = samples[:, self.source.CHANNEL_TICK]
+            pps_range = samples_to_float(np.array([pps.min(), pps.max()]))
+            tick_range = samples_to_float(np.array([tick.min(), tick.max()]))
 
             # Analyse to find edges
             i_pos_pps,  i_neg_pps  = self.find_edges(pps)
             i_pos_tick, i_neg_tick = self.find_edges(tick)
 
             yield {
-                'pps': { 'min': pps.min(), 'max': pps.max(), 'npos': len(i_pos_pps), 'nneg': len(i_neg_pps) },
-                'tick': { 'min': tick.min(), 'max': tick.max(), 'npos': len(i_pos_tick), 'nneg': len(i_neg_tick) },
+                'pps': { 'min': pps_range[0], 'max': pps_range[1], 'npos': len(i_pos_pps), 'nneg': len(i_neg_pps) },
+                'tick': { 'min': tick_range[0], 'max': tick_range[1], 'npos': len(i_pos_tick), 'nneg': len(i_neg_tick) },
             }
 
     def generate_edge_groups(self, fit_decay=False):
@@ -116,149 +260,254 @@ class ClockAnalyser(object):
             # Read some samples
             num_samples = 6 * self.source.fs
             try:
-                samples = self.source.get_samples(num_samples)
-                if self.invert:
-                    samples *= -1
+                with timers.time('read'):
+                    samples = self.source.get_samples(num_samples)
             except EOFError:
                 break
 
             # Analyse to find edges
-            i_pos_pps,  i_neg_pps  = self.find_edges(samples[:, self.source.CHANNEL_PPS ])
-            i_pos_tick, i_neg_tick = self.find_edges(samples[:, self.source.CHANNEL_TICK])
-
-            # Fit decay to improve accuracy if required
-            if fit_decay:
-                i_pos_pps  = self.fit_decays( samples[:, self.source.CHANNEL_PPS ], i_pos_pps)
-                i_neg_pps  = self.fit_decays(-samples[:, self.source.CHANNEL_PPS ], i_neg_pps)
-                i_pos_tick = self.fit_decays( samples[:, self.source.CHANNEL_TICK], i_pos_tick)
-                i_neg_tick = self.fit_decays(-samples[:, self.source.CHANNEL_TICK], i_neg_tick)
-
-            # Find which is the 'down' tick: the IR signal looks like this:
-            #
-            # Tick:   ,u'     ,d'                    ,u'     ,d'
-            #
-            # (a):  | 0 1     2 3     (long gap)   |
-            # (b):          | 0 1     (long gap)     2 3   |
-            #
-            # The 3 seconds start either before an 'up' tick (a) or a 'down' tick (b).
-            # (down means pendulum is about to pass through centre, up is return swing)
-            # We distinguish the two cases by comparing the inner gap ([2] - [1]) with
-            # the outer gap ([0]+3secs - [3]).
-
-            if len(i_pos_tick) < 3:
-                print("Not enough ticks")
-                if PLOT:
-                    #plt.clf()
-                    fig, ax = plt.subplots(2, sharex=True)
-                    ax[0].plot(samples[:, 0]) #[:,self.source.CHANNEL_TICK])
-                    ax[1].plot(samples[:, 1])
-                    ax[0].set_title('tick')
-                    ax[1].set_title('pps')
-                    for i in i_pos_tick: ax[0].axvline(i, c='g')
-                    for i in i_neg_tick: ax[0].axvline(i, c='r')
-                    for i in i_pos_pps: ax[1].axvline(i, c='g')
-                    for i in i_neg_pps: ax[1].axvline(i, c='r')
-                    plt.show()
-                    plt.draw()
-                self.source.consume(len(samples))
-                continue
-
-            # Start of pulse is up
-            tick_gap_1 = i_pos_tick[1] - i_pos_tick[0]
-            tick_gap_2 = i_pos_tick[2] - i_pos_tick[1]
-            if tick_gap_1 > tick_gap_2:
-                # down tick 0 is the start of the down-swing
-                iref = i_pos_tick[0]
-                print("First tick is down-swing")
-            else:
-                # down tick 1 is the start of the down-swing
-                iref = i_pos_tick[1]
-                print("Second tick is down-swing")
-
-            # Consume samples belonging to this chunk
-            i_put_back = iref + (3.0 - self.pretrigger)*self.source.fs
-
-            i_pos_tick = [i for i in i_pos_tick if i >= iref]
-            i_neg_tick = [i for i in i_neg_tick if i >= iref]
-            i_pos_pps  = [i for i in i_pos_pps  if i >= iref]
-            i_neg_pps  = [i for i in i_neg_pps  if i >= iref]
-
-            # XXX This is messy, checking multiple times
-            if len(i_pos_tick) < 3:
-                print("Not enough ticks after down-swing")
+            pps = samples[:, self.source.CHANNEL_PPS]
+            tick = samples[:, self.source.CHANNEL_TICK]
+            with timers.time('find_edges'):
+                i_pos_pps,  i_neg_pps  = self.find_pps_edges(pps)
+                i_pos_tick, i_neg_tick = self.find_edges(tick)
+            sign = 1
+            if self.invert:
+                # The edges of the inverted signal are those of the opposite
+                # sign, so the samples don't need to be copied and negated
+                i_pos_pps, i_neg_pps = i_neg_pps, i_pos_pps
+                i_pos_tick, i_neg_tick = i_neg_tick, i_pos_tick
+                sign = -1
+
+            # Fit decay or interpolate to improve accuracy if required
+            if fit_decay or self.edge_interpolation:
+                with timers.time('fit_decays' if fit_decay else 'interpolate_edges'):
+                    i_pos_pps  = self.refine_edges(pps,  i_pos_pps,  sign, fit_decay)
+                    i_neg_pps  = self.refine_edges(pps,  i_neg_pps, -sign, fit_decay)
+                    i_pos_tick = self.refine_edges(tick, i_pos_tick, sign, fit_decay)
+                    i_neg_tick = self.refine_edges(tick, i_neg_tick, -sign, fit_decay)
+
+            iref = self.find_down_swing(i_pos_tick)
+            group = None
+            if iref is not None:
+                group = self.edge_group(iref, (i_pos_pps, i_neg_pps), (i_pos_tick, i_neg_tick))
+            if PLOT:
+                self.plot_window(samples, group)
+            if group is None:
                 self.source.consume(len(samples))
                 continue
 
-            if PLOT:
-                #plt.clf()
-                fig, ax = plt.subplots(2, sharex=True)
-                ax[0].plot(samples[:, 0]) #[:,self.source.CHANNEL_TICK])
-                ax[1].plot(samples[:, 1])
-                ax[0].set_title('tick')
-                ax[1].set_title('pps')
-                for i in i_pos_tick: ax[0].axvline(i, c='g')
-                for i in i_neg_tick: ax[0].axvline(i, c='r')
-                for i in i_pos_pps: ax[1].axvline(i, c='g')
-                for i in i_neg_pps: ax[1].axvline(i, c='r')
-                ax[0].axvline(i_put_back, c='k', lw='2')
-                ax[0].plot(int(iref), samples[int(iref), self.source.CHANNEL_TICK], 'o')
-                ax[0].axvline(iref, ls='--', c='k')
-                plt.show()
-                plt.draw()
-
             # Time of reference tick
             t = self.source.time + timedelta(seconds = iref / self.source.fs)
 
-            print("Consuming %d samples" % i_put_back)
+            # Consume samples belonging to this chunk
+            i_put_back = iref + (3.0 - self.pretrigger)*self.source.fs
+            logger.debug("Consuming %d samples", i_put_back)
             #self.put_back_samples(samples[i_put_back:])
             self.source.consume(i_put_back)
 
-            yield t, (i_pos_pps, i_neg_pps), (i_pos_tick, i_neg_tick)
+            yield (t,) + group
+
+    def refine_edges(self, y, i_edges, sign, fit_decay):
+        """Edges found by ``find_edges``, refined by fitting decays if
+        ``fit_decay`` or by interpolation if ``edge_interpolation`` is set"""
+        if fit_decay:
+            return self.fit_decays(y, i_edges, sign)
+        if self.edge_interpolation:
+            return self.interpolate_edges(y, i_edges, sign)
+        return i_edges
+
+    def find_down_swing(self, i_pos_tick):
+        """Index of the tick starting the first down-swing, or None if there
+        aren't enough ticks to tell"""
+        # Find which is the 'down' tick: the IR signal looks like this:
+        #
+        # Tick:   ,u'     ,d'                    ,u'     ,d'
+        #
+        # (a):  | 0 1     2 3     (long gap)   |
+        # (b):          | 0 1     (long gap)     2 3   |
+        #
+        # The 3 seconds start either before an 'up' tick (a) or a 'down' tick (b).
+        # (down means pendulum is about to pass through centre, up is return swing)
+        # We distinguish the two cases by comparing the inner gap ([2] - [1]) with
+        # the outer gap ([0]+3secs - [3]).
+
+        if len(i_pos_tick) < 3:
+            logger.warning("Not enough ticks")
+            return None
+        if np.isnan(i_pos_tick[:3]).any():
+            logger.warning("Could not fit tick decays")
+            return None
+
+        # Start of pulse is up
+        tick_gap_1 = i_pos_tick[1] - i_pos_tick[0]
+        tick_gap_2 = i_pos_tick[2] - i_pos_tick[1]
+        if tick_gap_1 > tick_gap_2:
+            # down tick 0 is the start of the down-swing
+            logger.debug("First tick is down-swing")
+            return i_pos_tick[0]
+        else:
+            # down tick 1 is the start of the down-swing
+            logger.debug("Second tick is down-swing")
+            return i_pos_tick[1]
+
+    def edge_group(self, iref, pps, tick):
+        """The (pps, tick) edges from ``iref`` on, or None if there aren't
+        enough ticks after it, or the decays of those used couldn't be
+        fitted"""
+        (i_pos_pps, i_neg_pps), (i_pos_tick, i_neg_tick) = pps, tick
+        i_pos_tick = edges_from(i_pos_tick, iref)
+        i_neg_tick = edges_from(i_neg_tick, iref)
+        # Unfitted PPS edges are left out, like missing ones
+        i_pos_pps  = i_pos_pps [i_pos_pps  >= iref]
+        i_neg_pps  = i_neg_pps [i_neg_pps  >= iref]
+
+        # XXX This is messy, checking multiple times
+        if len(i_pos_tick) < 3:
+            logger.warning("Not enough ticks after down-swing")
+            return None
+        group = fitted_group((i_pos_pps, i_neg_pps), (i_pos_tick, i_neg_tick))
+        if group is None:
+            logger.warning("Could not fit tick decays after down-swing")
+        return group
+
+    def plot_window(self, samples, group):
+        #plt.clf()
+        fig, ax = plt.subplots(2, sharex=True)
+        ax[0].plot(samples[:, 0]) #[:,self.source.CHANNEL_TICK])
+        ax[1].plot(samples[:, 1])
+        ax[0].set_title('tick')
+        ax[1].set_title('pps')
+        if group is not None:
+            (i_pos_pps, i_neg_pps), (i_pos_tick, i_neg_tick) = group
+            iref = i_pos_tick[0]
+            for i in i_pos_tick: ax[0].axvline(i, c='g')
+            for i in i_neg_tick: ax[0].axvline(i, c='r')
+            for i in i_pos_pps: ax[1].axvline(i, c='g')
+            for i in i_neg_pps: ax[1].axvline(i, c='r')
+            ax[0].axvline(iref + (3.0 - self.pretrigger)*self.source.fs, c='k', lw='2')
+            ax[0].plot(int(iref), samples[int(iref), self.source.CHANNEL_TICK], 'o')
+            ax[0].axvline(iref, ls='--', c='k')
+        plt.show()
+        plt.draw()
 
     def debounce(self, edges):
-        """Remove extra edges caused by ringing on transitions"""
+        """Remove extra edges caused by ringing on transitions.
 
-        mask_to = 0     # edges prior to this sample number will be ignored
-        cleaned = []    # cleaned list of edges
+        Each accepted edge masks any others within ``debounce_interval``
+        after it. The next accepted edge after each one is found for all
+        edges at once, so only accepted edges are visited in Python.
+        """
+        edges = np.asarray(edges)
+        if len(edges) == 0:
+            return edges
+        following = np.searchsorted(edges, edges + self.debounce_interval * self.source.fs)
+
+        keep = []
+        i = 0
+        while i < len(edges):
+            keep.append(i)
+            i = following[i]
+        return edges[keep]
 
-        for e in edges:
-            if e >= mask_to:
-                cleaned.append(e)
-                mask_to = e + self.debounce_interval * self.source.fs;
+    def find_edges(self, samples):
+        """Find indices of samples just before the signal rises above
+        ``edge_level`` (positive edges) or falls below ``-edge_level``
+        (negative edges).
 
-        return cleaned
+        With ``edge_hysteresis``, a further edge is only found after the
+        signal has returned within ``edge_level - edge_hysteresis`` of zero.
 
-    def find_edges(self, samples):
-        above = (samples >  self.edge_level).astype(int)
-        below = (samples < -self.edge_level).astype(int)
-        i_pos = np.where(np.diff(above) > 0)[0]
-        i_neg = np.where(np.diff(below) > 0)[0]
+        Raw int16 frames are compared with integer thresholds, which find
+        the same edges as the floats they would be converted to.
+        """
+        level, release = self.edge_thresholds(samples)
+        if release is not None:
+            i_pos = schmitt_edges(samples > level, samples <= release)
+            i_neg = schmitt_edges(samples < -level, samples >= -release)
+        else:
+            i_pos = schmitt_edges(samples > level)
+            i_neg = schmitt_edges(samples < -level)
         return self.debounce(i_pos), self.debounce(i_neg)
 
-    def fit_decays(self, y, i_edges):
+    def find_pps_edges(self, pps):
+        """``find_edges`` for the PPS channel of the window just read from
+        the source (overridden where the PPS is shared by several clocks)"""
+        return self.find_edges(pps)
+
+    def edge_thresholds(self, samples):
+        """``edge_level`` and the release level (None without
+        ``edge_hysteresis``) in the units of ``samples``"""
+        level = self.edge_level
+        release = self.edge_level - self.edge_hysteresis if self.edge_hysteresis else None
+        if is_raw(samples):
+            level = raw_threshold(level)
+            if release is not None:
+                release = raw_threshold(release)
+        return level, release
+
+    def interpolate_edges(self, y, i_edges, sign=1):
+        """Sub-sample times at which ``sign * y`` crosses ``edge_level`` at
+        each of the edges ``i_edges`` found by ``find_edges``, interpolated
+        as set by ``edge_interpolation``.
+
+        Much cheaper than ``fit_decays``, but the times are those of the
+        leading edges of the pulses, so they differ from the fitted ones
+        by a fixed amount (which cancels out in the drift).
+        """
+        return interpolate_crossings(y, i_edges, self.edge_level,
+                                     self.edge_interpolation, sign)
+
+    def fit_decays(self, y, i_edges, sign=1):
         """
-        Fit the exponential decays found in ``y`` after each index in ``ii``
+        Fit the exponential decays found in ``sign * y`` after each index in
+        ``i_edges``.
+
+        Samples which are not positive are left out of the fit. If fewer
+        than two samples in a segment are positive, or the fitted decay
+        crosses the threshold further from the edge than the end of the
+        segment, the edge can't be fitted and is NaN. If ``y`` holds raw
+        int16 frames, only the segments fitted are converted to floats.
         """
         Nfit = int(self.decay_fit_duration * self.source.fs)
         Nlag = int(self.decay_fit_delay * self.source.fs)
 
-        # Extract decay segments and fit line to log(y)
-        segments = np.vstack([y[i+Nlag:i+Nlag+Nfit] for i in i_edges
-                              if (i+Nlag+Nfit) < len(y)]).T
-        K, A_log = np.polyfit(np.arange(Nfit), np.log(segments), 1)
-        A = np.exp(A_log)
+        # Edges without a complete segment after them are dropped
+        i_edges = np.asarray(i_edges)
+        i_edges = i_edges[i_edges + Nlag + Nfit < len(y)]
+        if len(i_edges) == 0:
+            return i_edges.astype(float)
+        starts = (i_edges + Nlag).astype(int)
+
+        # Extract decay segments (one per row) and fit line to log(y)
+        segments = samples_to_float(sliding_window_view(y, Nfit)[starts])
+        if sign != 1:
+            segments *= sign
+        positive = segments > 0
+        log_segments = np.log(segments, out=np.zeros_like(segments), where=positive)
+        K, A_log = decay_fit_projector(Nfit) @ log_segments.T
+
+        masked = ~positive.all(axis=1)
+        if masked.any():
+            K[masked], A_log[masked] = masked_linear_fit(log_segments[masked],
+                                                         positive[masked])
 
         # Time when fitted line crosses a threshold
         # when ythresh = A exp(K i) ===> log(ythresh/A)/K = i
-        #i_decay = np.log(0.5 / A) / K
-        i_decay = (np.log(0.5) - A_log) / K
-        return i_edges[:len(i_decay)] + Nlag + i_decay
+        i_decay = (np.log(self.decay_fit_level) - A_log) / K
+        refined = i_edges + Nlag + i_decay
+        # Fits to noise can cross the threshold anywhere, even far before
+        # the edge; those edges can't be fitted either
+        with np.errstate(invalid='ignore'):
+            far = abs(refined - i_edges) > Nlag + Nfit
+        refined[far] = np.nan
+        return refined
 
     def sanity_check_pps(self, i_edges):
         # Find mean sample rate from PPS signal
         fs_mean = np.mean(np.diff(i_edges))
         fs_var = np.std(np.diff(i_edges))
-        print(i_edges, fs_mean, fs_var)
+        logger.debug("PPS edges %s, mean interval %s, std %s", i_edges, fs_mean, fs_var)
         if abs(fs_mean / self.source.fs - 1) > PPS_RATE_ERROR_THRESHOLD:
             raise DataError("Sample rate is off by too much: %+d ppm"
                             % (1e6*abs(fs_mean/self.source.fs-1)))
@@ -266,25 +515,25 @@ class ClockAnalyser(object):
         # PPS should be +/- 1us. Warn if std.deviation * 3, say, is greater than this.
         #  i.e. 9*variance > (1e-6 * fs)^2? but this is rather less than 1 sample...
         if fs_var > 2: #  warn if sample rate seems too variable (empirical)
-            print("** Warning: PPS signal interval variance is high (%d)" % fs_var)
+            logger.warning("PPS signal interval variance is high (%d)", fs_var)
+        return fs_mean
 
     def calculate_drift(self, ticks, pps, relative_to_pps=False):
-        pps_ref = [i for i in pps if i >= ticks[0]]
-        if not pps_ref:
+        i_pps_ref = np.searchsorted(pps, ticks[0])  # first PPS after tick
+        if i_pps_ref == len(pps):
             raise DataError("No PPS found after down tick")
 
         local_fs = self.source.fs
         if relative_to_pps:
             # Assume the gap between PPS edges is 1 second, rather than using
             # nominal sample rate
-            i_pps_ref = [j for j in range(len(pps)) if pps[j] >= ticks[0]][0]
             if i_pps_ref > 0: # use previous gap
                 local_fs = pps[i_pps_ref] - pps[i_pps_ref-1]
             elif (i_pps_ref == 0) and (i_pps_ref+1 < len(pps)): # use next gap
                 local_fs = pps[i_pps_ref+1] - pps[i_pps_ref]
             # Otherwise fall back on nominal rate
 
-        drift = (pps_ref[0] - ticks[0]) / local_fs
+        drift = (pps[i_pps_ref] - ticks[0]) / local_fs
         if drift > 1.5:
             # must be a missing PPS, or something's gone wrong
             raise DataError("Time between down tick and next PPS too high: %.2f s" % drift)
@@ -0,0 +1,202 @@
+"""Read time ranges from the daily text files written by TextFileWriter.
+
+Each file gets a sparse index of the byte offset of the first record in
+every hour, built the first time the file is read and cached next to it as
+``<file>.idx``. When the file has grown since (as today's file does), only
+the last indexed hour and what was added after it are read to bring the
+index up to date. A query only reads and parses the hours it needs, and the
+results come back as structured arrays (see ``output.binary.record_dtype``)
+one file at a time, so long ranges don't have to fit in memory at once.
+"""
+
+import os
+import os.path
+import logging
+from datetime import timedelta
+import numpy as np
+
+from .output.binary import record_dtype
+from .output.textfile import datetime_to_epoch
+
+logger = logging.getLogger(__name__)
+
+INDEX_INTERVAL = 3600
+
+
+def line_fields(data):
+    """Byte offsets at which the lines of ``data`` start, and the number of
+    space-separated fields in each"""
+    chars = np.frombuffer(data, dtype=np.uint8)
+    newline = chars == ord('\n')
+    space = newline | (chars == ord(' ')) | (chars == ord('\t')) | (chars == ord('\r'))
+    line_starts = np.r_[0, np.flatnonzero(newline[:-1]) + 1]
+    field_starts = np.flatnonzero(~space & np.r_[True, space[:-1]])
+    # Line of each field, counting the newlines before it
+    lines = np.cumsum(newline)[field_starts] - newline[field_starts]
+    return line_starts, np.bincount(lines, minlength=len(line_starts))
+
+
+def parse_records(text, dtype):
+    """Parse whole lines of space-separated values into records. Lines
+    without a value for every field (such as a line cut short when the
+    logger stopped) are skipped."""
+    num_columns = len(dtype.names)
+    if len(text) == 0:
+        return np.zeros(0, dtype)
+    line_starts, num_fields = line_fields(text)
+    bad = (num_fields != num_columns) & (num_fields != 0)
+    if bad.any():
+        logger.warning("Skipping %d lines without %d fields", bad.sum(), num_columns)
+        line_ends = np.r_[line_starts[1:], len(text)]
+        text = b''.join(text[i:j] for i, j in zip(line_starts[~bad], line_ends[~bad]))
+    values = np.fromstring(text, sep=' ').reshape((-1, num_columns))
+    records = np.zeros(len(values), dtype)
+    for j, k in enumerate(dtype.names):
+        records[k] = values[:, j]
+    return records
+
+
+def build_index(data, dtype, interval=INDEX_INTERVAL):
+    """Return (start of interval, byte offset of its first record) pairs for
+    every interval with records in ``data``"""
+    end = data.rfind(b'\n') + 1
+    if end == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    line_starts, num_fields = line_fields(data[:end])
+    line_starts = line_starts[num_fields == len(dtype.names)]
+    times = parse_records(data[:end], dtype)['time']
+    periods = times // interval
+    first = np.r_[True, periods[1:] != periods[:-1]]
+    return np.c_[periods[first] * interval, line_starts[first]].astype(np.int64)
+
+
+class FileIndex(object):
+    """Sparse index of one daily file"""
+
+    def __init__(self, filename, dtype, interval=INDEX_INTERVAL):
+        self.filename = filename
+        self.index_filename = filename + '.idx'
+        self.dtype = dtype
+        self.interval = interval
+        # The version of the file which has been indexed
+        self.size = 0
+        self.mtime = None
+        self.entries = np.zeros((0, 2), dtype=np.int64)
+        if os.path.exists(self.index_filename):
+            self._load()
+        self.update()
+
+    def _load(self):
+        try:
+            with open(self.index_filename, 'rb') as f:
+                stored = np.load(f)
+        except (OSError, ValueError) as err:
+            logger.warning("Could not read index %s: %s", self.index_filename, err)
+            return
+        # The first row records which version of the file was indexed
+        self.size, self.mtime = (int(x) for x in stored[0])
+        self.entries = stored[1:]
+
+    def update(self):
+        """Bring the index up to date with the file: extend it if the file
+        has grown since it was indexed, otherwise build it again"""
+        stat = os.stat(self.filename)
+        if (stat.st_size, stat.st_mtime_ns) == (self.size, self.mtime):
+            return
+        if stat.st_size > self.size and len(self.entries):
+            # The last indexed interval may carry on in what was added
+            begin = int(self.entries[-1, 1])
+            kept = self.entries[:-1]
+        else:
+            begin, kept = 0, self.entries[:0]
+        with open(self.filename, 'rb') as f:
+            f.seek(begin)
+            data = f.read(stat.st_size - begin)
+        added = build_index(data, self.dtype, self.interval)
+        added[:, 1] += begin
+        self.entries = np.r_[kept, added]
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime_ns
+        self._save()
+
+    def _save(self):
+        header = np.array([[self.size, self.mtime]], dtype=np.int64)
+        try:
+            with open(self.index_filename, 'wb') as f:
+                np.save(f, np.r_[header, self.entries])
+        except OSError as err:
+            logger.debug("Could not save index %s: %s", self.index_filename, err)
+
+    def byte_range(self, t0, t1):
+        """Byte range containing all records with ``t0 <= time < t1``"""
+        starts, offsets = self.entries[:, 0], self.entries[:, 1]
+        i0 = np.searchsorted(starts, t0 - t0 % self.interval, side='left')
+        i1 = np.searchsorted(starts, t1, side='left')
+        begin = offsets[i0] if i0 < len(offsets) else self.size
+        end = offsets[i1] if i1 < len(offsets) else self.size
+        return begin, end
+
+    def read(self, t0, t1):
+        """Records with ``t0 <= time < t1``"""
+        begin, end = self.byte_range(t0, t1)
+        if end <= begin:
+            return np.zeros(0, self.dtype)
+        with open(self.filename, 'rb') as f:
+            f.seek(begin)
+            data = f.read(end - begin)
+        # Ignore a partly-written last line
+        data = data[:data.rfind(b'\n') + 1]
+        records = parse_records(data, self.dtype)
+        i0, i1 = np.searchsorted(records['time'], [t0, t1])
+        return records[i0:i1]
+
+
+class TextArchive(object):
+    """Time-range queries over a directory of daily text files, either in
+    ``YYYY/MM`` folders (as written by TextFileWriter) or all together
+    (like ``ref_data/``)"""
+
+    def __init__(self, path, prefix='clock', columns=None):
+        self.path = path
+        self.prefix = prefix
+        self.dtype = record_dtype(columns)
+        self.indexes = {}
+
+    def filename(self, day):
+        name = day.strftime("{}%Y-%m-%d.txt".format(self.prefix))
+        nested = os.path.join(self.path, day.strftime("%Y/%m"), name)
+        if os.path.exists(nested):
+            return nested
+        flat = os.path.join(self.path, name)
+        if os.path.exists(flat):
+            return flat
+        return None
+
+    def index(self, filename):
+        index = self.indexes.get(filename)
+        if index is None:
+            index = self.indexes[filename] = FileIndex(filename, self.dtype)
+        else:
+            index.update()
+        return index
+
+    def query(self, start, end):
+        """Generate blocks of records with ``start <= time < end``, one block
+        per daily file. ``start`` and ``end`` are datetimes (UTC)."""
+        t0, t1 = datetime_to_epoch(start), datetime_to_epoch(end)
+        # Files may run a little past midnight, so look in the previous day's
+        day = start.date() - timedelta(days=1)
+        while day <= end.date():
+            filename = self.filename(day)
+            if filename is not None:
+                records = self.index(filename).read(t0, t1)
+                if len(records):
+                    yield records
+            day += timedelta(days=1)
+
+    def load(self, start, end):
+        """All records with ``start <= time < end`` as one array"""
+        blocks = list(self.query(start, end))
+        if not blocks:
+            return np.zeros(0, self.dtype)
+        return np.concatenate(blocks)
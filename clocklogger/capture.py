@@ -0,0 +1,196 @@
+import time
+import queue
+import threading
+import numpy as np
+import logging
+from .recording import RawRecording, is_raw_recording, float_to_int16
+
+logger = logging.getLogger(__name__)
+
+# PortAudio constants, as exported by pyaudio
+PA_CONTINUE = 0          # pyaudio.paContinue
+PA_COMPLETE = 1          # pyaudio.paComplete
+PA_INPUT_UNDERFLOW = 1   # pyaudio.paInputUnderflow
+PA_INPUT_OVERFLOW = 2    # pyaudio.paInputOverflow
+
+
+class CallbackCapture(object):
+    """Collect audio delivered by a PyAudio stream callback.
+
+    The callback runs on the PortAudio thread and only ever puts blocks of
+    frames onto a bounded queue, so acquisition never waits for analysis. If
+    the consumer falls so far behind that the queue fills up, the oldest block
+    is dropped and counted as an overrun.
+
+    Each block is tagged with the index of its first frame, counting every
+    frame delivered by the stream, so that dropped frames can be detected.
+    The capture time of each block is passed on to ``timebase`` if given.
+    """
+
+    def __init__(self, channels=2, max_blocks=64, timeout=5.0, timebase=None):
+        self.channels = channels
+        self.timeout = timeout
+        self.timebase = timebase
+        self.queue = queue.Queue(maxsize=max_blocks)
+        self.pending = None
+        self.overruns = 0        # blocks lost before reaching the consumer
+        self.underruns = 0       # reads which found no data to return
+        self.frames_captured = 0
+        self.frames_dropped = 0
+
+    @property
+    def depth(self):
+        """Number of blocks waiting to be read"""
+        return self.queue.qsize()
+
+    def callback(self, in_data, frame_count, time_info, status):
+        """PyAudio stream callback"""
+        now = time.time()
+        if status & PA_INPUT_OVERFLOW:
+            self.overruns += 1
+        if status & PA_INPUT_UNDERFLOW:
+            self.underruns += 1
+
+        frames = np.frombuffer(in_data, dtype=np.int16).reshape((-1, self.channels))
+        index = self.frames_captured
+        self.frames_captured += frames.shape[0]
+
+        # PortAudio's ADC time is on the stream clock; the stream clock's
+        # current time is passed on with the wall-clock time now, so the
+        # time base can work out the offset between the two. It is not
+        # supported by all host APIs (ALSA often gives zero), in which case
+        # the end of the block is taken to have been captured just now.
+        adc_time = time_info.get('input_buffer_adc_time', 0)
+        if adc_time:
+            timestamp = (index, adc_time, time_info['current_time'], now)
+        else:
+            timestamp = (self.frames_captured, now)
+
+        block = (index, frames, timestamp)
+        try:
+            self.queue.put_nowait(block)
+        except queue.Full:
+            # Make room by dropping the oldest block. This is the only thread
+            # putting blocks on the queue, so the second put cannot fail.
+            try:
+                dropped = self.queue.get_nowait()
+                self.frames_dropped += dropped[1].shape[0]
+            except queue.Empty:
+                pass
+            self.overruns += 1
+            self.queue.put_nowait(block)
+        return (None, PA_CONTINUE)
+
+    def read(self, max_frames):
+        """Return the index of the first frame and up to ``max_frames`` frames
+        (at least one), waiting for the next block if necessary.
+
+        Raises ``EOFError`` if no data arrives within the timeout.
+        """
+        if self.pending is None:
+            try:
+                index, frames, timestamp = self.queue.get(timeout=self.timeout)
+            except queue.Empty:
+                self.underruns += 1
+                raise EOFError("No audio received for %.1f seconds" % self.timeout)
+            if self.timebase is not None:
+                if len(timestamp) == 4:
+                    self.timebase.observe_adc(*timestamp)
+                else:
+                    self.timebase.observe(*timestamp)
+            self.pending = (index, frames)
+
+        index, frames = self.pending
+        if frames.shape[0] > max_frames:
+            self.pending = (index + max_frames, frames[max_frames:])
+        else:
+            self.pending = None
+        return index, frames[:max_frames]
+
+
+class ReplayStream(object):
+    """Stand-in for a PyAudio input stream which replays a recording.
+
+    Frames are released in real time (scaled by ``speed``) from the
+    samples of a raw or ``.npz`` recording, either to ``stream_callback``
+    from a background thread, or through blocking calls to ``read``.
+    """
+
+    def __init__(self, filename, frames_per_buffer=1024, stream_callback=None,
+                 speed=1.0):
+        if is_raw_recording(filename):
+            recording = RawRecording(filename)
+            self.fs = recording.fs
+            self.frames = recording.frames
+        else:
+            data = np.load(filename)
+            self.fs = int(data['fs'])
+            self.frames = float_to_int16(data['signal'])
+        self.channels = self.frames.shape[1]
+        self.frames_per_buffer = frames_per_buffer
+        self.stream_callback = stream_callback
+        self.speed = speed
+        self.position = 0
+        self.active = False
+        self.thread = None
+        self.start_stream()
+
+    def _stream_time(self):
+        return (time.monotonic() - self.t0) * self.speed
+
+    def _wait_until(self, num_frames):
+        """Sleep until the first ``num_frames`` frames have been 'recorded'"""
+        delay = num_frames / self.fs - self._stream_time()
+        if delay > 0:
+            time.sleep(delay / self.speed)
+
+    def _run(self):
+        while self.active and self.position < self.frames.shape[0]:
+            block = self.frames[self.position:self.position + self.frames_per_buffer]
+            self._wait_until(self.position + block.shape[0])
+            # Like PortAudio, times are on the monotonic clock
+            time_info = {
+                'input_buffer_adc_time': self.t0 + self.position / self.fs / self.speed,
+                'current_time': time.monotonic(),
+                'output_buffer_dac_time': 0,
+            }
+            self.position += block.shape[0]
+            result = self.stream_callback(block.tobytes(), block.shape[0],
+                                          time_info, 0)
+            if result[1] != PA_CONTINUE:
+                break
+        self.active = False
+
+    def start_stream(self):
+        self.t0 = time.monotonic() - self.position / self.fs / self.speed
+        self.active = True
+        if self.stream_callback is not None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop_stream(self):
+        self.active = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.stop_stream()
+
+    def is_active(self):
+        return self.active
+
+    def get_time(self):
+        return time.monotonic()
+
+    def get_read_available(self):
+        recorded = min(int(self._stream_time() * self.fs), self.frames.shape[0])
+        return max(recorded - self.position, 0)
+
+    def read(self, num_frames, exception_on_overflow=True):
+        if self.position >= self.frames.shape[0]:
+            raise EOFError
+        block = self.frames[self.position:self.position + num_frames]
+        self._wait_until(self.position + block.shape[0])
+        self.position += block.shape[0]
+        return block.tobytes()
@@ -1,36 +1,90 @@
 
+import time
 import numpy as np
 from datetime import datetime, timedelta
-import pyaudio
 import logging
+from .ringbuffer import RingBuffer
+from .capture import CallbackCapture
+from .timebase import TimeBase
+from .recording import RawRecording, is_raw_recording, float_to_int16
+
+try:
+    import pyaudio
+except ImportError:
+    pyaudio = None
 
 logger = logging.getLogger(__name__)
 
 
 class PrerecordedDataSource(object):
+    """Samples from a recording.
+
+    With ``raw``, samples are int16 frames as from the sound card: raw
+    recordings are read without converting them, and ``.npz`` recordings
+    are converted as they are loaded.
+    """
     CHANNEL_TICK = 0
     CHANNEL_PPS  = 1
 
-    def __init__(self, filename):
+    def __init__(self, filename, start=0, stop=None, raw=False):
         self.filename = filename
 
-        logger.info("Loading pre-recorded data from %s...", filename)
-        data = np.load(filename)
-        self.fs = data['fs']
-        self.y = data['signal']
-        self.start_time = datetime.fromtimestamp(data['start_time'])
-        self.i = 0
+        if is_raw_recording(filename):
+            # Raw recordings are memory-mapped, and converted to floats one
+            # window at a time in get_samples (unless ``raw``)
+            logger.info("Opening raw recording %s...", filename)
+            recording = RawRecording(filename)
+            self.CHANNEL_TICK = recording.channel_map['tick']
+            self.CHANNEL_PPS = recording.channel_map['pps']
+            self._set_samples(recording.frames, recording.fs,
+                              datetime.fromtimestamp(recording.start_time), start, stop, raw)
+        else:
+            logger.info("Loading pre-recorded data from %s...", filename)
+            data = np.load(filename)
+            self._set_samples(data['signal'], int(data['fs']),
+                              datetime.fromtimestamp(float(data['start_time'])),
+                              start, stop, raw)
+
+    def _set_samples(self, y, fs, start_time, start=0, stop=None, raw=False):
+        """Read ``y``, sampled at ``fs`` from ``start_time``. Samples are
+        converted to int16 frames as they are set, or from int16 frames as
+        they are read, to match ``raw``."""
+        if raw and y.dtype.kind != 'i':
+            y = float_to_int16(y)
+        self.fs = fs
+        self.y = y
+        self.buffer = np.empty((0, y.shape[1])) if y.dtype.kind == 'i' and not raw else None
+        self.start_time = start_time
+        self.i = start
+
+        # Samples from ``stop`` onwards can be read as part of a window that
+        # starts before it, but no new window will start there.
+        self.stop = self.y.shape[0] if stop is None else min(stop, self.y.shape[0])
+
+    @property
+    def num_samples(self):
+        return self.y.shape[0]
 
     def get_samples(self, num_samples):
-        """Return some samples"""
-        if self.i >= self.y.shape[0]:
+        """Return some samples.
+
+        For raw recordings read as floats the result is only valid until
+        the next call to ``get_samples``.
+        """
+        if self.i >= self.stop:
             raise EOFError
-        samples = self.y[self.i : (self.i + num_samples)]
-        return samples
+        samples = self.y[self.i : (self.i + int(num_samples))]
+        if self.buffer is None:
+            return samples
+        if self.buffer.shape[0] < samples.shape[0]:
+            self.buffer = np.empty(samples.shape)
+        out = self.buffer[:samples.shape[0]]
+        np.multiply(samples, 1.0 / 2**15, out=out)
+        return out
 
     def consume(self, num_samples):
         """Mark num_samples as having been used"""
-        self.i += num_samples
+        self.i += int(num_samples)
 
     @property
     def time(self):
@@ -38,65 +92,124 @@ class PrerecordedDataSource(object):
         return self.start_time + timedelta(seconds = self.i / self.fs)
 
 class SoundCardDataSource(object):
+    """Samples from the sound card, converted to floats or, with ``raw``,
+    kept as int16 frames (a quarter of the memory). Interfaces with more
+    than two inputs can be read with ``channels`` (see ``multiclock``)."""
     CHANNEL_TICK = 0
     CHANNEL_PPS  = 1
 
-    def __init__(self, sampling_rate=44100):
+    def __init__(self, sampling_rate=44100, buffer_duration=10,
+                 asynchronous=True, frames_per_buffer=4096, queue_duration=30,
+                 tap=None, raw=False, channels=2):
         self.fs = sampling_rate
+        self.tap = tap
+        self.raw = raw
+        self.channels = channels
+        self.buffer = RingBuffer(buffer_duration * sampling_rate, channels=channels,
+                                 dtype=np.int16 if raw else float)
+        self.timebase = TimeBase(sampling_rate)
+        self.sample_index = 0   # index of the first buffered sample
+        self.next_index = 0     # index of the next sample to be read
+
+        # In asynchronous mode, audio is collected by the stream callback on
+        # PortAudio's own thread, so slow analysis or output can't overflow
+        # the sound card's input buffer.
+        if asynchronous:
+            max_blocks = max(int(queue_duration * sampling_rate / frames_per_buffer), 2)
+            self.capture = CallbackCapture(channels=channels, max_blocks=max_blocks,
+                                           timebase=self.timebase)
+            self.stream = self._open_stream(frames_per_buffer, self.capture.callback)
+        else:
+            self.capture = None
+            self.stream = self._open_stream(44100)
+        self.last_overruns = 0
+
+    def _open_stream(self, frames_per_buffer, stream_callback=None):
+        if pyaudio is None:
+            raise ImportError("Could not import pyaudio package")
 
         logger.info("Starting PyAudio...")
         self.pyaudio_manager = pyaudio.PyAudio()
         dev = self.pyaudio_manager.get_default_input_device_info()
         if not self.pyaudio_manager.is_format_supported(
-                rate=sampling_rate,
+                rate=self.fs,
                 input_device=dev['index'],
-                input_channels=2,
+                input_channels=self.channels,
                 input_format=pyaudio.paInt16):
             raise RuntimeError("Unsupported audio format or rate")
 
-        self.stream = self.pyaudio_manager.open(
-            frames_per_buffer=44100,
-            format=pyaudio.paInt16, channels=2, rate=sampling_rate, input=True)
+        stream = self.pyaudio_manager.open(
+            frames_per_buffer=frames_per_buffer,
+            format=pyaudio.paInt16, channels=self.channels, rate=self.fs, input=True,
+            stream_callback=stream_callback)
         logger.info("PyAudio ready")
-
-        self.buffer = np.empty((0, 2))
-        self.buffer_start_time = None
+        return stream
 
     def __del__(self):
-        logger.info("Stopping PyAudio stream")
-        self.stream.stop_stream()
-        self.stream.close()
-        self.pyaudio_manager.terminate()
+        if getattr(self, 'stream', None) is not None:
+            logger.info("Stopping PyAudio stream")
+            self.stream.stop_stream()
+            self.stream.close()
+        if getattr(self, 'pyaudio_manager', None) is not None:
+            self.pyaudio_manager.terminate()
 
     def read(self, num_samples):
+        """Read up to num_samples raw frames from the sound card.
+
+        Returns the index of the first frame read, and the frames.
+        """
+        if self.capture is not None:
+            index, frames = self.capture.read(num_samples)
+            if self.capture.overruns != self.last_overruns:
+                logger.warning("Audio overrun: %d blocks lost so far (%d frames dropped)",
+                               self.capture.overruns, self.capture.frames_dropped)
+                self.last_overruns = self.capture.overruns
+            return index, frames
+
         logger.debug("Trying to read %d samples, %d available...",
                      num_samples, self.stream.get_read_available())
         raw_data = self.stream.read(num_samples)
-        samples = (np.frombuffer(raw_data, dtype=np.int16)
-                   .reshape((-1, 2))
-                   .astype(float)
-                   / 2**15)
+        frames = np.frombuffer(raw_data, dtype=np.int16).reshape((-1, self.channels))
+        available = self.stream.get_read_available()
         logger.debug("Read %d samples, now %d available",
-                     samples.shape[0], self.stream.get_read_available())
-        return samples
+                     frames.shape[0], available)
+
+        # Without hardware timestamps, the latest sample in the stream's
+        # buffer is taken to have been captured just now
+        self.timebase.observe(self.next_index + frames.shape[0] + available,
+                              time.time())
+        return self.next_index, frames
 
     def get_samples(self, num_samples):
-        """Return some samples"""
-        num_to_read = num_samples - self.buffer.shape[0]
-        if num_to_read > 0:
-            new_samples = self.read(num_to_read)
-            self.buffer = np.r_[ self.buffer, new_samples ]
-            self.buffer_start_time = \
-                datetime.utcnow() - timedelta(seconds=self.buffer.shape[0]/self.fs)
-        return self.buffer[:int(num_samples)]
+        """Return some samples.
+
+        The result is a view into the sample buffer, which is only valid
+        until the next call to ``get_samples`` or ``consume``.
+        """
+        num_samples = int(num_samples)
+        while len(self.buffer) < num_samples:
+            index, frames = self.read(num_samples - len(self.buffer))
+            if index != self.next_index:
+                # Samples were lost: discard what was buffered before the gap
+                # so the buffer stays contiguous
+                logger.warning("Lost %d samples; discarding %d buffered samples",
+                               index - self.next_index, len(self.buffer))
+                self.buffer.clear()
+                self.sample_index = index
+            if self.tap is not None:
+                self.tap.put(index, frames, self.timebase.timestamp_at(index))
+            # Raw frames are converted to floats as they are copied in
+            self.buffer.write(frames, scale=None if self.raw else 1.0 / 2**15)
+            self.next_index = index + frames.shape[0]
+        return self.buffer.view(num_samples)
 
     def consume(self, num_samples):
         """Mark num_samples as having been used"""
         self.get_samples(num_samples)
-        assert self.buffer.shape[0] >= num_samples
-        self.buffer = self.buffer[int(num_samples):]
+        self.buffer.consume(num_samples)
+        self.sample_index += int(num_samples)
 
     @property
     def time(self):
         """Time of first available sample"""
-        return self.buffer_start_time
+        return self.timebase.time_at(self.sample_index)
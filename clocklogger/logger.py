@@ -1,66 +1,209 @@
+import os
+import sys
 import argparse
 import time
 import logging
+from datetime import datetime, date, timedelta
 from .input import PrerecordedDataSource, SoundCardDataSource
 from .analysis import ClockAnalyser, DataError
+from .streaming import StreamingClockAnalyser
+from .multiclock import SharedSource, SharedPPSClockAnalyser, run_clocks
+from .output import exit_on_sigterm
+from .output.dispatch import WriterDispatcher, POLICIES, writer_policy_for
 from .output.textfile import TextFileWriter
-# from .output.influxdb import InfluxDBWriter
+from .output.binary import BinaryFileWriter, BinaryFileReader, convert_text_archive
+from .output.retry import RetryingWriter
+from .stats import OnlineStats, WINDOWS, stats_columns
+from .pyramid import PyramidWriter, Pyramid, backfill
+from .server import LatestSample, QueryServer
+from .archive import TextArchive
+from .timing import timers
+from . import reanalyse
+from . import regression
+from .recording import convert_npz
+from .tap import RecordingTap
+from .output.influxdb import InfluxDBWriter
 # from .output.tempodb import TempoDBWriter
 
 logger = logging.getLogger(__name__)
 
 
-def get_last_drift():
+def last_drift_filename(clock=None):
+    if clock is None:
+        return 'data/last_drift'
+    return 'data/last_drift-%s' % clock
+
+
+def get_last_drift(clock=None):
     try:
-        with open('data/last_drift', 'rt') as f:
+        with open(last_drift_filename(clock), 'rt') as f:
             last_drift = float(f.read())
     except:
         last_drift = 0.0
     return last_drift
 
 
-def save_last_drift(drift):
-    with open('data/last_drift', 'wt') as f:
+def save_last_drift(drift, clock=None):
+    with open(last_drift_filename(clock), 'wt') as f:
         f.write(str(drift))
 
 
-def process(analyser, writers):
-    for data in analyser.process(pps_edge='down'):
-        for writer in writers:
-            try:
-                writer.write(data)
-            except Exception as e:
-                logger.error("Writer error [%s]: %s", writer.__class__, e)
+def process(analyser, dispatcher, fit_decay=False):
+    for data in analyser.process(pps_edge='down', fit_decay=fit_decay):
+        dispatcher.write(data)
         save_last_drift(data['drift'])
 
 
-def do_logging(invert):
-    #source = PrerecordedDataSource('../../dataq/record_20130331_0002_100s.npz')
-    source = SoundCardDataSource()
-    analyser = ClockAnalyser(source, initial_drift=get_last_drift(), invert=invert)
+COLUMNS = ['time', 'drift', 'amplitude']
 
-    # Outputs
-    columns = ['time', 'drift', 'amplitude']
 
+def make_writers(prefix, flush_interval=None, fsync=False):
+    """Writers of the records of one clock, to files named after ``prefix``"""
     # TODO: should do this in a more flexible way
     writers = []
-    def add_writer(cls, *args):
+    def create_writer(cls, *args, **kwargs):
         try:
-            writers.append(cls(*args))
+            return cls(*args, **kwargs)
         except Exception as err:
             logger.error("Error creating %s: %s", cls, err)
-    add_writer(TextFileWriter, 'data', 'clock', columns)
-    #add_writer(InfluxDBWriter, 'clock', columns)
-    #add_writer(TempoDBWriter, 'clock', columns)
+            return None
+    def add_writer(cls, *args, **kwargs):
+        writer = create_writer(cls, *args, **kwargs)
+        if writer is not None:
+            writers.append(writer)
+    def add_remote_writer(cls, *args, **kwargs):
+        # Batched and retried, keeping a backlog on disk while the service is down
+        writer = create_writer(cls, *args, **kwargs)
+        if writer is not None:
+            add_writer(RetryingWriter, writer,
+                       overflow='data/retry/%s-%s.pickle' % (prefix, cls.__name__))
+    add_writer(TextFileWriter, 'data', prefix, COLUMNS,
+               flush_interval=flush_interval, fsync=fsync)
+    add_writer(BinaryFileWriter, 'data', prefix, COLUMNS)
 
-    # Read samples, analyze
-    while True:
+    # Rollups over each window, in their own (much smaller) files
+    rollup_writers = {}
+    for name, length in WINDOWS:
+        writer = create_writer(BinaryFileWriter, 'data', '%s-%s-' % (prefix, name),
+                               stats_columns())
+        if writer is not None:
+            rollup_writers[name] = writer
+    add_writer(OnlineStats, rollup_writers, state_filename='data/%s-stats.json' % prefix)
+    add_writer(PyramidWriter, 'data/pyramid', prefix)
+    if 'INFLUXDB_HOST' in os.environ:
+        add_remote_writer(InfluxDBWriter, prefix, COLUMNS, host=os.environ['INFLUXDB_HOST'])
+    #add_remote_writer(TempoDBWriter, prefix, COLUMNS)
+    return writers
+
+
+def do_logging(invert, fit_decay=False, record_dir=None, record_max_size=2048,
+               flush_interval=None, fsync=False, writer_policy=writer_policy_for,
+               writer_queue=1000, http_host='127.0.0.1', http_port=8080,
+               timing=False, metrics_file=None, metrics_interval=60.0,
+               edge_interpolation=None, streaming=False, raw_samples=False):
+    #source = PrerecordedDataSource('../../dataq/record_20130331_0002_100s.npz')
+    tap = None
+    if record_dir is not None:
+        tap = RecordingTap(record_dir, 44100, max_bytes=record_max_size * 2**20)
+    source = SoundCardDataSource(tap=tap, raw=raw_samples)
+    cls = StreamingClockAnalyser if streaming else ClockAnalyser
+    analyser = cls(source, initial_drift=get_last_drift(), invert=invert)
+    analyser.edge_interpolation = edge_interpolation
+
+    # Outputs
+    writers = make_writers('clock', flush_interval, fsync)
+    latest = LatestSample()
+    writers.append(latest)
+
+    # Writers run on their own threads so they can't hold up the analysis
+    dispatcher = WriterDispatcher(writers, writer_queue, writer_policy,
+                                  spill_dir='data/spill', prefix='clock-')
+
+    # Stage timings
+    timers.enabled = timing or metrics_file is not None
+    if metrics_file is not None:
+        timers.start_export(metrics_file, metrics_interval)
+    def metrics():
+        return {'timers': timers.snapshot(), 'writers': dispatcher.metrics()}
+
+    server = None
+    if http_port:
+        server = QueryServer(latest, BinaryFileReader('data', 'clock', COLUMNS),
+                             Pyramid('data/pyramid', 'clock'), http_host, http_port,
+                             metrics=metrics)
         try:
-            process(analyser, writers)
-        except DataError as err:
-            logger.error("Error: %s. Trying to start again in 3 seconds...",
-                         err)
+            server.start()
+        except OSError as err:
+            logger.error("Could not serve queries on %s:%d: %s. Carrying on without",
+                         http_host, http_port, err)
+            server = None
+
+    # Read samples, analyze
+    exit_on_sigterm()
+    try:
+        while True:
+            try:
+                process(analyser, dispatcher, fit_decay)
+            except DataError as err:
+                logger.error("Error: %s. Trying to start again in 3 seconds...",
+                             err)
+                time.sleep(3)
+    finally:
+        if server is not None:
+            server.close()
+        dispatcher.close()
+        timers.stop_export()
+        if tap is not None:
+            tap.close()
+
+
+def do_multi_logging(clocks, pps_channel, channels, invert, fit_decay=False,
+                     flush_interval=None, fsync=False, writer_policy=writer_policy_for,
+                     writer_queue=1000, edge_interpolation=None, raw_samples=False,
+                     timing=False, metrics_file=None, metrics_interval=60.0):
+    """Log several clocks (a dict of tick channels by name) sharing one PPS
+    input; each clock's records go to files named after it"""
+    source = SoundCardDataSource(raw=raw_samples, channels=channels, buffer_duration=30)
+
+    dispatchers = {
+        name: WriterDispatcher(make_writers(name, flush_interval, fsync), writer_queue,
+                               writer_policy, spill_dir='data/spill', prefix=name + '-')
+        for name in clocks}
+    def write(data):
+        dispatchers[data['clock']].write(data)
+        save_last_drift(data['drift'], data['clock'])
+
+    timers.enabled = timing or metrics_file is not None
+    if metrics_file is not None:
+        timers.start_export(metrics_file, metrics_interval)
+
+    exit_on_sigterm()
+    try:
+        while True:
+            shared = SharedSource(source, pps_channel, capacity=source.buffer.capacity)
+            analysers = {}
+            for name, channel in clocks.items():
+                analyser = SharedPPSClockAnalyser(shared.clock(channel),
+                                                  initial_drift=get_last_drift(name),
+                                                  invert=invert)
+                analyser.edge_interpolation = edge_interpolation
+                analysers[name] = analyser
+            run_clocks(analysers, write, fit_decay)
+            logger.error("No audio. Trying to start again in 3 seconds...")
             time.sleep(3)
+    finally:
+        for dispatcher in dispatchers.values():
+            dispatcher.close()
+        timers.stop_export()
+
+
+def parse_clocks(s):
+    """Parse ``name:channel,...`` into a dict of channels by name"""
+    clocks = {}
+    for item in s.split(','):
+        name, channel = item.split(':')
+        clocks[name] = int(channel)
+    return clocks
 
 
 def format_soundcheck_stats(d):
@@ -79,12 +222,79 @@ def do_soundcheck(invert):
         print()
 
 
+def parse_date(s):
+    return datetime.strptime(s, '%Y-%m-%d')
+
+
 def main():
     # Set up logging
     parser = argparse.ArgumentParser(description='clocklogger')
     parser.add_argument('-L', '--log-level', default='warning')
     parser.add_argument('-S', '--soundcheck', action='store_true')
     parser.add_argument('-I', '--invert-signals', action='store_true')
+    parser.add_argument('-F', '--fit-decay', action='store_true',
+                        help='refine edge times by fitting pulse decays')
+    parser.add_argument('--edge-interpolation', choices=['linear', 'cubic'],
+                        help='refine edge times by interpolating the threshold crossings')
+    parser.add_argument('--streaming', action='store_true',
+                        help='search each sample for edges once, and output each '
+                        'swing ~3 s sooner')
+    parser.add_argument('--raw-samples', action='store_true',
+                        help='analyse the int16 frames from the sound card without '
+                        'converting them to floats')
+    parser.add_argument('--clocks', type=parse_clocks,
+                        help='log several clocks sharing the PPS input, given as '
+                        'name:channel,... (e.g. clock:0,clock2:2)')
+    parser.add_argument('--pps-channel', type=int, default=1,
+                        help='input with the PPS signal, with --clocks (default: 1)')
+    parser.add_argument('--channels', type=int, default=2,
+                        help='number of inputs to read, with --clocks (default: 2)')
+    parser.add_argument('-R', '--record-dir',
+                        help='archive the raw signal to compressed files in this directory')
+    parser.add_argument('--record-max-size', type=float, default=2048,
+                        help='size limit of the raw signal archive in MB (default: 2048)')
+    parser.add_argument('--flush-interval', type=float,
+                        help='buffer output files, flushing every this many seconds')
+    parser.add_argument('--fsync', action='store_true',
+                        help='sync output files to disk whenever they are flushed')
+    parser.add_argument('--writer-policy', choices=POLICIES,
+                        help='what to do when a writer falls behind (default: block '
+                        'for local files, drop-oldest for others)')
+    parser.add_argument('--writer-queue', type=int, default=1000,
+                        help='records queued for each writer (default: 1000)')
+    parser.add_argument('--http-host', default='127.0.0.1',
+                        help='address to serve queries on (default: 127.0.0.1)')
+    parser.add_argument('--http-port', type=int, default=8080,
+                        help='port to serve queries on, or 0 for none (default: 8080)')
+    parser.add_argument('-T', '--timing', action='store_true',
+                        help='time each stage of the analysis and each writer')
+    parser.add_argument('--metrics-file',
+                        help='write the timings to this JSON file (implies --timing)')
+    parser.add_argument('--metrics-interval', type=float, default=60.0,
+                        help='seconds between writes of the metrics file (default: 60)')
+    subparsers = parser.add_subparsers(dest='command')
+    reanalyse.add_arguments(subparsers.add_parser(
+        'reanalyse', help='reanalyse recordings with different settings'))
+    regression.add_arguments(subparsers.add_parser(
+        'regression', help='check analysis results against golden files'))
+    convert_parser = subparsers.add_parser(
+        'convert', help='convert .npz recordings to the raw format')
+    convert_parser.add_argument('recordings', nargs='+', help='.npz recordings')
+    archive_parser = subparsers.add_parser(
+        'convert-archive', help='convert daily text files to binary files')
+    archive_parser.add_argument('text_path')
+    archive_parser.add_argument('binary_path')
+    archive_parser.add_argument('-p', '--prefix', default='clock')
+    pyramid_parser = subparsers.add_parser(
+        'build-pyramid', help='add daily text files to the plotting pyramid')
+    pyramid_parser.add_argument('text_path')
+    pyramid_parser.add_argument('-o', '--output', default='data/pyramid',
+                                help='pyramid directory (default: data/pyramid)')
+    pyramid_parser.add_argument('-p', '--prefix', default='clock')
+    pyramid_parser.add_argument('--start', type=parse_date, default=datetime(2012, 1, 1),
+                                help='first day to add (YYYY-MM-DD)')
+    pyramid_parser.add_argument('--end', type=parse_date,
+                                help='add days before this one (default: tomorrow)')
     args = parser.parse_args()
 
     numeric_level = getattr(logging, args.log_level.upper(), None)
@@ -94,10 +304,40 @@ def main():
         level=numeric_level,
         format="%(asctime)s %(name)s [%(levelname)s] %(message)s")
 
-    if args.soundcheck:
+    writer_policy = args.writer_policy or writer_policy_for
+    if args.command == 'reanalyse':
+        reanalyse.run(args)
+    elif args.command == 'regression':
+        if not regression.run(args):
+            sys.exit(1)
+    elif args.command == 'convert':
+        for filename in args.recordings:
+            convert_npz(filename, os.path.splitext(filename)[0] + '.raw')
+    elif args.command == 'convert-archive':
+        convert_text_archive(args.text_path, args.binary_path, args.prefix)
+    elif args.command == 'build-pyramid':
+        end = args.end or datetime.combine(date.today() + timedelta(days=1),
+                                           datetime.min.time())
+        backfill(TextArchive(args.text_path, args.prefix), args.start, end,
+                 args.output, args.prefix)
+    elif args.soundcheck:
         do_soundcheck(args.invert_signals)
+    elif args.clocks:
+        do_multi_logging(args.clocks, args.pps_channel, args.channels,
+                         args.invert_signals, args.fit_decay,
+                         args.flush_interval, args.fsync,
+                         writer_policy, args.writer_queue,
+                         args.edge_interpolation, args.raw_samples,
+                         args.timing, args.metrics_file, args.metrics_interval)
     else:
-        do_logging(args.invert_signals)
+        do_logging(args.invert_signals, args.fit_decay,
+                   args.record_dir, args.record_max_size,
+                   args.flush_interval, args.fsync,
+                   writer_policy, args.writer_queue,
+                   args.http_host, args.http_port,
+                   args.timing, args.metrics_file, args.metrics_interval,
+                   args.edge_interpolation, args.streaming,
+                   args.raw_samples)
 
 
 if __name__ == "__main__":
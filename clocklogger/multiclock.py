@@ -0,0 +1,202 @@
+"""Analyse several clocks recorded by one multichannel sound card.
+
+One input carries the PPS signal and each of the others the ticks of one
+clock. Every clock has its own ClockAnalyser, reading a ``ClockSource``:
+a view of the shared source in which ``CHANNEL_TICK`` is the clock's own
+input. The clocks read their windows independently, so the shared
+samples are only consumed once every clock has finished with them.
+
+Each clock's windows start at different samples, so the PPS edges are
+not found window by window. Instead the shared source searches each PPS
+sample for edges once, by detectors which keep their state from one
+window to the next (see ``streaming``), and gives each clock exactly
+the edges ``find_edges`` would have found in its window.
+
+The clocks are analysed on a pool of threads, one per clock, which
+mostly wait for the sound card, and each record is tagged with the name
+of its clock.
+"""
+
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from datetime import timedelta
+
+from .analysis import ClockAnalyser, DataError
+from .streaming import EdgeDetector
+from .timing import timers
+
+logger = logging.getLogger(__name__)
+
+
+class SharedSource(object):
+    """A multichannel source shared by several clocks.
+
+    Clocks are added with ``clock``. The samples the source returns must
+    stay valid until they are consumed, as they do from the sound card
+    and from recordings (unless raw recordings are converted to floats).
+    ``capacity``, if given, is the most samples the source can buffer: a
+    clock which needs samples so far ahead of the slowest one waits for
+    it to catch up.
+    """
+
+    def __init__(self, source, pps_channel=None, capacity=None):
+        self.source = source
+        self.fs = source.fs
+        self.pps_channel = source.CHANNEL_PPS if pps_channel is None else pps_channel
+        self.capacity = capacity
+        self.offset = 0    # index of the source's first available sample
+        self.clocks = []
+        self.detectors = None
+        self.scanned = 0   # PPS samples searched for edges so far
+        self.condition = threading.Condition()
+
+    def clock(self, tick_channel):
+        """A source for the clock whose ticks are on ``tick_channel``"""
+        with self.condition:
+            clock = ClockSource(self, tick_channel, self.offset)
+            self.clocks.append(clock)
+        return clock
+
+    def get_samples(self, position, num_samples):
+        """Samples ``position`` to ``position + num_samples``, counting from
+        the first sample of the source; fewer at the end of the data"""
+        with self.condition:
+            end = position - self.offset + int(num_samples)
+            while self.capacity is not None and end > self.capacity:
+                self.condition.wait()
+                end = position - self.offset + int(num_samples)
+            samples = self.source.get_samples(end)[position - self.offset:]
+            if len(samples) == 0:
+                raise EOFError
+            return samples
+
+    def remove(self, clock):
+        """Stop waiting for ``clock``, which won't read any more"""
+        with self.condition:
+            self.clocks.remove(clock)
+            self.consume()
+
+    def consume(self):
+        """Consume the samples every clock has finished with"""
+        with self.condition:
+            if not self.clocks:
+                return
+            position = min(clock.position for clock in self.clocks)
+            if position > self.offset:
+                self.source.consume(position - self.offset)
+                self.offset = position
+                if self.detectors is not None:
+                    for detector in self.detectors:
+                        detector.discard(position)
+                self.condition.notify_all()
+
+    @property
+    def time(self):
+        """Time of the source's first available sample"""
+        return self.source.time
+
+    def pps_edges(self, analyser, start, stop):
+        """Positive and negative edges of the PPS channel (before
+        debouncing), as ``analyser`` would find them in samples ``start``
+        to ``stop``, relative to ``start``"""
+        with self.condition:
+            if stop > self.scanned:
+                with timers.time('find_pps_edges'):
+                    samples = self.source.get_samples(stop - self.offset)
+                    if self.detectors is None:
+                        level, release = analyser.edge_thresholds(samples)
+                        self.detectors = (EdgeDetector(level, release, 1),
+                                          EdgeDetector(level, release, -1))
+                    pps = samples[self.scanned - self.offset:, self.pps_channel]
+                    for detector in self.detectors:
+                        detector.scan(pps, self.scanned)
+                    self.scanned = stop
+            return [detector.window(start, stop) for detector in self.detectors]
+
+
+class ClockSource(object):
+    """One clock's view of a SharedSource, which ClockAnalyser reads like
+    any other source"""
+
+    def __init__(self, shared, tick_channel, position):
+        self.shared = shared
+        self.fs = shared.fs
+        self.CHANNEL_TICK = tick_channel
+        self.CHANNEL_PPS = shared.pps_channel
+        self.position = position  # index of the first available sample
+
+    def get_samples(self, num_samples):
+        """Return some samples, valid until the next call to ``consume``"""
+        return self.shared.get_samples(self.position, num_samples)
+
+    def consume(self, num_samples):
+        """Mark num_samples as having been used"""
+        self.position += int(num_samples)
+        self.shared.consume()
+
+    @property
+    def time(self):
+        """Time of first available sample"""
+        with self.shared.condition:
+            return self.shared.time + timedelta(
+                seconds=(self.position - self.shared.offset) / self.fs)
+
+    def close(self):
+        self.shared.remove(self)
+
+    def pps_edges(self, analyser, num_samples):
+        return self.shared.pps_edges(analyser, self.position, self.position + num_samples)
+
+
+class SharedPPSClockAnalyser(ClockAnalyser):
+    """ClockAnalyser of one clock on a SharedSource, which takes the PPS
+    edges from the shared source"""
+
+    def find_pps_edges(self, pps):
+        i_pos, i_neg = self.source.pps_edges(self, len(pps))
+        return self.debounce(i_pos), self.debounce(i_neg)
+
+
+def run_clock(name, analyser, write, fit_decay=False, pps_edge='down', stop=None):
+    """Analyse one clock until its data ends or ``stop`` (a threading.Event)
+    is set, passing ``write`` each record tagged with ``name``. Like the
+    logger, processing starts again after a DataError; other errors are
+    logged and raised."""
+    try:
+        while True:
+            try:
+                for data in analyser.process(pps_edge=pps_edge, fit_decay=fit_decay):
+                    data['clock'] = name
+                    write(data)
+                    if stop is not None and stop.is_set():
+                        return
+                return
+            except DataError as err:
+                logger.error("Error (%s): %s. Starting again...", name, err)
+    except Exception:
+        logger.exception("Error (%s)", name)
+        raise
+    finally:
+        # Don't hold up the other clocks
+        analyser.source.close()
+
+
+def run_clocks(analysers, write, fit_decay=False, pps_edge='down'):
+    """Analyse each clock in ``analysers`` (a dict of analysers by name)
+    on its own worker thread, until the data ends. If any clock fails, the
+    others are stopped and its error is raised.
+
+    There must be a thread per clock: a clock which gets ahead waits for
+    the others to catch up.
+    """
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=len(analysers),
+                            thread_name_prefix='clock') as pool:
+        futures = [pool.submit(run_clock, name, analyser, write, fit_decay, pps_edge, stop)
+                   for name, analyser in analysers.items()]
+        done, running = wait(futures, return_when=FIRST_EXCEPTION)
+        if running:
+            stop.set()
+    for future in futures:
+        future.result()
@@ -0,0 +1,24 @@
+import signal
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def exit_on_sigterm():
+    """Exit cleanly on SIGTERM (as sent by systemd), so that writers are
+    closed and buffered records are flushed"""
+    def handler(signum, frame):
+        logger.info("Received SIGTERM, exiting")
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, handler)
+
+
+def close_writers(writers):
+    for writer in writers:
+        close = getattr(writer, 'close', None)
+        if close is None:
+            continue
+        try:
+            close()
+        except Exception as e:
+            logger.error("Error closing writer [%s]: %s", writer.__class__, e)
@@ -0,0 +1,147 @@
+"""Daily binary files of fixed-width records.
+
+Each record is the time (int64 seconds since the epoch) followed by the
+other columns as float64, little-endian and unpadded, so a day's file can be
+opened directly with ``np.memmap`` using ``record_dtype(columns)``. Files
+are laid out like the text files: ``YYYY/MM/<prefix>YYYY-MM-DD.bin``.
+"""
+
+import os
+import os.path
+import glob
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+
+from .textfile import datetime_to_epoch
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ['time', 'drift', 'amplitude']
+
+
+def record_dtype(columns=None):
+    columns = columns or COLUMNS
+    return np.dtype([(k, '<i8' if k == 'time' else '<f8') for k in columns])
+
+
+def day_filename(path, prefix, day):
+    return os.path.join(path, day.strftime("%Y/%m/{}%Y-%m-%d.bin".format(prefix)))
+
+
+def open_for_append(filename, itemsize):
+    """Open ``filename`` for appending, first dropping any partial record
+    left at the end (e.g. by a crash part way through a write)"""
+    if not os.path.exists(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    f = open(filename, 'ab')
+    size = f.tell()
+    if size % itemsize:
+        logger.warning("Truncating partial record at end of %s", filename)
+        f.truncate(size - size % itemsize)
+    return f
+
+
+class BinaryFileWriter(object):
+    def __init__(self, path, prefix, columns=None):
+        self.path = path
+        self.prefix = prefix
+        self.columns = columns or COLUMNS
+        self.dtype = record_dtype(self.columns)
+        self.record = np.zeros(1, self.dtype)
+        self.file = None
+        self.date = None
+
+    def __del__(self):
+        self.close()
+
+    def write(self, data):
+        time = data['time']
+        if self.file is None or time.date() != self.date:
+            self.close()
+            fn = day_filename(self.path, self.prefix, time)
+            self.file = open_for_append(fn, self.dtype.itemsize)
+            self.date = time.date()
+            logger.info("Opened binary file %s", fn)
+        for k in self.columns:
+            self.record[k] = datetime_to_epoch(time) if k == 'time' else data[k]
+        self.file.write(self.record.tobytes())
+        self.file.flush()
+
+    def close(self):
+        if getattr(self, 'file', None) is not None:
+            self.file.close()
+            self.file = None
+
+
+class BinaryFileReader(object):
+    """Load records from daily binary files"""
+
+    def __init__(self, path, prefix, columns=None):
+        self.path = path
+        self.prefix = prefix
+        self.dtype = record_dtype(columns)
+
+    def day(self, day):
+        """Memory-mapped records for one day (empty if there are none)"""
+        fn = day_filename(self.path, self.prefix, day)
+        if not os.path.exists(fn):
+            return np.zeros(0, self.dtype)
+        num_records = os.path.getsize(fn) // self.dtype.itemsize
+        if num_records == 0:
+            return np.zeros(0, self.dtype)
+        return np.memmap(fn, dtype=self.dtype, mode='r', shape=(num_records,))
+
+    def load(self, start, end):
+        """Records with ``start <= time < end``, as a structured array.
+
+        ``start`` and ``end`` are datetimes (UTC) or dates.
+        """
+        if not isinstance(start, datetime):
+            start = datetime.combine(start, datetime.min.time())
+        if not isinstance(end, datetime):
+            end = datetime.combine(end, datetime.min.time())
+        t0, t1 = datetime_to_epoch(start), datetime_to_epoch(end)
+
+        blocks = []
+        day = start.date()
+        while day <= end.date():
+            records = self.day(day)
+            if len(records):
+                i0, i1 = np.searchsorted(records['time'], [t0, t1])
+                blocks.append(records[i0:i1])
+            day += timedelta(days=1)
+        if not blocks:
+            return np.zeros(0, self.dtype)
+        return np.concatenate(blocks)
+
+
+def convert_text_archive(text_path, binary_path, prefix='clock', columns=None):
+    """Convert all the text files under ``text_path`` to binary files under
+    ``binary_path``. Returns the number of records converted."""
+    dtype = record_dtype(columns)
+    pattern = '{}[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9].txt'.format(prefix)
+    filenames = sorted(glob.glob(os.path.join(text_path, pattern)) +
+                       glob.glob(os.path.join(text_path, '*', '*', pattern)))
+    started = set()
+    total = 0
+    for filename in filenames:
+        logger.info("Converting %s", filename)
+        rows = np.loadtxt(filename, ndmin=2).reshape((-1, len(dtype.names)))
+        records = np.zeros(len(rows), dtype)
+        for j, k in enumerate(dtype.names):
+            records[k] = rows[:, j]
+        # Split by the date of each record, in case files overlap midnight
+        days = records['time'] // 86400
+        for d in np.unique(days):
+            fn = day_filename(binary_path, prefix,
+                              datetime(1970, 1, 1) + timedelta(days=int(d)))
+            if fn not in started:
+                if not os.path.exists(os.path.dirname(fn)):
+                    os.makedirs(os.path.dirname(fn))
+                open(fn, 'wb').close()
+                started.add(fn)
+            with open(fn, 'ab') as f:
+                records[days == d].tofile(f)
+        total += len(records)
+    return total
@@ -0,0 +1,275 @@
+"""Hand records to writers without holding up the caller.
+
+Each writer gets a bounded queue and a worker thread, so a slow writer
+(e.g. an HTTP request to a database) only delays itself. When a queue is
+full, the overflow policy decides what happens:
+
+``drop-oldest``
+    discard the oldest queued record to make room
+``block``
+    wait for room (the caller is held up, but nothing is lost)
+``spill``
+    append records to a file on disk until the writer catches up; records
+    still on disk when the process stops are written next time it starts
+
+``writer_policy_for`` gives the default policy of each writer: local files
+block, since records dropped from them can't be written later, and other
+writers (such as those to network databases) drop the oldest record.
+
+On closing, a writer which doesn't catch up within a time limit (e.g. one
+stuck on a request which never finishes) is given up on, so that it can't
+stop the process from exiting.
+"""
+
+import os
+import os.path
+import time
+import queue
+import pickle
+import threading
+import logging
+from . import close_writers
+from .textfile import TextFileWriter
+from .binary import BinaryFileWriter
+from ..stats import OnlineStats
+from ..pyramid import PyramidWriter
+from ..timing import timers
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = 'drop-oldest'
+BLOCK = 'block'
+SPILL = 'spill'
+POLICIES = (DROP_OLDEST, BLOCK, SPILL)
+
+# Records dropped from these can't be written later, so a slow disk holds
+# up the caller rather than losing them
+FILE_WRITERS = (TextFileWriter, BinaryFileWriter, OnlineStats, PyramidWriter)
+
+CLOSE_TIMEOUT = 10.0
+
+_STOP = object()
+
+
+def writer_policy_for(writer):
+    """Default overflow policy: block for local files, drop the oldest
+    record for anything else"""
+    return BLOCK if isinstance(writer, FILE_WRITERS) else DROP_OLDEST
+
+
+class WriterWorker(object):
+    """Feed records to one writer from a bounded queue on a worker thread"""
+
+    def __init__(self, writer, name=None, max_queue=1000, policy=DROP_OLDEST,
+                 spill_dir=None):
+        if policy not in POLICIES:
+            raise ValueError("Unknown overflow policy: %s" % policy)
+        if policy == SPILL and spill_dir is None:
+            raise ValueError("spill_dir is needed for the spill policy")
+        self.writer = writer
+        self.name = name or writer.__class__.__name__
+        self.policy = policy
+        self.queue = queue.Queue(max_queue)
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+        # Metrics
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.spilled = 0
+        self.max_depth = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_last = None
+
+        # Records waiting on disk, oldest first
+        self.spill_filename = None
+        self.spill_backlog = 0
+        if policy == SPILL:
+            if not os.path.exists(spill_dir):
+                os.makedirs(spill_dir)
+            self.spill_filename = os.path.join(spill_dir, self.name + '.spill')
+            self.spill_backlog = len(self._read_spill_file())
+            if self.spill_backlog:
+                logger.info("%d records left on disk for %s",
+                            self.spill_backlog, self.name)
+
+        self.thread = threading.Thread(target=self._run, name='Writer-' + self.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def depth(self):
+        """Number of records waiting, in memory and on disk"""
+        return self.queue.qsize() + self.spill_backlog
+
+    def metrics(self):
+        written = self.written
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'written': written,
+            'dropped': self.dropped,
+            'spilled': self.spilled,
+            'errors': self.errors,
+            'latency_mean': self.latency_total / written if written else None,
+            'latency_max': self.latency_max,
+            'latency_last': self.latency_last,
+        }
+
+    def put(self, data):
+        item = (time.time(), data)
+        with self.lock:
+            # Once records are going to disk, later ones follow them there
+            # so they are written in order
+            if self.spill_backlog == 0:
+                try:
+                    self.queue.put_nowait(item)
+                except queue.Full:
+                    pass
+                else:
+                    self.max_depth = max(self.max_depth, self.depth)
+                    return
+            if self.policy == SPILL:
+                with open(self.spill_filename, 'ab') as f:
+                    pickle.dump(item, f)
+                self.spill_backlog += 1
+                self.spilled += 1
+                self.max_depth = max(self.max_depth, self.depth)
+                return
+            if self.policy == DROP_OLDEST:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+                self.queue.put_nowait(item)
+                return
+        # Block outside the lock, so the worker can carry on
+        self.queue.put(item)
+
+    def stop(self):
+        """Ask the worker to stop once everything queued is written"""
+        self.stopping.set()
+        try:
+            self.queue.put_nowait((None, _STOP))
+        except queue.Full:
+            pass  # the worker isn't waiting for records
+
+    def close(self, timeout=None):
+        """Write out everything queued and stop the worker. Returns False if
+        the worker is still busy after ``timeout`` seconds."""
+        self.stop()
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            logger.error("Gave up waiting for %s: %d records not written",
+                         self.name, self.depth)
+            return False
+        return True
+
+    def _read_spill_file(self):
+        items = []
+        if not os.path.exists(self.spill_filename):
+            return items
+        with open(self.spill_filename, 'rb') as f:
+            while True:
+                try:
+                    items.append(pickle.load(f))
+                except EOFError:
+                    break
+                except Exception as err:
+                    logger.error("Error reading %s: %s", self.spill_filename, err)
+                    break
+        return items
+
+    def _unspill(self):
+        with self.lock:
+            items = self._read_spill_file()
+            if os.path.exists(self.spill_filename):
+                os.remove(self.spill_filename)
+            self.spill_backlog = 0
+        return items
+
+    def _write(self, item):
+        queued_at, data = item
+        try:
+            with timers.time('write.' + self.name):
+                self.writer.write(data)
+        except Exception as e:
+            self.errors += 1
+            logger.error("Writer error [%s]: %s", self.writer.__class__, e)
+            return
+        latency = time.time() - queued_at
+        self.written += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.latency_last = latency
+
+    def _idle(self):
+        """Give writers which buffer records a chance to flush them"""
+        flush_if_due = getattr(self.writer, 'flush_if_due', None)
+        if flush_if_due is None:
+            return
+        try:
+            flush_if_due()
+        except Exception as e:
+            self.errors += 1
+            logger.error("Writer error [%s]: %s", self.writer.__class__, e)
+
+    def _run(self):
+        while True:
+            if self.spill_backlog and self.queue.empty():
+                for item in self._unspill():
+                    self._write(item)
+                continue
+            if self.stopping.is_set() and self.queue.empty():
+                break
+            try:
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                self._idle()
+                continue
+            if item[1] is not _STOP:  # which only wakes the worker
+                self._write(item)
+
+
+class WriterDispatcher(object):
+    """Send each record to several writers, each with its own WriterWorker.
+
+    Has the same ``write`` and ``close`` methods as a writer. Workers are
+    named after their writer's class, after ``prefix``; the name is also
+    used for the spill file. ``policy`` is the overflow policy, or a
+    function giving the policy for each writer.
+    """
+
+    def __init__(self, writers, max_queue=1000, policy=DROP_OLDEST, spill_dir=None,
+                 prefix='', close_timeout=CLOSE_TIMEOUT):
+        self.close_timeout = close_timeout
+        self.workers = []
+        names = set()
+        for writer in writers:
+            name = prefix + writer.__class__.__name__
+            while name in names:
+                name += '_'
+            names.add(name)
+            self.workers.append(WriterWorker(
+                writer, name, max_queue, policy(writer) if callable(policy) else policy,
+                spill_dir))
+
+    def write(self, data):
+        for worker in self.workers:
+            worker.put(data)
+
+    def close(self):
+        """Close the workers, waiting at most ``close_timeout`` seconds in
+        all, then the writers whose workers have finished"""
+        for worker in self.workers:
+            worker.stop()
+        deadline = time.monotonic() + self.close_timeout
+        finished = [worker.writer for worker in self.workers
+                    if worker.close(max(0, deadline - time.monotonic()))]
+        close_writers(finished)
+
+    def metrics(self):
+        return {worker.name: worker.metrics() for worker in self.workers}
@@ -1,36 +1,210 @@
-from datetime import datetime
+"""Write to InfluxDB over HTTP using the line protocol.
+
+The schema is the same as before the line protocol was used: every point
+goes in the ``clock`` measurement (whatever is being logged), with one
+field per column named ``<base_key>.<column>``, e.g. ``clock.drift`` or
+``weather.pressure``.
+
+Points are collected into batches, which are sent when they reach
+``batch_size`` points or span ``max_age`` seconds (by the points' own
+timestamps), over one persistent HTTP connection. If a batch can't be
+sent, it is appended to the ``journal`` file instead, and later batches
+are queued behind it there; the journal is replayed, oldest first, each
+time a batch is due.
+
+Behind a RetryingWriter, ``write_batch`` is used instead, which sends the
+records it is given straight away and leaves batching and retrying to the
+RetryingWriter.
+"""
+
+import os
+import os.path
+import math
+import base64
 import logging
+import http.client
+from urllib.parse import urlencode
+
+from .textfile import datetime_to_epoch
 
 logger = logging.getLogger(__name__)
 
-try:
-    from .influxdb import client as influxdb
-except ImportError:
-    influxdb = None
+MEASUREMENT = 'clock'
 
 
-def datetime_to_epoch(d):
-    return int((d - datetime(1970, 1, 1)).total_seconds())
+def escape_key(key):
+    return (str(key).replace('\\', '\\\\').replace(',', '\\,')
+            .replace('=', '\\=').replace(' ', '\\ '))
+
+
+def encode_point(measurement, data, columns, key_prefix=''):
+    """Encode one point in the line protocol (None if it has no values),
+    with the field names prefixed by ``key_prefix``"""
+    fields = []
+    for k in columns:
+        if k == 'time':
+            continue
+        value = float(data[k])
+        if math.isnan(value) or math.isinf(value):
+            continue
+        fields.append('%s=%r' % (escape_key(key_prefix + k), value))
+    if not fields:
+        return None
+    return '%s %s %d' % (escape_key(measurement), ','.join(fields),
+                         datetime_to_epoch(data['time']))
+
+
+class InfluxDBError(Exception):
+    def __init__(self, status, message):
+        super(InfluxDBError, self).__init__("InfluxDB error [%d] %s" % (status, message))
+        self.status = status
 
 
 class InfluxDBWriter(object):
-    def __init__(self, base_key, columns):
-        if influxdb is None:
-            raise ImportError("Could not import influxdb package")
+    def __init__(self, base_key, columns, host='localhost', port=8086,
+                 database='clock', username=None, password=None,
+                 batch_size=100, max_age=60.0, journal=None, timeout=10.0,
+                 max_request_lines=5000, measurement=MEASUREMENT):
         self.base_key = base_key
+        self.measurement = measurement
         self.columns = columns
-        self.db = influxdb.InfluxDBClient('localhost', 8086,
-                                          'clocklogger', 'pendulum', 'clock')
-        logger.info("Opened connection to InfluxDB")
+        self.host = host
+        self.port = port
+        self.database = database
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.journal = journal
+        self.timeout = timeout
+        self.max_request_lines = max_request_lines
+
+        if username is None:
+            username = os.environ.get('INFLUXDB_USERNAME')
+        if password is None:
+            password = os.environ.get('INFLUXDB_PASSWORD')
+        self.headers = {'Content-Type': 'text/plain; charset=utf-8'}
+        if username is not None:
+            credentials = '%s:%s' % (username, password or '')
+            self.headers['Authorization'] = 'Basic ' + base64.b64encode(
+                credentials.encode('utf-8')).decode('ascii')
+        self.path = '/write?' + urlencode({'db': database, 'precision': 's'})
+
+        self.connection = None
+        self.lines = []
+        self.batch_start = None
+        self.points_sent = 0
+        self.requests_sent = 0
+
+    def _encode(self, data):
+        return encode_point(self.measurement, data, self.columns, self.base_key + '.')
 
     def write(self, data):
-        data = dict(data)
-        data['time'] = datetime_to_epoch(data['time'])
-        points = [
-            {
-                "name":    "clock",
-                "columns": ["%s.%s" % (self.base_key, k) for k in self.columns],
-                "points":  [[data[k] for k in self.columns]],
-            }
-        ]
-        self.db.write_points_with_precision(points, 's')
+        line = self._encode(data)
+        if line is None:
+            return
+        if self.batch_start is None:
+            self.batch_start = data['time']
+        self.lines.append(line)
+        if (len(self.lines) >= self.batch_size or
+                (data['time'] - self.batch_start).total_seconds() >= self.max_age):
+            self.flush()
+
+    def write_batch(self, records):
+        """Send several records in one request, raising an error if they
+        can't be sent (unless they are rejected, when sending them again
+        won't help)"""
+        lines = [line for line in map(self._encode, records) if line is not None]
+        if not lines:
+            return
+        try:
+            self._send(lines)
+        except InfluxDBError as err:
+            if err.status != 400:
+                raise
+            logger.error("InfluxDB rejected %d points: %s", len(lines), err)
+
+    def flush(self):
+        """Send the current batch, and anything in the journal"""
+        lines, self.lines, self.batch_start = self.lines, [], None
+        if self.journal is None:
+            if lines:
+                self._send(lines)
+            return
+
+        if os.path.exists(self.journal):
+            # Keep the batches in order behind what couldn't be sent before
+            self._append_to_journal(lines)
+            self._replay_journal()
+        elif lines:
+            try:
+                self._send(lines)
+            except (OSError, http.client.HTTPException, InfluxDBError) as err:
+                if isinstance(err, InfluxDBError) and err.status == 400:
+                    raise  # the points were rejected; sending again won't help
+                logger.warning("Could not send %d points to InfluxDB (%s); "
+                               "saving them in %s", len(lines), err, self.journal)
+                self._append_to_journal(lines)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def _append_to_journal(self, lines):
+        if not lines:
+            return
+        directory = os.path.dirname(self.journal)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.journal, 'at') as f:
+            f.write(''.join(line + '\n' for line in lines))
+
+    def _replay_journal(self):
+        with open(self.journal, 'rt') as f:
+            lines = [line.rstrip('\n') for line in f if line.strip()]
+        sent = 0
+        try:
+            while sent < len(lines):
+                chunk = lines[sent:sent + self.max_request_lines]
+                try:
+                    self._send(chunk)
+                except InfluxDBError as err:
+                    if err.status != 400:
+                        raise
+                    logger.error("InfluxDB rejected %d journalled points: %s",
+                                 len(chunk), err)
+                sent += len(chunk)
+        except (OSError, http.client.HTTPException, InfluxDBError) as err:
+            logger.warning("Could not replay InfluxDB journal (%s); %d points "
+                           "still waiting", err, len(lines) - sent)
+            if sent:
+                # Rewrite the journal with what is left
+                tmp = self.journal + '.tmp'
+                with open(tmp, 'wt') as f:
+                    f.write(''.join(line + '\n' for line in lines[sent:]))
+                os.replace(tmp, self.journal)
+            return
+        logger.info("Replayed %d points from %s", sent, self.journal)
+        os.remove(self.journal)
+
+    def _send(self, lines):
+        body = ('\n'.join(lines) + '\n').encode('utf-8')
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port,
+                                                         timeout=self.timeout)
+        try:
+            self.connection.request('POST', self.path, body, self.headers)
+            response = self.connection.getresponse()
+            message = response.read()
+        except (OSError, http.client.HTTPException):
+            # Start afresh with a new connection next time
+            self.connection.close()
+            self.connection = None
+            raise
+        self.requests_sent += 1
+        if response.status // 100 != 2:
+            raise InfluxDBError(response.status,
+                                message.decode('utf-8', 'replace').strip())
+        self.points_sent += len(lines)
@@ -0,0 +1,197 @@
+"""Batching and retrying for writers which send records to remote services.
+
+RetryingWriter keeps records in a backlog and passes them on to the
+wrapped writer in batches (using its ``write_batch`` method if it has one).
+If a batch fails, what wasn't delivered of it (all of it, with
+``write_batch``) stays at the front of the backlog and is tried again
+after a delay which doubles with each failure, up to ``max_delay``. The
+backlog in memory is limited to ``max_backlog`` records; beyond that, the
+oldest records are moved to the ``overflow`` file (or dropped, if there
+isn't one) and sent from there first once the service is back.
+"""
+
+import os
+import os.path
+import time
+import pickle
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class RetryingWriter(object):
+    def __init__(self, writer, batch_size=20, max_age=60.0, max_backlog=10000,
+                 overflow=None, initial_delay=1.0, max_delay=600.0, clock=time.time):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.max_backlog = max_backlog
+        self.overflow = overflow
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.clock = clock
+
+        # Each record is kept with the time it was received
+        self.backlog = deque()
+        self.overflowed = 0
+        if overflow is not None and os.path.exists(overflow):
+            self.overflowed = len(self._read_overflow())
+
+        self.delay = initial_delay
+        self.next_attempt = 0
+        self.retrying = False
+
+        # Metrics
+        self.delivered = 0
+        self.dropped = 0
+        self.failures = 0
+        self.lag_last = None
+        self.lag_max = 0.0
+
+    @property
+    def pending(self):
+        """Number of records not yet delivered"""
+        return len(self.backlog) + self.overflowed
+
+    def metrics(self):
+        return {
+            'pending': self.pending,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'failures': self.failures,
+            'retry_delay': self.delay if self.retrying else 0.0,
+            'lag_last': self.lag_last,
+            'lag_max': self.lag_max,
+        }
+
+    def write(self, data):
+        self.backlog.append((self.clock(), data))
+        if len(self.backlog) > self.max_backlog:
+            self._make_room()
+        self.send()
+
+    def send(self, force=False):
+        """Send whatever is due. Returns False if an attempt failed."""
+        if not force and not self._due():
+            return True
+        if self.overflowed and not self._send_overflow():
+            return False
+        while self.backlog and (force or self.retrying or self._batch_ready()):
+            batch = [self.backlog[i] for i in range(min(self.batch_size, len(self.backlog)))]
+            sent = self._send_batch(batch)
+            for i in range(sent):
+                self.backlog.popleft()
+            if sent < len(batch):
+                return False
+        return True
+
+    def close(self):
+        """Try once more to send everything; keep what can't be sent in the
+        overflow file, if there is one"""
+        if self.send(force=True):
+            logger.debug("All records delivered")
+        elif self.overflow is not None:
+            self._spill(len(self.backlog))
+        elif self.backlog:
+            logger.error("%d records could not be delivered", len(self.backlog))
+        close = getattr(self.writer, 'close', None)
+        if close is not None:
+            close()
+
+    def _due(self):
+        if self.clock() < self.next_attempt:
+            return False
+        return self.retrying or self.overflowed > 0 or self._batch_ready()
+
+    def _batch_ready(self):
+        if len(self.backlog) >= self.batch_size:
+            return True
+        if not self.backlog:
+            return False
+        age = self.backlog[-1][1]['time'] - self.backlog[0][1]['time']
+        return age.total_seconds() >= self.max_age
+
+    def _send_batch(self, batch):
+        """Returns how many records of the batch were delivered, counting
+        from the start"""
+        records = [data for received, data in batch]
+        sent = 0
+        try:
+            write_batch = getattr(self.writer, 'write_batch', None)
+            if write_batch is not None:
+                write_batch(records)
+                sent = len(records)
+            else:
+                for data in records:
+                    self.writer.write(data)
+                    sent += 1
+        except Exception as e:
+            self.failures += 1
+            self.retrying = True
+            self.next_attempt = self.clock() + self.delay
+            logger.warning("Writer error [%s]: %s; %d records pending, retrying in %.0f s",
+                           self.writer.__class__, e, self.pending - sent, self.delay)
+            self.delay = min(2 * self.delay, self.max_delay)
+        if sent:
+            self.delivered += sent
+            self.lag_last = self.clock() - batch[0][0]
+            self.lag_max = max(self.lag_max, self.lag_last)
+        if sent == len(batch):
+            self.retrying = False
+            self.delay = self.initial_delay
+        return sent
+
+    def _make_room(self):
+        excess = len(self.backlog) - self.max_backlog
+        if self.overflow is not None:
+            self._spill(excess)
+        else:
+            for i in range(excess):
+                self.backlog.popleft()
+            self.dropped += excess
+            logger.warning("Backlog full: dropped %d records", excess)
+
+    def _spill(self, n):
+        """Move the oldest ``n`` records from memory to the overflow file"""
+        if n <= 0:
+            return
+        directory = os.path.dirname(self.overflow)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.overflow, 'ab') as f:
+            for i in range(n):
+                pickle.dump(self.backlog.popleft(), f)
+        self.overflowed += n
+
+    def _read_overflow(self):
+        items = []
+        with open(self.overflow, 'rb') as f:
+            while True:
+                try:
+                    items.append(pickle.load(f))
+                except EOFError:
+                    break
+        return items
+
+    def _send_overflow(self):
+        items = self._read_overflow()
+        sent = 0
+        ok = True
+        while sent < len(items):
+            batch = items[sent:sent + self.batch_size]
+            n = self._send_batch(batch)
+            sent += n
+            if n < len(batch):
+                ok = False
+                break
+        if ok:
+            os.remove(self.overflow)
+        elif sent:
+            tmp = self.overflow + '.tmp'
+            with open(tmp, 'wb') as f:
+                for item in items[sent:]:
+                    pickle.dump(item, f)
+            os.replace(tmp, self.overflow)
+        self.overflowed = len(items) - sent
+        return ok
@@ -25,10 +25,14 @@ class TempoDBWriter(object):
         self.client = Client(self.DATABASE_ID, api_key, api_sec)
 
     def write(self, data):
-        t = data['time']
-        logger.debug("Data: %s", data)
-        points = [DataPoint.from_data(t, float(data[k]),
+        self.write_batch([data])
+
+    def write_batch(self, records):
+        """Write several records in one request"""
+        logger.debug("Data: %s", records)
+        points = [DataPoint.from_data(data['time'], float(data[k]),
                                       key='%s.%s' % (self.base_key, k))
+                  for data in records
                   for k in self.columns if k != 'time']
         resp = self.client.write_multi(points)
         if resp.status != 200:
@@ -1,47 +1,103 @@
 import os
 import os.path
+from time import monotonic
 from datetime import datetime
 import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
 
+FORMATS = {
+    np.float64: '%.6f',
+    float: '%.6f',
+}
+
 
 def datetime_to_epoch(d):
     return int((d - datetime(1970, 1, 1)).total_seconds())
 
 
 class TextFileWriter(object):
-    def __init__(self, path, prefix, columns=None):
+    """Write records to daily text files.
+
+    By default every record is flushed to the file as it is written. If
+    ``flush_interval`` (seconds) or ``flush_records`` is given, records are
+    buffered until the oldest has waited that long or that many have been
+    written, or the file changes. While no records arrive, call
+    ``flush_if_due`` now and then (WriterWorker does) so buffered records
+    don't wait longer than ``flush_interval``. With ``fsync``, each flush is
+    also synced to disk. Call ``close`` (or ``flush``) before exiting so no
+    records are lost.
+    """
+
+    def __init__(self, path, prefix, columns=None, flush_interval=None,
+                 flush_records=None, fsync=False):
         self.path = path
         self.columns = columns
         self.pattern = "%Y/%m/{}%Y-%m-%d.txt".format(prefix)
         self.file = None
+        self.date = None
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.fsync = fsync
+        self.buffered = flush_interval is not None or flush_records is not None
+        self.lines = []
+        self.buffered_since = None  # monotonic time of the oldest buffered record
 
     def __del__(self):
-        if self.file is not None:
-            self.file.close()
+        self.close()
+
+    def _open(self, time):
+        self.close()
+        fn = os.path.join(self.path, time.strftime(self.pattern))
+        if not os.path.exists(os.path.dirname(fn)):
+            os.makedirs(os.path.dirname(fn))
+        file_already_existed = os.path.exists(fn)
+        self.file = open(fn, 'at')
+        self.date = time.date()
+        logger.info("Opened %s file %s",
+                    "existing" if file_already_existed else "new",
+                    fn)
 
     def write(self, data):
         cols = self.columns or sorted(data)
-        formats = {
-            np.float64: '%.6f',
-            float: '%.6f',
-        }
         time = data['time']
-        #data['time'] = data['time'].isoformat()
+        # The filename only depends on the date
+        if self.file is None or time.date() != self.date:
+            self._open(time)
         data = dict(data)
         data['time'] = datetime_to_epoch(time)
-        fn = os.path.join(self.path, time.strftime(self.pattern))
-        if self.file is None or self.file.name != fn:
-            if self.file is not None: self.file.close()
-            if not os.path.exists(os.path.dirname(fn)):
-                os.makedirs(os.path.dirname(fn))
-            file_already_existed = os.path.exists(fn)
-            self.file = open(fn, 'at')
-            logger.info("Opened %s file %s",
-                        "existing" if file_already_existed else "new",
-                        fn)
-        self.file.write(" ".join(formats.get(type(data[k]), "%s") %
-                                  data[k] for k in cols) + "\n")
+        if not self.lines:
+            self.buffered_since = monotonic()
+        self.lines.append(" ".join(FORMATS.get(type(data[k]), "%s") %
+                                   data[k] for k in cols) + "\n")
+        if not self.buffered or self._flush_due():
+            self.flush()
+
+    def _flush_due(self):
+        if self.flush_records is not None and len(self.lines) >= self.flush_records:
+            return True
+        return (self.flush_interval is not None and
+                monotonic() - self.buffered_since >= self.flush_interval)
+
+    def flush_if_due(self):
+        """Write out buffered records which have waited ``flush_interval``"""
+        if self.lines and self._flush_due():
+            self.flush()
+
+    def flush(self):
+        """Write out buffered records"""
+        if self.file is None:
+            return
+        if self.lines:
+            self.file.write("".join(self.lines))
+            self.lines = []
         self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if getattr(self, 'file', None) is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
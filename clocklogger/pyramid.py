@@ -0,0 +1,321 @@
+"""Multi-resolution summaries of the drift and amplitude, for plotting.
+
+The pyramid has one file per level (by default 1 min, 15 min, 1 h and 1
+day), ``<path>/<prefix>-<interval>s.bin``, of fixed-width records: the
+start of the interval (int64 seconds since the epoch), the number of
+samples, and the min, mean and max of each field. The first level is
+built from the records as they arrive, and each coarser level from the
+finished intervals of the level below.
+
+The intervals in progress are written (with what there is of them passed
+on to the coarser levels) when the writer is flushed or closed, and at
+least every ``flush_interval`` seconds, so the coarser levels are never far
+behind. The last record of each level is picked up again by the next
+writer, which carries on with it and overwrites it, so restarting the
+logger doesn't leave gaps or duplicate intervals.
+
+The time of the last record added is kept in ``<path>/<prefix>-state.json``,
+saved along with the first level. Records up to that time are skipped, so
+backfilling or replaying records which are already in the pyramid doesn't
+count them twice.
+
+Pyramid.query picks the coarsest level which still gives the number of
+points asked for, so a plot of any time span reads at most a few thousand
+records.
+"""
+
+import os
+import os.path
+import json
+import time
+import logging
+import numpy as np
+
+from .output.binary import open_for_append
+from .output.textfile import datetime_to_epoch
+
+logger = logging.getLogger(__name__)
+
+LEVELS = [60, 900, 3600, 86400]
+FIELDS = ['drift', 'amplitude']
+FLUSH_INTERVAL = 60.0  # seconds
+
+
+def pyramid_dtype(fields=None):
+    columns = [('time', '<i8'), ('count', '<i8')]
+    for k in fields or FIELDS:
+        columns += [(k + '_min', '<f8'), (k + '_mean', '<f8'), (k + '_max', '<f8')]
+    return np.dtype(columns)
+
+
+def level_filename(path, prefix, interval):
+    return os.path.join(path, '{}-{}s.bin'.format(prefix, interval))
+
+
+def state_filename(path, prefix):
+    return os.path.join(path, '{}-state.json'.format(prefix))
+
+
+class Level(object):
+    """One level of the pyramid being written: its file and the interval in
+    progress"""
+
+    def __init__(self, filename, interval, fields, dtype):
+        self.filename = filename
+        self.interval = interval
+        self.fields = fields
+        self.file = open_for_append(filename, dtype.itemsize)
+        self.record = np.zeros(1, dtype)
+        self.start = None
+        self.count = 0
+        self.sums = [0.0] * len(fields)
+        self.mins = [0.0] * len(fields)
+        self.maxs = [0.0] * len(fields)
+        # How much of the interval has been passed on to the next level
+        self.passed_count = 0
+        self.passed_sums = [0.0] * len(fields)
+        # Whether the interval is already the last record in the file
+        self.on_disk = False
+        self._resume()
+
+    def _resume(self):
+        size = self.file.tell()
+        itemsize = self.record.dtype.itemsize
+        if size < itemsize:
+            return
+        with open(self.filename, 'rb') as f:
+            f.seek(size - itemsize)
+            record = np.frombuffer(f.read(itemsize), self.record.dtype)[0]
+        self.start = int(record['time'])
+        self.count = int(record['count'])
+        self.sums = [float(record[k + '_mean']) * self.count for k in self.fields]
+        self.mins = [float(record[k + '_min']) for k in self.fields]
+        self.maxs = [float(record[k + '_max']) for k in self.fields]
+        # Whatever was written has been passed on already
+        self.passed_count = self.count
+        self.passed_sums = list(self.sums)
+        self.on_disk = True
+
+    def add(self, start, count, sums, mins, maxs):
+        """Merge in ``count`` samples from ``start``. Returns False if they
+        belong in a later interval (so this one must be finished first)."""
+        if self.start is None:
+            self.start = start
+            self.count = count
+            self.sums = [float(x) for x in sums]
+            self.mins = [float(x) for x in mins]
+            self.maxs = [float(x) for x in maxs]
+            self.passed_count = 0
+            self.passed_sums = [0.0] * len(self.fields)
+            return True
+        if start != self.start:
+            return False
+        self.count += count
+        for j in range(len(self.fields)):
+            self.sums[j] += sums[j]
+            if mins[j] < self.mins[j]:
+                self.mins[j] = float(mins[j])
+            if maxs[j] > self.maxs[j]:
+                self.maxs[j] = float(maxs[j])
+        return True
+
+    def save(self):
+        """Write the interval in progress, replacing what was written for it
+        before"""
+        if self.start is None:
+            return
+        record = self.record
+        record['time'] = self.start
+        record['count'] = self.count
+        for j, k in enumerate(self.fields):
+            record[k + '_min'] = self.mins[j]
+            record[k + '_mean'] = self.sums[j] / self.count
+            record[k + '_max'] = self.maxs[j]
+        if self.on_disk:
+            self.file.seek(0, os.SEEK_END)
+            self.file.truncate(self.file.tell() - record.dtype.itemsize)
+        self.file.write(record.tobytes())
+        self.file.flush()
+        self.on_disk = True
+
+    def pass_on(self):
+        """What the next level hasn't had yet of this interval, as arguments
+        for ``add`` (the min and max can safely be merged twice)"""
+        count = self.count - self.passed_count
+        sums = [s - p for s, p in zip(self.sums, self.passed_sums)]
+        self.passed_count = self.count
+        self.passed_sums = list(self.sums)
+        return (self.start, count, sums, list(self.mins), list(self.maxs))
+
+    def finish(self):
+        """Write the interval and start afresh"""
+        self.save()
+        self.start = None
+        self.on_disk = False
+
+    def close(self):
+        self.save()
+        self.file.close()
+
+
+class PyramidWriter(object):
+    """Writer which keeps the pyramid up to date"""
+
+    def __init__(self, path, prefix='clock', levels=None, fields=None,
+                 flush_interval=FLUSH_INTERVAL):
+        self.fields = fields or FIELDS
+        self.dtype = pyramid_dtype(self.fields)
+        self.levels = [Level(level_filename(path, prefix, interval), interval,
+                             self.fields, self.dtype)
+                       for interval in levels or LEVELS]
+        self.state_filename = state_filename(path, prefix)
+        self.last_time = None  # time of the last record added
+        self._load_state()
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+
+    def _load_state(self):
+        first = self.levels[0]
+        if first.start is None:
+            return
+        try:
+            with open(self.state_filename, 'rt') as f:
+                self.last_time = json.load(f)['last_time']
+        except (OSError, ValueError, KeyError) as err:
+            # Take the whole interval on disk as done
+            logger.warning("Could not read %s: %s", self.state_filename, err)
+            self.last_time = first.start + first.interval - 1
+
+    def _save_state(self):
+        try:
+            with open(self.state_filename, 'wt') as f:
+                json.dump({'last_time': self.last_time}, f)
+        except OSError as err:
+            logger.error("Could not save %s: %s", self.state_filename, err)
+
+    def write(self, data):
+        t = datetime_to_epoch(data['time'])
+        if self.last_time is not None and t <= self.last_time:
+            logger.warning("Skipping record at %d, already in the pyramid", t)
+            return
+        values = [float(data[k]) for k in self.fields]
+        self._add(0, t, 1, values, values, values)
+        self.last_time = t
+        self._flush_if_due()
+
+    def write_records(self, records):
+        """Add a structured array of records in time order (from an archive,
+        say) in one go. Records already in the pyramid are skipped."""
+        interval = self.levels[0].interval
+        times = records['time'].astype(np.int64)
+        if self.last_time is not None:
+            keep = times > self.last_time
+            if not keep.all():
+                logger.info("Skipping %d records already in the pyramid",
+                            len(times) - np.count_nonzero(keep))
+                records, times = records[keep], times[keep]
+        if len(records) == 0:
+            return
+        starts = times - times % interval
+        first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+        counts = np.diff(np.r_[first, len(records)])
+        values = [records[k].astype(np.float64) for k in self.fields]
+        sums = np.array([np.add.reduceat(v, first) for v in values]).T.tolist()
+        mins = np.array([np.minimum.reduceat(v, first) for v in values]).T.tolist()
+        maxs = np.array([np.maximum.reduceat(v, first) for v in values]).T.tolist()
+        lasts = times[np.r_[first[1:], len(times)] - 1].tolist()
+        for i, start in enumerate(starts[first].tolist()):
+            self._add(0, start, int(counts[i]), sums[i], mins[i], maxs[i])
+            self.last_time = lasts[i]
+        self._flush_if_due()
+
+    def _add(self, i, t, count, sums, mins, maxs):
+        level = self.levels[i]
+        start = t - t % level.interval
+        if level.start is not None and start < level.start:
+            logger.warning("Ignoring samples at %d, before the %d s interval at %d",
+                           t, level.interval, level.start)
+            return
+        if not level.add(start, count, sums, mins, maxs):
+            self._pass_on(i)
+            level.finish()
+            if i == 0:
+                self._save_state()
+            level.add(start, count, sums, mins, maxs)
+
+    def _pass_on(self, i):
+        summary = self.levels[i].pass_on()
+        if i + 1 < len(self.levels) and summary[1] > 0:
+            self._add(i + 1, *summary)
+
+    def _flush_if_due(self):
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write the intervals in progress at every level"""
+        for i, level in enumerate(self.levels):
+            if level.start is not None:
+                self._pass_on(i)
+                level.save()
+        if self.last_time is not None:
+            self._save_state()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        for level in self.levels:
+            level.close()
+
+
+class Pyramid(object):
+    """Read the pyramid"""
+
+    def __init__(self, path, prefix='clock', levels=None, fields=None):
+        self.path = path
+        self.prefix = prefix
+        self.levels = sorted(levels or LEVELS)
+        self.dtype = pyramid_dtype(fields)
+
+    def level(self, interval):
+        """Memory-mapped records of one level (empty if there are none)"""
+        fn = level_filename(self.path, self.prefix, interval)
+        num_records = os.path.getsize(fn) // self.dtype.itemsize if os.path.exists(fn) else 0
+        if num_records == 0:
+            return np.zeros(0, self.dtype)
+        return np.memmap(fn, dtype=self.dtype, mode='r', shape=(num_records,))
+
+    def choose_level(self, start, end, num_points):
+        """Coarsest interval giving at least ``num_points`` points between
+        ``start`` and ``end`` (the finest if none do)"""
+        span = (end - start).total_seconds()
+        for interval in reversed(self.levels):
+            if span / interval >= num_points:
+                return interval
+        return self.levels[0]
+
+    def query(self, start, end, num_points=1000):
+        """Returns the chosen interval and its records with ``start <= time
+        < end`` (datetimes, UTC)"""
+        interval = self.choose_level(start, end, num_points)
+        records = self.level(interval)
+        i0, i1 = np.searchsorted(records['time'], [datetime_to_epoch(start),
+                                                   datetime_to_epoch(end)])
+        return interval, np.array(records[i0:i1])
+
+
+def backfill(archive, start, end, path, prefix='clock', levels=None, fields=None):
+    """Build the pyramid from the records between ``start`` and ``end`` in
+    an archive with a ``query`` method like ``archive.TextArchive``. Returns
+    the number of records read."""
+    writer = PyramidWriter(path, prefix, levels, fields)
+    total = 0
+    try:
+        for records in archive.query(start, end):
+            writer.write_records(records)
+            total += len(records)
+    finally:
+        writer.close()
+    logger.info("Added %d records to the pyramid in %s", total, path)
+    return total
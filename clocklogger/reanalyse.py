@@ -0,0 +1,156 @@
+"""Re-analyse recordings, in parallel, with different analysis settings.
+
+The recording is split into segments which are analysed by a pool of worker
+processes. Each worker starts at the beginning of its segment and carries on
+a little way into the next one. Where one window is chosen depends only on
+where the previous window ended, so as soon as a worker consumes up to the
+same sample as the worker before it, the two have fallen into step and every
+later window is identical. The segments are joined at that point, and the
+drift phase-unwrapping is then done in one serial pass, so the output is the
+same as analysing the whole recording in one go.
+"""
+
+import multiprocessing
+import logging
+from .input import PrerecordedDataSource
+from .analysis import ClockAnalyser, DataError
+from .output.textfile import TextFileWriter, datetime_to_epoch
+
+logger = logging.getLogger(__name__)
+
+# ClockAnalyser settings which can be changed for reanalysis
+SETTINGS = ['edge_level', 'edge_hysteresis', 'debounce_interval', 'pretrigger',
+            'decay_fit_duration', 'decay_fit_delay', 'decay_fit_level']
+
+
+def make_analyser(source, options):
+    analyser = ClockAnalyser(source, initial_drift=options.get('initial_drift', 0),
+                             invert=options.get('invert', False))
+    for name in SETTINGS:
+        if options.get(name) is not None:
+            setattr(analyser, name, options[name])
+    analyser.edge_interpolation = options.get('edge_interpolation')
+    return analyser
+
+
+def analyse_segment(task):
+    """Find the edge groups in one segment of a recording.
+
+    Returns a list of ``(next_start, edge_group)``, where ``next_start`` is
+    the sample at which the window after ``edge_group`` starts.
+    """
+    filename, start, stop, options = task
+    source = PrerecordedDataSource(filename, start=start, stop=stop,
+                                   raw=options.get('raw_samples', False))
+    analyser = make_analyser(source, options)
+    groups = []
+    for group in analyser.generate_edge_groups(fit_decay=options.get('fit_decay', False)):
+        groups.append((source.i, group))
+    return groups
+
+
+def join_segments(groups, following):
+    """Join ``following`` on to ``groups`` where the two analyses fall into
+    step. Returns None if they never do."""
+    positions = {}
+    for k, (next_start, group) in enumerate(groups):
+        positions.setdefault(next_start, k)
+    for j, (next_start, group) in enumerate(following):
+        if next_start in positions:
+            return groups[:positions[next_start] + 1] + following[j + 1:]
+    return None
+
+
+def find_edge_groups(source, options, jobs=None, segment_duration=600.0, overlap=30.0):
+    """Find all the edge groups in a recording, using ``jobs`` processes"""
+    filename = source.filename
+    num_samples = source.num_samples
+    segment_length = int(segment_duration * source.fs)
+    overlap_length = int(overlap * source.fs)
+    starts = list(range(0, num_samples, segment_length))
+    stops = [start + segment_length + overlap_length for start in starts]
+    tasks = [(filename, start, stop, options) for start, stop in zip(starts, stops)]
+
+    if jobs == 1 or len(tasks) == 1:
+        return analyse_segment((filename, 0, None, options))
+
+    with multiprocessing.Pool(jobs) as pool:
+        results = pool.imap(analyse_segment, tasks)
+        groups = next(results)
+        for k, following in enumerate(results, 1):
+            joined = join_segments(groups, following)
+            if joined is None:
+                # Not in step yet (e.g. no ticks found): carry on from where
+                # the analysis so far has got to.
+                logger.info("Segment %d did not join up; continuing serially", k)
+                position = groups[-1][0] if groups else 0
+                joined = groups + analyse_segment(
+                    (filename, position, stops[k], options))
+            groups = joined
+    return groups
+
+
+def process_edge_groups(analyser, edge_groups, pps_edge='down', sampling_rate_from_pps=False):
+    """Yield drift & amplitude values, restarting after data errors as the
+    logger would"""
+    edge_groups = iter(edge_groups)
+    while True:
+        results = analyser.process_edge_groups(edge_groups, pps_edge,
+                                               sampling_rate_from_pps)
+        try:
+            while True:
+                data = next(results)
+                yield data
+        except StopIteration:
+            return
+        except DataError as err:
+            logger.error("Error: %s", err)
+
+
+def reanalyse(filename, options, jobs=None, segment_duration=600.0, overlap=30.0):
+    """Yield drift & amplitude values from a recording"""
+    source = PrerecordedDataSource(filename)
+    groups = find_edge_groups(source, options, jobs, segment_duration, overlap)
+    analyser = make_analyser(source, options)
+    return process_edge_groups(analyser, [group for _, group in groups],
+                               options.get('pps_edge', 'down'),
+                               options.get('sampling_rate_from_pps', False))
+
+
+def add_arguments(parser):
+    parser.add_argument('recordings', nargs='+', help='recordings (.npz or raw)')
+    parser.add_argument('-o', '--output', default='-',
+                        help='directory for output files (default: stdout)')
+    parser.add_argument('-p', '--prefix', default='clock')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of processes (default: one per CPU)')
+    parser.add_argument('--segment-duration', type=float, default=600.0)
+    parser.add_argument('--overlap', type=float, default=30.0)
+    parser.add_argument('--pps-edge', choices=['up', 'down'], default='down')
+    parser.add_argument('--initial-drift', type=float, default=0.0)
+    for name in SETTINGS:
+        parser.add_argument('--' + name.replace('_', '-'), type=float)
+
+
+def run(args):
+    options = dict(vars(args))
+    options['invert'] = args.invert_signals
+    columns = ['time', 'drift', 'amplitude']
+    if args.output == '-':
+        writer = None
+    else:
+        writer = TextFileWriter(args.output, args.prefix, columns)
+
+    for filename in args.recordings:
+        logger.info("Reanalysing %s", filename)
+        for data in reanalyse(filename, options, args.jobs,
+                              args.segment_duration, args.overlap):
+            if writer is None:
+                print("%d %.6f %.6f" % (datetime_to_epoch(data['time']),
+                                        data['drift'], data['amplitude']))
+            else:
+                writer.write(data)
+            # Carry the drift on to the next recording
+            options['initial_drift'] = data['drift']
+    if writer is not None:
+        writer.close()
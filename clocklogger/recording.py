@@ -0,0 +1,163 @@
+"""Raw recording format.
+
+A recording is a short header followed by the samples as interleaved
+little-endian int16 frames, exactly as they come from the sound card, so it
+can be memory-mapped and read a window at a time however long it is.
+
+The header is the magic string ``CLKRAW01``, a uint32 giving the length of
+the rest of the header, and a JSON object with the sampling rate ``fs``,
+``start_time`` (seconds since the epoch) and ``channel_map`` (channel name
+to column number), padded with spaces so the samples are 64-byte aligned.
+
+Recordings may also be gzip-compressed (``.gz``), in which case they are
+decompressed into memory when opened rather than memory-mapped.
+"""
+
+import os
+import gzip
+import json
+import struct
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CLKRAW01'
+ALIGNMENT = 64
+DTYPE = np.dtype('<i2')
+DEFAULT_CHANNEL_MAP = {'tick': 0, 'pps': 1}
+
+
+def open_file(filename, mode='rb'):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode)
+    return open(filename, mode)
+
+
+def is_raw_recording(filename):
+    with open_file(filename) as f:
+        try:
+            return f.read(len(MAGIC)) == MAGIC
+        except OSError:
+            return False
+
+
+def encode_header(fs, start_time, channel_map=None):
+    if channel_map is None:
+        channel_map = DEFAULT_CHANNEL_MAP
+    header = json.dumps({
+        'fs': int(fs),
+        'start_time': float(start_time),
+        'channel_map': channel_map,
+    }).encode('ascii')
+    length = len(MAGIC) + 4 + len(header)
+    header += b' ' * (-length % ALIGNMENT)
+    return MAGIC + struct.pack('<I', len(header)) + header
+
+
+def read_header(f):
+    """Read the header from file object ``f``.
+
+    Returns the header dict, with the offset of the samples as ``offset``.
+    """
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a raw clock recording")
+    length, = struct.unpack('<I', f.read(4))
+    header = json.loads(f.read(length).decode('ascii'))
+    header['offset'] = len(MAGIC) + 4 + length
+    return header
+
+
+def read_available(f, block_size=2**16):
+    """Read the rest of ``f``, stopping quietly if it ends early"""
+    data = bytearray()
+    try:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            data += block
+    except EOFError:
+        # Compressed stream not finished, e.g. still being written
+        pass
+    return bytes(data)
+
+
+class RawRecording(object):
+    """A raw recording opened with ``np.memmap``.
+
+    ``frames`` is a read-only (N, channels) int16 array; nothing is read from
+    disk until it is sliced. Compressed recordings are read in full, as far as
+    they go if they were cut short.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open_file(filename) as f:
+            header = read_header(f)
+            self.fs = header['fs']
+            self.start_time = header['start_time']
+            self.channel_map = header['channel_map']
+            self.channels = max(self.channel_map.values()) + 1
+            if filename.endswith('.gz'):
+                data = read_available(f)
+                data = data[:len(data) - len(data) % (self.channels * DTYPE.itemsize)]
+                self.frames = np.frombuffer(data, dtype=DTYPE).reshape((-1, self.channels))
+                return
+
+        frame_size = self.channels * DTYPE.itemsize
+        num_frames = (os.path.getsize(filename) - header['offset']) // frame_size
+        if num_frames > 0:
+            self.frames = np.memmap(filename, dtype=DTYPE, mode='r',
+                                    offset=header['offset'],
+                                    shape=(num_frames, self.channels))
+        else:
+            # np.memmap can't map an empty file region
+            self.frames = np.empty((0, self.channels), dtype=DTYPE)
+
+    def __len__(self):
+        return self.frames.shape[0]
+
+
+class RawRecordingWriter(object):
+    """Write int16 frames to a new raw recording (compressed if the
+    filename ends in ``.gz``)"""
+
+    def __init__(self, filename, fs, start_time, channel_map=None):
+        self.filename = filename
+        self.file = open_file(filename, 'wb')
+        self.file.write(encode_header(fs, start_time, channel_map))
+        self.frames_written = 0
+        self.bytes_written = 0
+
+    def write(self, frames):
+        frames = np.ascontiguousarray(frames, dtype=DTYPE)
+        self.file.write(frames.tobytes())
+        self.frames_written += frames.shape[0]
+        self.bytes_written += frames.nbytes
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def float_to_int16(samples):
+    """Convert float samples in [-1, 1) to int16, as from the sound card"""
+    return np.clip(np.round(samples * 2**15), -2**15, 2**15 - 1).astype(DTYPE)
+
+
+def convert_npz(npz_filename, raw_filename, block_size=2**20):
+    """Convert an ``.npz`` recording (float ``signal``) to the raw format"""
+    logger.info("Converting %s to %s", npz_filename, raw_filename)
+    data = np.load(npz_filename)
+    signal = data['signal']
+    with RawRecordingWriter(raw_filename, int(data['fs']),
+                            float(data['start_time'])) as writer:
+        for i in range(0, signal.shape[0], block_size):
+            writer.write(float_to_int16(signal[i:i + block_size]))
+    return writer.frames_written
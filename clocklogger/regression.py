@@ -0,0 +1,220 @@
+"""Check that changes to the analysis don't change its results.
+
+Each case is a recording (``<name>.npz`` or ``<name>.raw``) with a golden
+text file of the drift and amplitude it should give (``<name>.txt``, in the
+same format as the daily text files) and, optionally, the analysis settings
+to use (``<name>.json``, with the same options as ``reanalyse``). The
+recording is analysed again and its output compared, record by record,
+with the golden file: every record must be there, with drift and amplitude
+within the tolerances. How long the analysis took is reported too, with
+the time spent in each stage, so a speedup can be checked for accuracy and
+measured in one run::
+
+    python -m clocklogger.logger regression cases/
+
+``--update`` writes the golden files from the current analysis instead.
+"""
+
+import os
+import os.path
+import json
+import time
+import logging
+import numpy as np
+
+from .reanalyse import reanalyse, SETTINGS
+from .archive import parse_records
+from .output.binary import record_dtype
+from .output.textfile import datetime_to_epoch
+from .timing import timers
+
+logger = logging.getLogger(__name__)
+
+RECORDING_EXTENSIONS = ('.npz', '.raw', '.raw.gz', '.raw.xz')
+
+# Golden files are written to 6 decimal places
+DRIFT_TOLERANCE = 2e-6
+AMPLITUDE_TOLERANCE = 2e-6
+
+
+def golden_filename(recording):
+    for ext in RECORDING_EXTENSIONS:
+        if recording.endswith(ext):
+            return recording[:-len(ext)] + '.txt'
+    return os.path.splitext(recording)[0] + '.txt'
+
+
+def options_filename(recording):
+    return os.path.splitext(golden_filename(recording))[0] + '.json'
+
+
+def find_cases(paths):
+    """Recordings named by ``paths``, or found in them if directories"""
+    cases = []
+    for path in paths:
+        if os.path.isdir(path):
+            cases.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.endswith(RECORDING_EXTENSIONS)))
+        else:
+            cases.append(path)
+    return cases
+
+
+def load_options(recording):
+    filename = options_filename(recording)
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as f:
+        options = json.load(f)
+    unknown = set(options) - set(SETTINGS) - {
+        'initial_drift', 'invert', 'pps_edge', 'fit_decay', 'edge_interpolation',
+        'sampling_rate_from_pps', 'raw_samples'}
+    if unknown:
+        raise ValueError("Unknown options in %s: %s" % (filename, ", ".join(sorted(unknown))))
+    return options
+
+
+def load_golden(filename):
+    with open(filename, 'rb') as f:
+        return parse_records(f.read(), record_dtype())
+
+
+def write_golden(filename, records):
+    with open(filename, 'wt') as f:
+        for data in records:
+            f.write("%d %.6f %.6f\n" % (datetime_to_epoch(data['time']),
+                                        data['drift'], data['amplitude']))
+
+
+def to_array(records):
+    out = np.zeros(len(records), record_dtype())
+    for i, data in enumerate(records):
+        out[i] = (datetime_to_epoch(data['time']), data['drift'], data['amplitude'])
+    return out
+
+
+def compare(output, golden, drift_tolerance=DRIFT_TOLERANCE,
+            amplitude_tolerance=AMPLITUDE_TOLERANCE):
+    """Compare two record arrays, matching records by time"""
+    common, i_out, i_gold = np.intersect1d(output['time'], golden['time'],
+                                           return_indices=True)
+    result = {
+        'records': len(golden),
+        'missing': len(golden) - len(common),
+        'extra': len(output) - len(common),
+    }
+    for k, tolerance in [('drift', drift_tolerance), ('amplitude', amplitude_tolerance)]:
+        diff = output[k][i_out] - golden[k][i_gold]
+        bad = ~(abs(diff) <= tolerance)
+        result[k] = {
+            'max': float(abs(diff).max()) if len(diff) else 0.0,
+            'rms': float(np.sqrt(np.mean(diff ** 2))) if len(diff) else 0.0,
+            'mean': float(diff.mean()) if len(diff) else 0.0,
+            'failed': int(bad.sum()),
+        }
+        if bad.any():
+            result[k]['first_failure'] = int(common[bad][0])
+    result['ok'] = (result['missing'] == 0 and result['extra'] == 0 and
+                    result['drift']['failed'] == 0 and result['amplitude']['failed'] == 0)
+    return result
+
+
+def analyse(recording, options, jobs=1):
+    """Analyse ``recording``; returns the records and the timings"""
+    was_enabled = timers.enabled
+    timers.reset()
+    timers.enabled = True
+    try:
+        t0 = time.perf_counter()
+        records = list(reanalyse(recording, options, jobs))
+        elapsed = time.perf_counter() - t0
+        stages = {name: stage['total'] for name, stage in timers.snapshot()['stages'].items()}
+    finally:
+        timers.enabled = was_enabled
+    return records, {'total': elapsed, 'stages': stages}
+
+
+def check(recording, jobs=1, drift_tolerance=DRIFT_TOLERANCE,
+          amplitude_tolerance=AMPLITUDE_TOLERANCE):
+    """Analyse ``recording`` and compare the output with its golden file"""
+    options = load_options(recording)
+    golden = load_golden(golden_filename(recording))
+    if len(golden) and 'initial_drift' not in options:
+        # Unwrap the drift to the same whole number of seconds
+        options['initial_drift'] = float(golden['drift'][0])
+    records, timing = analyse(recording, options, jobs)
+    result = compare(to_array(records), golden, drift_tolerance, amplitude_tolerance)
+    result['name'] = recording
+    result['timing'] = timing
+    if records:
+        duration = (records[-1]['time'] - records[0]['time']).total_seconds() + 3
+        result['throughput'] = duration / timing['total']
+    return result
+
+
+def update(recording, jobs=1):
+    """Write the golden file for ``recording`` from the current analysis"""
+    records, timing = analyse(recording, load_options(recording), jobs)
+    write_golden(golden_filename(recording), records)
+    logger.info("Wrote %d records to %s", len(records), golden_filename(recording))
+    return records
+
+
+def format_result(result):
+    lines = ["%s: %s" % (result['name'], "ok" if result['ok'] else "FAILED")]
+    lines.append("  records %d, missing %d, extra %d" % (
+        result['records'], result['missing'], result['extra']))
+    for k, unit in [('drift', 's'), ('amplitude', 'deg')]:
+        d = result[k]
+        line = "  %-9s max %.3g %s, rms %.3g %s, mean %+.3g %s" % (
+            k, d['max'], unit, d['rms'], unit, d['mean'], unit)
+        if d['failed']:
+            line += "; %d out of tolerance, first at %d" % (d['failed'], d['first_failure'])
+        lines.append(line)
+    timing = result['timing']
+    line = "  time %.3f s" % timing['total']
+    if 'throughput' in result:
+        line += " (%.0f audio-s per s)" % result['throughput']
+    stages = ", ".join("%s %.3f s" % item for item in sorted(timing['stages'].items()))
+    if stages:
+        line += ": " + stages
+    lines.append(line)
+    return "\n".join(lines)
+
+
+def add_arguments(parser):
+    parser.add_argument('cases', nargs='+',
+                        help='recordings with golden .txt files, or directories of them')
+    parser.add_argument('--update', action='store_true',
+                        help='write the golden files instead of checking them')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of processes (default: 1, for comparable timings)')
+    parser.add_argument('--drift-tolerance', type=float, default=DRIFT_TOLERANCE,
+                        help='largest difference in drift allowed, in seconds')
+    parser.add_argument('--amplitude-tolerance', type=float, default=AMPLITUDE_TOLERANCE,
+                        help='largest difference in amplitude allowed, in degrees')
+    parser.add_argument('--json', help='also save the results to this file')
+
+
+def run(args):
+    """Check (or update) every case; returns True if all passed"""
+    cases = find_cases(args.cases)
+    if not cases:
+        logger.error("No recordings found")
+        return False
+    if args.update:
+        for recording in cases:
+            update(recording, args.jobs)
+        return True
+
+    results = []
+    for recording in cases:
+        result = check(recording, args.jobs, args.drift_tolerance, args.amplitude_tolerance)
+        print(format_result(result))
+        results.append(result)
+    if args.json:
+        with open(args.json, 'wt') as f:
+            json.dump(results, f, indent=1)
+    failed = sum(not result['ok'] for result in results)
+    print("%d of %d cases passed" % (len(results) - failed, len(results)))
+    return failed == 0
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class RingBuffer(object):
+    """Preallocated circular buffer of multi-channel samples.
+
+    Every sample is stored twice, ``capacity`` rows apart, so that any run of
+    buffered samples can be returned as a contiguous view without copying.
+    Appending and consuming samples never allocates new arrays.
+    """
+
+    def __init__(self, capacity, channels=2, dtype=float):
+        self.capacity = int(capacity)
+        self.channels = channels
+        self.data = np.zeros((2 * self.capacity, channels), dtype=dtype)
+        self.start = 0  # position of first buffered sample (< capacity)
+        self.size = 0   # number of buffered samples
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def free(self):
+        """Number of samples which can be written before the buffer is full"""
+        return self.capacity - self.size
+
+    def write(self, samples, scale=None):
+        """Append ``samples`` (num_samples x channels), multiplied by ``scale``
+        if given (e.g. to convert raw integer frames to floats)"""
+        num_samples = samples.shape[0]
+        if num_samples > self.free:
+            raise ValueError("RingBuffer overflow: %d samples written, %d free"
+                             % (num_samples, self.free))
+
+        end = (self.start + self.size) % self.capacity
+        first = min(num_samples, self.capacity - end)
+        self._store(end, samples[:first], scale)
+        if first < num_samples:
+            self._store(0, samples[first:], scale)
+        self.size += num_samples
+
+    def _store(self, pos, samples, scale):
+        n = samples.shape[0]
+        primary = self.data[pos:pos + n]
+        primary[...] = samples
+        if scale is not None:
+            # In place, to avoid the temporary buffers of a mixed-type ufunc
+            primary *= scale
+        self.data[pos + self.capacity:pos + self.capacity + n] = primary
+
+    def view(self, num_samples=None):
+        """Return a view of the first ``num_samples`` buffered samples"""
+        if num_samples is None:
+            num_samples = self.size
+        num_samples = min(int(num_samples), self.size)
+        return self.data[self.start:self.start + num_samples]
+
+    def consume(self, num_samples):
+        """Discard the first ``num_samples`` buffered samples"""
+        num_samples = int(num_samples)
+        if num_samples > self.size:
+            raise ValueError("Cannot consume %d samples, only %d buffered"
+                             % (num_samples, self.size))
+        self.start = (self.start + num_samples) % self.capacity
+        self.size -= num_samples
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
@@ -0,0 +1,300 @@
+"""Small HTTP service for the latest sample and ranges of the archive.
+
+QueryServer runs an asyncio event loop on its own thread, so it never holds
+up the analysis. The latest sample comes from a LatestSample writer (added
+to the logger's writers like any other), and ranges are read from the
+daily binary files, or from the pyramid when the range is long enough
+that a coarser level still gives the number of points asked for.
+
+    GET /latest
+    GET /range?start=...&end=...[&points=1000][&format=json|csv|bin]
+    GET /metrics
+
+``start`` and ``end`` are seconds since the epoch or UTC times like
+``2014-02-03T10:00:00``. Without ``points``, every record is returned;
+with it, records are reduced to min/mean/max per bin when there are more
+than that. The ``bin`` format is the records as packed little-endian
+structs, with the numpy dtype in the ``X-Dtype`` header. ``/metrics``
+returns whatever the ``metrics`` function given to the server returns.
+
+Responses are cached for ``cache_ttl`` seconds (ranges which end before the
+latest sample, which won't change, for ``cache_ttl_past``), so dashboards
+polling the same queries don't read the files each time.
+"""
+
+import io
+import json
+import time
+import asyncio
+import logging
+import threading
+from http import HTTPStatus
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+
+from .output.textfile import datetime_to_epoch
+from .pyramid import pyramid_dtype
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'csv': 'text/csv',
+    'bin': 'application/octet-stream',
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super(HTTPError, self).__init__(message)
+        self.status = status
+
+
+class LatestSample(object):
+    """Writer which keeps the latest record"""
+
+    def __init__(self):
+        self.data = None
+
+    def write(self, data):
+        self.data = data
+
+
+def parse_time(s):
+    try:
+        return EPOCH + timedelta(seconds=float(s))
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            pass
+    raise HTTPError(400, "Bad time: %s" % s)
+
+
+def downsample(records, num_points, fields):
+    """Reduce records to at most ``num_points`` bins of equal numbers of
+    records, with the count and min/mean/max of each field"""
+    bins = np.unique(np.linspace(0, len(records), num_points + 1).astype(int)[:-1])
+    counts = np.diff(np.r_[bins, len(records)])
+    result = np.zeros(len(bins), pyramid_dtype(fields))
+    result['time'] = records['time'][bins]
+    result['count'] = counts
+    for k in fields:
+        result[k + '_min'] = np.minimum.reduceat(records[k], bins)
+        result[k + '_mean'] = np.add.reduceat(records[k], bins) / counts
+        result[k + '_max'] = np.maximum.reduceat(records[k], bins)
+    return result
+
+
+def encode_records(records, fmt):
+    """Body and extra headers for a structured array of records"""
+    if fmt == 'bin':
+        dtype = json.dumps(records.dtype.descr)
+        return records.tobytes(), {'X-Dtype': dtype}
+    names = records.dtype.names
+    if fmt == 'csv':
+        out = io.StringIO()
+        out.write(','.join(names) + '\n')
+        np.savetxt(out, np.column_stack([records[k] for k in names]) if len(records)
+                   else np.zeros((0, len(names))), delimiter=',',
+                   fmt=['%d' if records.dtype[k].kind == 'i' else '%.9g' for k in names])
+        return out.getvalue().encode('utf-8'), {}
+    columns = {}
+    for k in names:
+        values = records[k].tolist()
+        if records.dtype[k].kind == 'f':
+            # NaN isn't valid JSON
+            values = [None if v != v else v for v in values]
+        columns[k] = values
+    return json.dumps(columns).encode('utf-8'), {}
+
+
+class QueryServer(object):
+    def __init__(self, latest, reader, pyramid=None, host='127.0.0.1', port=8080,
+                 fields=None, max_points=100000, cache_size=256, cache_ttl=2.0,
+                 cache_ttl_past=300.0, metrics=None):
+        self.latest = latest
+        self.metrics = metrics
+        self.reader = reader
+        self.pyramid = pyramid
+        self.host = host
+        self.port = port
+        self.fields = fields or [k for k in reader.dtype.names if k != 'time']
+        self.max_points = max_points
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cache_ttl_past = cache_ttl_past
+        self.cache = OrderedDict()
+        self.cache_hits = 0
+        self.requests = 0
+        self.loop = None
+        self.server = None
+        self.connections = set()
+        self.thread = None
+        self.ready = threading.Event()
+        self.error = None
+
+    def start(self):
+        """Start serving on a background thread. Raises the error if the
+        server can't be started (e.g. the port is in use)."""
+        self.thread = threading.Thread(target=self._run, name='http')
+        self.thread.daemon = True
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        logger.info("Serving on http://%s:%d/", self.host, self.port)
+
+    def close(self):
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            self.server = loop.run_until_complete(
+                asyncio.start_server(self._handle_connection, self.host, self.port))
+            self.port = self.server.sockets[0].getsockname()[1]
+            self.loop = loop
+        except Exception as err:
+            self.error = err
+            loop.close()
+            return
+        finally:
+            self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            for writer in list(self.connections):
+                writer.close()
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
+
+    async def _handle_connection(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                status, extra, body = await self._respond(method, target)
+                keep_alive = (version == 'HTTP/1.1' and
+                              headers.get('connection', '').lower() != 'close')
+                head = ['HTTP/1.1 %d %s' % (status, HTTPStatus(status).phrase),
+                        'Content-Length: %d' % len(body),
+                        'Connection: %s' % ('keep-alive' if keep_alive else 'close')]
+                head += ['%s: %s' % item for item in extra.items()]
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+                if method != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def _respond(self, method, target):
+        self.requests += 1
+        if method not in ('GET', 'HEAD'):
+            return self._error(HTTPError(405, "Only GET is supported"))
+        cached = self.cache.get(target)
+        if cached is not None and cached[0] > time.monotonic():
+            self.cache.move_to_end(target)
+            self.cache_hits += 1
+            return cached[1]
+        try:
+            # Reading the files could take a while, so not on the event loop
+            response, ttl = await self.loop.run_in_executor(None, self._query, target)
+        except HTTPError as err:
+            return self._error(err)
+        except Exception as err:
+            logger.exception("Error handling %s", target)
+            return self._error(HTTPError(500, str(err)))
+        self.cache[target] = (time.monotonic() + ttl, response)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return response
+
+    def _error(self, err):
+        body = json.dumps({'error': str(err)}).encode('utf-8')
+        return err.status, {'Content-Type': CONTENT_TYPES['json']}, body
+
+    def _query(self, target):
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if url.path == '/latest':
+            return self._latest(), self.cache_ttl
+        elif url.path == '/range':
+            return self._range(params)
+        elif url.path == '/metrics' and self.metrics is not None:
+            body = json.dumps(self.metrics()).encode('utf-8')
+            return (200, {'Content-Type': CONTENT_TYPES['json']}, body), 0.0
+        raise HTTPError(404, "Not found: %s" % url.path)
+
+    def _latest(self):
+        data = self.latest.data
+        if data is None:
+            raise HTTPError(503, "No data yet")
+        result = {k: (datetime_to_epoch(v) if k == 'time' else float(v))
+                  for k, v in data.items()}
+        result['iso_time'] = data['time'].strftime('%Y-%m-%dT%H:%M:%SZ')
+        return 200, {'Content-Type': CONTENT_TYPES['json']}, json.dumps(result).encode('utf-8')
+
+    def _range(self, params):
+        if 'start' not in params or 'end' not in params:
+            raise HTTPError(400, "start and end are needed")
+        start, end = parse_time(params['start']), parse_time(params['end'])
+        if end <= start:
+            raise HTTPError(400, "end must be after start")
+        fmt = params.get('format', 'json')
+        if fmt not in CONTENT_TYPES:
+            raise HTTPError(400, "Unknown format: %s" % fmt)
+        try:
+            num_points = int(params['points']) if 'points' in params else None
+        except ValueError:
+            raise HTTPError(400, "Bad number of points: %s" % params['points'])
+        if num_points is not None and not 0 < num_points <= self.max_points:
+            raise HTTPError(400, "points must be between 1 and %d" % self.max_points)
+
+        records = None
+        if num_points is not None and self.pyramid is not None:
+            interval = self.pyramid.choose_level(start, end, num_points)
+            if (end - start).total_seconds() / interval >= num_points:
+                interval, records = self.pyramid.query(start, end, num_points)
+        if records is None:
+            records = self.reader.load(start, end)
+            if num_points is not None and len(records) > num_points:
+                records = downsample(records, num_points, self.fields)
+            elif num_points is None and len(records) > self.max_points:
+                raise HTTPError(400, "Too many records (%d); ask for fewer points"
+                                % len(records))
+
+        body, headers = encode_records(records, fmt)
+        headers['Content-Type'] = CONTENT_TYPES[fmt]
+        latest = self.latest.data
+        past = latest is not None and end <= latest['time']
+        return (200, headers, body), self.cache_ttl_past if past else self.cache_ttl
@@ -0,0 +1,234 @@
+"""Clock stability: overlapping Allan deviation, modified Allan deviation
+and time deviation of the drift series.
+
+The drift is the clock's time error (phase, in seconds), one value every
+``tau0`` seconds. For each averaging factor ``m`` (tau = m * tau0), the
+second differences ``x[i+2m] - 2 x[i+m] + x[i]`` give the overlapping ADEV
+directly, and a cumulative sum of them gives the m-long moving sums needed
+for MDEV, so each tau costs O(N).
+
+Stability accumulates these sums over blocks of data, keeping only the
+last ``3 * max(factors)`` samples between blocks, so a multi-year archive
+can be read a day at a time (see ``archive_stability``). Missing samples
+are NaN; terms which include one are left out, and each deviation is
+normalised by the number of terms actually used.
+"""
+
+import math
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TAU0 = 3.0
+
+RESULT_DTYPE = np.dtype([
+    ('tau', '<f8'),
+    ('adev', '<f8'),
+    ('mdev', '<f8'),
+    ('tdev', '<f8'),
+    ('n_adev', '<i8'),
+    ('n_mdev', '<i8'),
+])
+
+
+def octave_factors(max_factor):
+    """Averaging factors 1, 2, 4, ... up to ``max_factor``"""
+    if max_factor < 1:
+        return np.zeros(0, dtype=np.int64)
+    return 2 ** np.arange(int(math.log2(max_factor)) + 1, dtype=np.int64)
+
+
+def regularise(times, values, tau0=TAU0, origin=None):
+    """Place ``values`` at their slots on a regular grid with spacing
+    ``tau0`` starting at ``origin`` (default: the first time). Returns the
+    slot numbers and values; a record which lands on the same slot as the
+    one before goes in the next slot if that is free (the timestamps are
+    rounded to whole seconds, so they jitter), otherwise it is dropped."""
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if origin is None:
+        origin = times[0] if len(times) else 0.0
+    slots = np.round((times - origin) / tau0).astype(np.int64)
+    if len(slots) > 1:
+        same = np.r_[False, slots[1:] == slots[:-1]]
+        next_free = np.r_[slots[1:] > slots[:-1] + 1, True]
+        slots[same & next_free] += 1
+        keep = np.r_[True, slots[1:] > slots[:-1]]
+        slots, values = slots[keep], values[keep]
+    return slots, values
+
+
+class Stability(object):
+    """Accumulate ADEV, MDEV and TDEV for the averaging factors ``factors``
+    over phase data given a block at a time"""
+
+    def __init__(self, tau0=TAU0, factors=None, block_size=2**20):
+        self.tau0 = tau0
+        self.factors = np.asarray(octave_factors(2**20) if factors is None else factors,
+                                  dtype=np.int64)
+        self.history = 3 * int(self.factors.max()) if len(self.factors) else 0
+        self.block_size = max(block_size, self.history)
+        self.tail = np.zeros(0)
+        self.pending = []
+        self.num_pending = 0
+        self.num_samples = 0
+        self.adev_sums = np.zeros(len(self.factors))
+        self.adev_counts = np.zeros(len(self.factors), dtype=np.int64)
+        self.mdev_sums = np.zeros(len(self.factors))
+        self.mdev_counts = np.zeros(len(self.factors), dtype=np.int64)
+        self.offset = None
+        # For add_records
+        self.origin = None
+        self.last_slot = None
+
+    def add(self, x):
+        """Add phase samples (seconds) continuing on from the last ones"""
+        x = np.asarray(x, dtype=np.float64)
+        self.pending.append(x)
+        self.num_pending += len(x)
+        self.num_samples += len(x)
+        if self.num_pending >= self.block_size:
+            self._process()
+
+    def skip(self, n):
+        """Add ``n`` missing samples"""
+        if n >= self.history:
+            # No term can span the gap
+            self._process()
+            self.tail = np.zeros(0)
+            self.num_samples += n
+        elif n > 0:
+            self.add(np.full(n, np.nan))
+
+    def add_records(self, times, values):
+        """Add values with timestamps (seconds), filling in any gaps"""
+        if len(times) == 0:
+            return
+        if self.origin is None:
+            self.origin = float(times[0])
+        slots, values = regularise(times, values, self.tau0, self.origin)
+        if self.last_slot is not None:
+            keep = slots > self.last_slot
+            slots, values = slots[keep], values[keep]
+            if len(slots) == 0:
+                return
+            self.skip(slots[0] - self.last_slot - 1)
+        gaps = np.flatnonzero(np.diff(slots) > 1)
+        if len(gaps) == 0:
+            self.add(values)
+        else:
+            x = np.full(slots[-1] - slots[0] + 1, np.nan)
+            x[slots - slots[0]] = values
+            self.add(x)
+        self.last_slot = slots[-1]
+
+    def result(self):
+        """Deviations for each averaging factor so far, as an array with
+        ``RESULT_DTYPE``. Factors without enough data give NaN."""
+        self._process()
+        result = np.zeros(len(self.factors), RESULT_DTYPE)
+        tau = self.factors * self.tau0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            adev2 = self.adev_sums / (2 * tau**2 * self.adev_counts)
+            mdev2 = self.mdev_sums / (2 * self.factors**2 * tau**2 * self.mdev_counts)
+        result['tau'] = tau
+        result['adev'] = np.sqrt(adev2)
+        result['mdev'] = np.sqrt(mdev2)
+        result['tdev'] = tau / np.sqrt(3) * result['mdev']
+        result['n_adev'] = self.adev_counts
+        result['n_mdev'] = self.mdev_counts
+        return result
+
+    def _process(self):
+        if not self.pending:
+            return
+        x = np.concatenate(self.pending)
+        self.pending = []
+        self.num_pending = 0
+        # The second differences don't depend on the offset, and the
+        # numbers are smaller without it
+        if self.offset is None:
+            finite = x[np.isfinite(x)]
+            self.offset = finite[0] if len(finite) else None
+        if self.offset is not None:
+            x -= self.offset
+        start = len(self.tail)
+        x = np.concatenate([self.tail, x])
+
+        for i, m in enumerate(self.factors):
+            # Terms already counted end before ``start``
+            lo = max(0, start - 3 * m + 1)
+            r = x[lo:]
+            if len(r) < 2 * m + 1:
+                continue
+            d = r[2 * m:] - 2 * r[m:-m] + r[:-2 * m]
+            first_new = max(0, start - 2 * m - lo)
+            valid = np.isfinite(d)
+            if valid.all():
+                self.adev_counts[i] += len(d) - first_new
+                self.adev_sums[i] += np.dot(d[first_new:], d[first_new:])
+                if len(d) < m:
+                    continue
+                c = np.cumsum(d)
+                inner = c[m - 1:].copy()
+                inner[1:] -= c[:-m]
+                self.mdev_counts[i] += len(inner)
+                self.mdev_sums[i] += np.dot(inner, inner)
+                continue
+
+            new = valid[first_new:]
+            self.adev_counts[i] += np.count_nonzero(new)
+            dn = d[first_new:][new]
+            self.adev_sums[i] += np.dot(dn, dn)
+
+            if len(d) < m:
+                continue
+            c = np.r_[0, np.cumsum(np.where(valid, d, 0.0))]
+            bad = np.r_[0, np.cumsum(~valid)]
+            inner = c[m:] - c[:-m]
+            ok = (bad[m:] - bad[:-m]) == 0
+            self.mdev_counts[i] += np.count_nonzero(ok)
+            inner = inner[ok]
+            self.mdev_sums[i] += np.dot(inner, inner)
+
+        if self.history:
+            self.tail = x[-self.history:]
+        else:
+            self.tail = np.zeros(0)
+
+
+def stability(x, tau0=TAU0, factors=None):
+    """ADEV, MDEV and TDEV of the phase samples ``x``, by default at octave
+    factors up to a quarter of its length"""
+    if factors is None:
+        factors = octave_factors(len(x) // 4)
+    s = Stability(tau0, factors, block_size=len(x))
+    s.add(x)
+    return s.result()
+
+
+def oadev(x, tau0=TAU0, factors=None):
+    result = stability(x, tau0, factors)
+    return result['tau'], result['adev']
+
+
+def mdev(x, tau0=TAU0, factors=None):
+    result = stability(x, tau0, factors)
+    return result['tau'], result['mdev']
+
+
+def tdev(x, tau0=TAU0, factors=None):
+    result = stability(x, tau0, factors)
+    return result['tau'], result['tdev']
+
+
+def archive_stability(archive, start, end, tau0=TAU0, factors=None, column='drift'):
+    """Stability of the drift between ``start`` and ``end`` (datetimes),
+    read a file at a time from an archive with a ``query`` method like
+    ``archive.TextArchive``"""
+    s = Stability(tau0, factors)
+    for records in archive.query(start, end):
+        s.add_records(records['time'], records[column])
+    logger.info("Stability of %d samples from %s to %s", s.num_samples, start, end)
+    return s.result()
@@ -0,0 +1,198 @@
+"""Running statistics of the clock's drift and amplitude.
+
+OnlineStats takes each record from ClockAnalyser.process and keeps, for
+each window length (by default a minute, an hour and a day), aggregates of
+the current window which are updated in place: count, mean, variance,
+minimum and maximum of each field, and the drift rate in seconds per day
+from a least-squares line through the drift. When a record falls in the
+next window, the finished window's rollup is written to that window's own
+writer. Windows are aligned to the epoch (so hours start on the hour).
+
+The windows in progress when the logger stops can be saved to a file and
+carried on with when it starts again, so that a restart doesn't split a
+window into two rollups with the same time.
+"""
+
+import os
+import math
+import json
+import logging
+from datetime import datetime, timedelta
+
+from .output.textfile import datetime_to_epoch
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+WINDOWS = [('1min', 60), ('1h', 3600), ('1day', 86400)]
+FIELDS = ['drift', 'amplitude']
+
+
+def stats_columns(fields=None, rate_field='drift'):
+    columns = ['time', 'count']
+    for k in fields or FIELDS:
+        columns += [k + '_mean', k + '_var', k + '_min', k + '_max']
+        if k == rate_field:
+            columns.append(k + '_rate')
+    return columns
+
+
+class RunningStats(object):
+    """Mean, variance, min and max of a series, and optionally the slope of
+    a least-squares line through it, in O(1) memory (Welford's method)"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        # For the regression on x
+        self.mean_x = 0.0
+        self.m2_x = 0.0
+        self.c_xy = 0.0
+
+    def add(self, y, x=0.0):
+        self.n += 1
+        dx = x - self.mean_x
+        dy = y - self.mean
+        self.mean_x += dx / self.n
+        self.mean += dy / self.n
+        self.m2 += dy * (y - self.mean)
+        self.m2_x += dx * (x - self.mean_x)
+        self.c_xy += dx * (y - self.mean)
+        if y < self.min:
+            self.min = y
+        if y > self.max:
+            self.max = y
+
+    def state(self):
+        return dict(vars(self))
+
+    def restore(self, state):
+        vars(self).update(state)
+
+    @property
+    def var(self):
+        """Population variance"""
+        return self.m2 / self.n if self.n else math.nan
+
+    @property
+    def slope(self):
+        return self.c_xy / self.m2_x if self.m2_x > 0 else math.nan
+
+
+class WindowStats(object):
+    """Aggregates of the records in the current window of ``length`` seconds"""
+
+    def __init__(self, length, fields=None, rate_field='drift'):
+        self.length = length
+        self.fields = fields or FIELDS
+        self.rate_field = rate_field
+        self.stats = {k: RunningStats() for k in self.fields}
+        self.start = None
+        self.count = 0
+
+    def add(self, data):
+        """Add a record. Returns the rollup of the previous window if this
+        record starts a new one, otherwise None."""
+        t = datetime_to_epoch(data['time'])
+        rollup = None
+        if self.start is None or not (self.start <= t < self.start + self.length):
+            if self.count:
+                rollup = self.rollup()
+            self.start = t - t % self.length
+            self.count = 0
+            for stats in self.stats.values():
+                stats.reset()
+        self.count += 1
+        for k, stats in self.stats.items():
+            stats.add(float(data[k]), t - self.start)
+        return rollup
+
+    def state(self):
+        """The window in progress, for ``restore``"""
+        return {'length': self.length, 'start': self.start, 'count': self.count,
+                'stats': {k: stats.state() for k, stats in self.stats.items()}}
+
+    def restore(self, state):
+        """Carry on with a window saved by ``state``, if it is like this one"""
+        if state['length'] != self.length or sorted(state['stats']) != sorted(self.fields):
+            return False
+        self.start = state['start']
+        self.count = state['count']
+        for k, stats in self.stats.items():
+            stats.restore(state['stats'][k])
+        return True
+
+    def rollup(self):
+        """Aggregates of the current window so far"""
+        data = {'time': EPOCH + timedelta(seconds=self.start), 'count': self.count}
+        for k, stats in self.stats.items():
+            data[k + '_mean'] = stats.mean
+            data[k + '_var'] = stats.var
+            data[k + '_min'] = stats.min
+            data[k + '_max'] = stats.max
+            if k == self.rate_field:
+                data[k + '_rate'] = stats.slope * 86400
+        return data
+
+
+class OnlineStats(object):
+    """Writer which writes rollups of the records it is given to
+    ``writers[name]`` for each window in ``windows``. With
+    ``state_filename``, the windows in progress are saved there on closing
+    and carried on with by the next OnlineStats."""
+
+    def __init__(self, writers, windows=None, fields=None, state_filename=None):
+        self.windows = [(name, WindowStats(length, fields))
+                        for name, length in (windows or WINDOWS)]
+        self.writers = writers
+        self.state_filename = state_filename
+        if state_filename is not None and os.path.exists(state_filename):
+            self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_filename, 'rt') as f:
+                state = json.load(f)
+            # Only once: if the logger stops without saving, these windows
+            # may already have been written
+            os.remove(self.state_filename)
+        except (OSError, ValueError) as err:
+            logger.warning("Could not read %s: %s", self.state_filename, err)
+            return
+        for name, window in self.windows:
+            if name in state and not window.restore(state[name]):
+                logger.warning("Not carrying on with %s window: settings changed", name)
+
+    def _save_state(self):
+        state = {name: window.state() for name, window in self.windows if window.count}
+        try:
+            with open(self.state_filename, 'wt') as f:
+                json.dump(state, f)
+        except OSError as err:
+            logger.error("Could not save %s: %s", self.state_filename, err)
+
+    def write(self, data):
+        for name, window in self.windows:
+            rollup = window.add(data)
+            if rollup is not None and name in self.writers:
+                self.writers[name].write(rollup)
+
+    def current(self):
+        """Rollups of the windows in progress"""
+        return {name: window.rollup() for name, window in self.windows
+                if window.count}
+
+    def close(self):
+        if self.state_filename is not None:
+            self._save_state()
+        for writer in self.writers.values():
+            close = getattr(writer, 'close', None)
+            if close is not None:
+                close()
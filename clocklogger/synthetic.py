@@ -0,0 +1,120 @@
+"""Synthetic tick and PPS signals, for testing and benchmarking"""
+
+from datetime import datetime
+import numpy as np
+
+from .input import PrerecordedDataSource
+
+
+def pendulum_edges(duration, period=3.0, amplitude=46.0, sensor_position=30.0,
+                   shim_width=24.0, phase=0.0):
+    """Times when the shim on the pendulum enters and leaves the light beam.
+
+    The pendulum angle (in mm at the shim) is ``amplitude * cos(w t + phase)``
+    and the beam is blocked while the shim is within ``shim_width / 2`` of
+    ``sensor_position``. Returns the edge times and their signs: +1 when the
+    beam is blocked, -1 when it is cleared.
+    """
+    w = 2 * np.pi / period
+    angles = []
+    for level in (sensor_position - shim_width / 2, sensor_position + shim_width / 2):
+        if abs(level) < amplitude:
+            a = np.arccos(level / amplitude)
+            angles.extend([a, -a])
+    cycles = np.arange(-1, int(duration / period) + 2)
+    t = ((np.array(angles)[:, None] + 2 * np.pi * cycles - phase) / w).ravel()
+    t = np.sort(t[(t >= 0) & (t < duration)])
+
+    # The beam is blocked just after an edge if the shim is then over the sensor
+    after = amplitude * np.cos(w * (t + 1e-6) + phase)
+    blocked = abs(after - sensor_position) < shim_width / 2
+    return t, np.where(blocked, 1, -1)
+
+
+def pps_edges(duration, offset=0.3, width=0.1):
+    """Rising and falling edges of a pulse-per-second signal"""
+    starts = np.arange(offset % 1, duration, 1.0)
+    t = np.r_[starts, starts + width]
+    signs = np.r_[np.ones(len(starts)), -np.ones(len(starts))]
+    order = np.argsort(t, kind='stable')
+    keep = t[order] < duration
+    return t[order][keep], signs[order][keep]
+
+
+def pulse_train(fs, duration, times, signs, height=0.8, decay=0.008,
+                ringing=0.0, ring_frequency=5000.0, ring_decay=0.005, rise=0.0):
+    """Signal seen by the AC-coupled sound card input for a series of steps.
+
+    Each edge produces a spike of ``height`` which decays exponentially, with
+    an optional damped oscillation of relative size ``ringing`` on top. With
+    ``rise``, the spike rises with this time constant instead of jumping,
+    like a signal through the sound card's anti-aliasing filter, so the
+    edge times can be found to better than a sample.
+    """
+    n = int(round(duration * fs))
+    y = np.zeros(n)
+    span = int(10 * max(decay, ring_decay) * fs)
+    tt = np.arange(span) / fs
+    for t, sign in zip(times, signs):
+        i = int(np.ceil(t * fs))
+        if i >= n:
+            continue
+        dt = tt[:n - i] + (i / fs - t)
+        pulse = np.exp(-dt / decay)
+        if rise:
+            pulse -= np.exp(-dt / rise)
+        if ringing:
+            pulse += ringing * np.exp(-dt / ring_decay) * np.sin(2 * np.pi * ring_frequency * dt)
+        y[i:i + span] += sign * height * pulse
+    return y
+
+
+def drop_pulses(times, signs, fraction, rng, pairs=False):
+    """Leave out a random ``fraction`` of the edges (or, with ``pairs``, of
+    the pulses made by each rising edge and the falling edge after it)"""
+    if not fraction:
+        return times, signs
+    if pairs:
+        pulse = np.cumsum(signs > 0) - 1
+        missing = rng.uniform(size=max(pulse.max() + 1, 0)) < fraction
+        keep = ~missing[pulse] | (pulse < 0)
+    else:
+        keep = rng.uniform(size=len(times)) >= fraction
+    return times[keep], signs[keep]
+
+
+def clock_signal(fs=44100, duration=60.0, pps_offset=0.3, noise=0.0,
+                 ringing=0.0, seed=None, rate=0.0, missing_pps=0.0,
+                 missing_ticks=0.0, rise=0.0, **pendulum):
+    """Two-channel (tick, PPS) signal like that recorded by the logger.
+
+    The clock gains ``rate`` seconds per day (so its period is a little
+    short of 3 s). A fraction ``missing_pps`` of the PPS pulses and
+    ``missing_ticks`` of the tick edges are left out. ``rise`` is passed
+    to ``pulse_train``. Extra keyword
+    arguments are passed to ``pendulum_edges``.
+    """
+    rng = np.random.RandomState(seed)
+    if rate:
+        pendulum.setdefault('period', 3.0)
+        pendulum['period'] /= 1 + rate / 86400
+    ticks = drop_pulses(*pendulum_edges(duration, **pendulum), missing_ticks, rng)
+    pps = drop_pulses(*pps_edges(duration, pps_offset), missing_pps, rng, pairs=True)
+    tick = pulse_train(fs, duration, *ticks, ringing=ringing, rise=rise)
+    pps = pulse_train(fs, duration, *pps, ringing=ringing, rise=rise)
+    signal = np.c_[tick, pps]
+    if noise:
+        signal += rng.normal(0, noise, signal.shape)
+    return signal
+
+
+class SyntheticDataSource(PrerecordedDataSource):
+    """Data source like PrerecordedDataSource, reading a synthetic signal
+    made by ``clock_signal`` (to which the keyword arguments are passed),
+    as int16 frames if ``raw``"""
+
+    def __init__(self, fs=44100, duration=60.0, start_time=datetime(2014, 2, 3),
+                 start=0, stop=None, raw=False, **options):
+        self.filename = None
+        self._set_samples(clock_signal(fs, duration, **options), fs, start_time,
+                          start, stop, raw)
@@ -0,0 +1,129 @@
+"""Archive the raw signal from the sound card.
+
+A RecordingTap receives every block of frames read by SoundCardDataSource
+and writes them on a background thread to compressed raw recordings, one
+chunk file per ``chunk_duration`` seconds. The oldest chunks are deleted to
+keep the archive under ``max_bytes``, so the signal around recent anomalies
+can be replayed through PrerecordedDataSource.
+"""
+
+import os
+import glob
+import time
+import queue
+import threading
+import logging
+from .recording import RawRecordingWriter
+
+logger = logging.getLogger(__name__)
+
+
+class RecordingTap(object):
+    """Stream int16 frames to rotating compressed chunk files.
+
+    ``put`` never blocks: if the writer thread falls so far behind that the
+    queue is full, the block is dropped and counted in ``frames_dropped``
+    (the gap then starts a new chunk).
+    """
+
+    def __init__(self, directory, fs, prefix='raw', chunk_duration=600.0,
+                 max_bytes=2 * 2**30, max_blocks=256, channel_map=None):
+        self.directory = directory
+        self.fs = fs
+        self.prefix = prefix
+        self.chunk_length = int(chunk_duration * fs)
+        self.max_bytes = max_bytes
+        self.channel_map = channel_map
+
+        self.queue = queue.Queue(max_blocks)
+        self.writer = None
+        self.next_index = None
+
+        # Counters
+        self.bytes_written = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.chunks_written = 0
+        self.chunks_deleted = 0
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.thread = threading.Thread(target=self._run, name='RecordingTap')
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def depth(self):
+        """Number of blocks waiting to be written"""
+        return self.queue.qsize()
+
+    def put(self, index, frames, timestamp=None):
+        """Queue ``frames``, the first of which is sample ``index``, captured
+        at ``timestamp`` (seconds since the epoch, if known)"""
+        try:
+            self.queue.put_nowait((index, frames, timestamp))
+        except queue.Full:
+            self.frames_dropped += frames.shape[0]
+
+    def close(self):
+        """Write out everything queued so far and stop the writer thread"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def chunk_files(self):
+        """Chunk files in the archive, oldest first"""
+        pattern = os.path.join(self.directory, self.prefix + '_*.raw.gz')
+        return sorted(glob.glob(pattern))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as err:
+                logger.error("Error archiving raw signal: %s", err)
+                self._close_chunk()
+        self._close_chunk()
+
+    def _write(self, index, frames, timestamp):
+        if self.writer is not None and (
+                index != self.next_index or
+                self.writer.frames_written >= self.chunk_length):
+            self._close_chunk()
+        if self.writer is None:
+            self._open_chunk(index, timestamp)
+        self.writer.write(frames)
+        self.next_index = index + frames.shape[0]
+        self.frames_written += frames.shape[0]
+        self.bytes_written += frames.nbytes
+
+    def _open_chunk(self, index, timestamp):
+        if timestamp is None:
+            timestamp = time.time()
+        filename = os.path.join(self.directory, '%s_%s_%012d.raw.gz' % (
+            self.prefix, time.strftime('%Y%m%d_%H%M%S', time.gmtime(timestamp)), index))
+        logger.debug("Starting raw signal chunk %s", filename)
+        self.writer = RawRecordingWriter(filename, self.fs, timestamp, self.channel_map)
+
+    def _close_chunk(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.writer = None
+        self.chunks_written += 1
+        self._enforce_retention()
+
+    def _enforce_retention(self):
+        files = self.chunk_files()
+        sizes = [os.path.getsize(filename) for filename in files]
+        total = sum(sizes)
+        for filename, size in zip(files, sizes):
+            if total <= self.max_bytes:
+                break
+            logger.info("Deleting old raw signal chunk %s", filename)
+            os.remove(filename)
+            total -= size
+            self.chunks_deleted += 1
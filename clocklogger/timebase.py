@@ -0,0 +1,123 @@
+from collections import deque
+from datetime import datetime, timedelta
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class TimeBase(object):
+    """Map a running sample counter to wall-clock (UTC) time.
+
+    The mapping is anchored by observations of the time at which particular
+    samples were captured. When PortAudio gives hardware (ADC) timestamps,
+    which are on the stream's own clock, the mapping is anchored once on
+    that clock, and only the offset between the stream clock and the wall
+    clock is found from the wall-clock readings, averaged over many blocks
+    so the jitter of the callback doesn't reach the sample times. Otherwise
+    the anchor and sample rate are found from a least-squares fit of noisy
+    wall-clock readings against the sample counter. The sample rate can
+    also be calibrated against the PPS signal, which tracks the sound
+    card's clock drift.
+
+    Converting a sample number to a time is then simple arithmetic.
+    """
+
+    def __init__(self, fs, window=200, interval=1.0, min_fit_span=60.0,
+                 pps_smoothing=0.1):
+        self.fs = fs
+        self.rate = float(fs)      # estimated actual sample rate
+        self.pps_rate = None       # sample rate measured against PPS
+        self.pps_smoothing = pps_smoothing
+        self.min_fit_span = min_fit_span
+        self.interval = interval   # minimum time between stored observations
+        self.observations = deque(maxlen=window)
+        self.hardware = False      # whether anchored by ADC timestamps
+        self.anchor_sample = None
+        self.anchor_time = None    # seconds since epoch, or on the stream clock
+        self.clock_offsets = deque(maxlen=window)  # wall clock - stream clock
+        self.clock_offset = 0.0
+
+    @property
+    def drift_ppm(self):
+        """Sound card clock error, in parts per million"""
+        return 1e6 * (self.rate / self.fs - 1)
+
+    def observe_adc(self, sample_index, adc_time, stream_time=None, wall_time=None):
+        """Record the hardware capture time of a sample on the stream clock,
+        and optionally a reading of the stream clock (``stream_time``) taken
+        at wall-clock time ``wall_time`` (seconds since epoch). Without
+        readings, the stream clock is taken to be the wall clock."""
+        if not self.hardware:
+            logger.info("Using hardware ADC timestamps")
+            self.hardware = True
+            self.observations.clear()
+            self.anchor_sample = sample_index
+            self.anchor_time = adc_time
+        if self._add_observation(sample_index, adc_time):
+            self._fit_rate()
+        if stream_time is not None:
+            self.clock_offsets.append(wall_time - stream_time)
+            self.clock_offset = sum(self.clock_offsets) / len(self.clock_offsets)
+
+    def observe(self, sample_index, timestamp):
+        """Record a (noisy) wall-clock reading of the time a sample was captured.
+
+        Ignored once hardware timestamps are available.
+        """
+        if self.hardware or not self._add_observation(sample_index, timestamp):
+            return
+        self._fit_rate()
+
+        # Least-squares offset for the current rate, anchored at the latest
+        # observation to keep extrapolation short
+        n, t = self._observation_arrays()
+        offset = np.mean(t - n / self.rate)
+        n0, t0 = self.observations[0]
+        self.anchor_sample = sample_index
+        self.anchor_time = t0 + offset + (sample_index - n0) / self.rate
+
+    def observe_pps_rate(self, samples_per_second):
+        """Update the sample rate measured from the interval between PPS edges"""
+        if self.pps_rate is None:
+            self.pps_rate = float(samples_per_second)
+        else:
+            self.pps_rate += self.pps_smoothing * (samples_per_second - self.pps_rate)
+        self.rate = self.pps_rate
+
+    def _add_observation(self, sample_index, timestamp):
+        if self.observations and timestamp - self.observations[-1][1] < self.interval:
+            return False
+        self.observations.append((sample_index, timestamp))
+        return True
+
+    def _fit_rate(self):
+        """Estimate the sample rate from the observations, unless calibrated
+        against PPS or the observations don't yet span long enough"""
+        if self.pps_rate is not None:
+            return
+        n, t = self._observation_arrays()
+        if t[-1] - t[0] >= self.min_fit_span:
+            self.rate = 1.0 / np.polyfit(n, t, 1)[0]
+
+    def _observation_arrays(self):
+        """Observations relative to the oldest one, for a well-conditioned fit"""
+        n0, t0 = self.observations[0]
+        obs = np.array(self.observations)
+        return obs[:, 0] - n0, obs[:, 1] - t0
+
+    def timestamp_at(self, sample_index):
+        """Time (seconds since epoch) at which sample ``sample_index`` was captured"""
+        if self.anchor_sample is None:
+            return None
+        t = self.anchor_time + (sample_index - self.anchor_sample) / self.rate
+        return t + self.clock_offset if self.hardware else t
+
+    def time_at(self, sample_index):
+        """Time (UTC datetime) at which sample ``sample_index`` was captured"""
+        t = self.timestamp_at(sample_index)
+        if t is None:
+            return None
+        return EPOCH + timedelta(seconds=t)
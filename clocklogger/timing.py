@@ -0,0 +1,200 @@
+"""Timers for the stages of the acquisition and analysis loop.
+
+Code being timed does::
+
+    from .timing import timers
+
+    with timers.time('find_edges'):
+        ...
+
+While ``timers`` is disabled (the default), ``time`` returns a shared
+context manager which does nothing, so the cost is one method call. When
+enabled, each stage keeps a count, total, min and max, and a histogram of
+durations in buckets a quarter of a decade wide, from which quantiles are
+estimated. ``snapshot`` gives all of this as a dict, and ``start_export``
+writes it to a JSON file periodically (it is also served at ``/metrics``
+by the query server).
+"""
+
+import os
+import os.path
+import json
+import math
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets: 4 per decade from 1 us to 100 s
+BUCKETS_PER_DECADE = 4
+MIN_EXPONENT = -6
+NUM_BUCKETS = 8 * BUCKETS_PER_DECADE + 1
+
+
+def bucket_upper_bound(i):
+    return 10 ** (MIN_EXPONENT + i / BUCKETS_PER_DECADE)
+
+
+class StageTimer(object):
+    """Statistics and histogram of the durations of one stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = [0] * NUM_BUCKETS
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if duration < self.min:
+            self.min = duration
+        if duration > self.max:
+            self.max = duration
+        if duration > 0:
+            i = math.ceil((math.log10(duration) - MIN_EXPONENT) * BUCKETS_PER_DECADE)
+            i = min(max(i, 0), NUM_BUCKETS - 1)
+        else:
+            i = 0
+        self.buckets[i] += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                if i == NUM_BUCKETS - 1:
+                    return self.max  # the last bucket has no upper bound
+                return min(bucket_upper_bound(i), self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min if self.count else None,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'histogram': {'%.3g' % bucket_upper_bound(i): n
+                          for i, n in enumerate(self.buckets) if n},
+        }
+
+
+class _Timing(object):
+    __slots__ = ('timer', 'start')
+
+    def __init__(self, timer):
+        self.timer = timer
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(time.perf_counter() - self.start)
+        return False
+
+
+class _NullTiming(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMING = _NullTiming()
+
+
+class Timers(object):
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.export_thread = None
+        self.export_stop = threading.Event()
+
+    def time(self, name):
+        """Context manager timing one run of stage ``name``"""
+        if not self.enabled:
+            return NULL_TIMING
+        timer = self.stages.get(name)
+        if timer is None:
+            with self.lock:
+                timer = self.stages.setdefault(name, StageTimer(name))
+        return _Timing(timer)
+
+    def add(self, name, duration):
+        """Record a duration measured elsewhere"""
+        if not self.enabled:
+            return
+        timer = self.stages.get(name)
+        if timer is None:
+            with self.lock:
+                timer = self.stages.setdefault(name, StageTimer(name))
+        timer.add(duration)
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.started = time.time()
+
+    def snapshot(self):
+        with self.lock:
+            stages = list(self.stages.values())
+        return {
+            'enabled': self.enabled,
+            'since': self.started,
+            'stages': {timer.name: timer.snapshot() for timer in stages},
+        }
+
+    def write(self, filename):
+        """Write a snapshot to ``filename`` as JSON (replacing it atomically)"""
+        directory = os.path.dirname(filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp = filename + '.tmp'
+        with open(tmp, 'wt') as f:
+            json.dump(self.snapshot(), f, indent=1, sort_keys=True)
+        os.replace(tmp, filename)
+
+    def start_export(self, filename, interval=60.0):
+        """Write a snapshot to ``filename`` every ``interval`` seconds on a
+        background thread, and once more when ``stop_export`` is called"""
+        def run():
+            while not self.export_stop.wait(interval):
+                self._export(filename)
+            self._export(filename)
+        self.export_stop.clear()
+        self.export_thread = threading.Thread(target=run, name='metrics')
+        self.export_thread.daemon = True
+        self.export_thread.start()
+
+    def stop_export(self):
+        if self.export_thread is not None:
+            self.export_stop.set()
+            self.export_thread.join()
+            self.export_thread = None
+
+    def _export(self, filename):
+        try:
+            self.write(filename)
+        except OSError as err:
+            logger.error("Could not write metrics to %s: %s", filename, err)
+
+
+# Shared by everything in the logger
+timers = Timers()
@@ -1,9 +1,13 @@
+import os
 import time
 import argparse
 import logging
 from datetime import datetime
 from .source.weather import WeatherStationDataSource
+from .output import exit_on_sigterm
+from .output.dispatch import WriterDispatcher, writer_policy_for
 from .output.textfile import TextFileWriter
+from .output.retry import RetryingWriter
 from .output.influxdb import InfluxDBWriter
 # from .output.tempodb import TempoDBWriter
 
@@ -15,14 +19,10 @@ def round_time_to_interval(t, interval):
                      microsecond=0)
 
 
-def process(source, writers):
+def process(source, dispatcher):
     data = source.get_measurements()
     data['time'] = round_time_to_interval(datetime.utcnow(), 30)  # TODO: interval
-    for writer in writers:
-        try:
-            writer.write(data)
-        except Exception as e:
-            logger.error("Writer error [%s]: %s", writer.__class__, e)
+    dispatcher.write(data)
 
 
 def sleep_til_next_time(interval):
@@ -57,14 +57,29 @@ def main():
             writers.append(cls(*args))
         except Exception as err:
             logger.error("Error creating %s: %s", cls, err)
+    def add_remote_writer(cls, *args):
+        # Batched and retried, keeping a backlog on disk while the service is down
+        overflow = 'data/retry/weather-%s.pickle' % cls.__name__
+        try:
+            writers.append(RetryingWriter(cls(*args), overflow=overflow))
+        except Exception as err:
+            logger.error("Error creating %s: %s", cls, err)
     add_writer(TextFileWriter, 'data', 'weather', columns)
-    #add_writer(InfluxDBWriter, 'weather', columns)
-    #add_writer(TempoDBWriter, 'weather', columns)
+    if 'INFLUXDB_HOST' in os.environ:
+        add_remote_writer(InfluxDBWriter, 'weather', columns, os.environ['INFLUXDB_HOST'])
+    #add_remote_writer(TempoDBWriter, 'weather', columns)
+
+    dispatcher = WriterDispatcher(writers, policy=writer_policy_for, spill_dir='data/spill',
+                                  prefix='weather-')
 
     # Read data & output
-    while True:
-        process(source, writers)
-        sleep_til_next_time(interval)
+    exit_on_sigterm()
+    try:
+        while True:
+            process(source, dispatcher)
+            sleep_til_next_time(interval)
+    finally:
+        dispatcher.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+import unittest
+import os
+import os.path
+from tempfile import mkdtemp
+import shutil
+from datetime import datetime, date, timedelta
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from clocklogger.output.binary import (BinaryFileWriter, BinaryFileReader,
+                                       convert_text_archive, record_dtype)
+from clocklogger.output.textfile import TextFileWriter
+
+
+class BinaryFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.writer = BinaryFileWriter(self.path, 'prefix')
+        self.reader = BinaryFileReader(self.path, 'prefix')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _write(self, writer, start, n):
+        for i in range(n):
+            writer.write({'time': start + timedelta(seconds=3 * i),
+                          'drift': 0.5 + i, 'amplitude': np.float64(46 + i)})
+
+    def test_writes_daily_files_readable_with_memmap(self):
+        self._write(self.writer, datetime(2014, 2, 3, 23, 59, 54), 4)
+        self.writer.close()
+
+        filename = os.path.join(self.path, '2014/02/prefix2014-02-03.bin')
+        records = np.memmap(filename, dtype=record_dtype(), mode='r')
+        assert_array_equal(records['time'], [1391471994, 1391471997])
+        assert_array_equal(records['drift'], [0.5, 1.5])
+        self.assertEqual(os.path.getsize(filename), 2 * 24)
+
+        records = self.reader.day(date(2014, 2, 4))
+        assert_array_equal(records['amplitude'], [48, 49])
+
+    def test_load_date_range(self):
+        self._write(self.writer, datetime(2014, 2, 3), 3 * 28800)
+        self.writer.close()
+        records = self.reader.load(datetime(2014, 2, 3, 12), datetime(2014, 2, 5, 1))
+        self.assertEqual(len(records), 14400 + 28800 + 1200)
+        self.assertEqual(records['time'][0], 1391428800)
+        self.assertTrue(np.all(np.diff(records['time']) == 3))
+        self.assertEqual(len(self.reader.load(date(2014, 2, 1), date(2014, 2, 3))), 0)
+        self.assertEqual(len(self.reader.load(date(2014, 2, 3), date(2014, 2, 6))), 3 * 28800)
+
+    def test_partial_record_is_dropped_on_append(self):
+        self._write(self.writer, datetime(2014, 2, 3), 2)
+        self.writer.close()
+        filename = os.path.join(self.path, '2014/02/prefix2014-02-03.bin')
+        with open(filename, 'ab') as f:
+            f.write(b'\0' * 10)  # interrupted write
+        self.assertEqual(len(self.reader.day(date(2014, 2, 3))), 2)
+
+        writer = BinaryFileWriter(self.path, 'prefix')
+        self._write(writer, datetime(2014, 2, 3, 1), 1)
+        writer.close()
+        assert_array_equal(self.reader.day(date(2014, 2, 3))['time'],
+                           [1391385600, 1391385603, 1391389200])
+
+    def test_convert_text_archive(self):
+        text_path = os.path.join(self.path, 'text')
+        text = TextFileWriter(text_path, 'clock', ['time', 'drift', 'amplitude'])
+        self._write(text, datetime(2014, 2, 3, 23, 59, 54), 4)
+        text.close()
+
+        binary_path = os.path.join(self.path, 'binary')
+        for repeat in range(2):
+            self.assertEqual(convert_text_archive(text_path, binary_path), 4)
+        records = BinaryFileReader(binary_path, 'clock').load(
+            date(2014, 2, 3), date(2014, 2, 5))
+        assert_array_equal(records['time'], 1391471994 + 3 * np.arange(4))
+        assert_array_equal(records['drift'], [0.5, 1.5, 2.5, 3.5])
+        assert_array_equal(records['amplitude'], [46, 47, 48, 49])
+
+
+if __name__ == '__main__':
+    unittest.main()
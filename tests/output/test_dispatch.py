@@ -0,0 +1,190 @@
+import unittest
+from mock import MagicMock
+import os.path
+from tempfile import mkdtemp
+import shutil
+import threading
+import time
+
+from clocklogger.output.dispatch import (WriterWorker, WriterDispatcher, writer_policy_for,
+                                         DROP_OLDEST, BLOCK, SPILL)
+from clocklogger.output.textfile import TextFileWriter
+
+
+class SlowWriter(object):
+    """Writer which waits until released"""
+
+    def __init__(self):
+        self.records = []
+        self.release = threading.Event()
+        self.blocked = threading.Event()
+        self.closed = False
+
+    def write(self, data):
+        self.blocked.set()
+        self.release.wait()
+        self.records.append(data)
+
+    def close(self):
+        self.closed = True
+
+
+class WriterWorkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.writer = SlowWriter()
+
+    def tearDown(self):
+        self.writer.release.set()
+        shutil.rmtree(self.path)
+
+    def _fill(self, worker, n):
+        for i in range(n):
+            worker.put(i)
+
+    def test_writes_in_background(self):
+        worker = WriterWorker(self.writer, max_queue=10)
+        self._fill(worker, 5)
+        self.assertEqual(self.writer.records, [])
+        self.writer.release.set()
+        worker.close()
+        self.assertEqual(self.writer.records, list(range(5)))
+        metrics = worker.metrics()
+        self.assertEqual(metrics['written'], 5)
+        self.assertEqual(metrics['depth'], 0)
+        self.assertGreater(metrics['max_depth'], 3)
+        self.assertGreaterEqual(metrics['latency_max'], metrics['latency_mean'])
+
+    def test_drop_oldest(self):
+        worker = WriterWorker(self.writer, max_queue=3, policy=DROP_OLDEST)
+        self._fill(worker, 10)
+        # One record may already be with the writer
+        self.assertIn(worker.dropped, (6, 7))
+        self.writer.release.set()
+        worker.close()
+        self.assertEqual(self.writer.records[-3:], [7, 8, 9])
+        self.assertEqual(len(self.writer.records) + worker.dropped, 10)
+
+    def test_block(self):
+        worker = WriterWorker(self.writer, max_queue=2, policy=BLOCK)
+        thread = threading.Thread(target=self._fill, args=(worker, 10))
+        thread.start()
+        time.sleep(0.1)
+        self.assertTrue(thread.is_alive())
+        self.writer.release.set()
+        thread.join()
+        worker.close()
+        self.assertEqual(self.writer.records, list(range(10)))
+        self.assertEqual(worker.dropped, 0)
+
+    def test_spill_keeps_order_and_survives_restart(self):
+        worker = WriterWorker(self.writer, 'test', max_queue=2, policy=SPILL,
+                              spill_dir=self.path)
+        self._fill(worker, 10)
+        self.assertGreaterEqual(worker.spilled, 7)
+        # One record is held by the blocked writer
+        self.assertTrue(self.writer.blocked.wait(1.0))
+        self.assertEqual(worker.depth + len(self.writer.records) + 1, 10)
+        self.assertTrue(os.path.exists(os.path.join(self.path, 'test.spill')))
+
+        # Stop without writing anything: a new worker picks up what was left
+        # on disk (the queued records in memory are lost)
+        worker.close(timeout=0.1)
+        writer2 = MagicMock()
+        worker2 = WriterWorker(writer2, 'test', max_queue=2, policy=SPILL,
+                               spill_dir=self.path)
+        self.assertGreaterEqual(worker2.depth, 7)
+        worker2.close()
+        written = [args[0] for args, kwargs in writer2.write.call_args_list]
+        self.assertEqual(written, list(range(10 - len(written), 10)))
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'test.spill')))
+
+    def test_spill_drains_in_order(self):
+        worker = WriterWorker(self.writer, 'test', max_queue=2, policy=SPILL,
+                              spill_dir=self.path)
+        self._fill(worker, 5)
+        self.writer.release.set()
+        self._fill(worker, 5)
+        worker.close()
+        self.assertEqual(self.writer.records, list(range(5)) + list(range(5)))
+
+    def test_writer_errors_are_counted(self):
+        writer = MagicMock()
+        writer.write.side_effect = [ValueError('oops'), None]
+        worker = WriterWorker(writer)
+        self._fill(worker, 2)
+        worker.close()
+        self.assertEqual(worker.errors, 1)
+        self.assertEqual(worker.written, 1)
+
+    def test_idle_worker_flushes_buffered_writer(self):
+        writer = MagicMock()
+        flushed = threading.Event()
+        writer.flush_if_due.side_effect = flushed.set
+        worker = WriterWorker(writer)
+        self.assertTrue(flushed.wait(2.0))
+        worker.close()
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            WriterWorker(self.writer, policy='shred')
+        with self.assertRaises(ValueError):
+            WriterWorker(self.writer, policy=SPILL)
+
+
+class WriterDispatcherTestCase(unittest.TestCase):
+    def test_slow_writer_does_not_hold_up_others(self):
+        slow = SlowWriter()
+        fast = MagicMock()
+        dispatcher = WriterDispatcher([slow, fast], max_queue=100, prefix='clock-')
+        t0 = time.monotonic()
+        for i in range(50):
+            dispatcher.write({'n': i})
+        self.assertLess(time.monotonic() - t0, 0.5)
+        time.sleep(0.1)
+        self.assertEqual(fast.write.call_count, 50)
+        self.assertEqual(slow.records, [])
+
+        metrics = dispatcher.metrics()
+        self.assertEqual(sorted(metrics), ['clock-MagicMock', 'clock-SlowWriter'])
+        self.assertEqual(metrics['clock-MagicMock']['written'], 50)
+        self.assertGreater(metrics['clock-SlowWriter']['depth'], 40)
+
+        slow.release.set()
+        dispatcher.close()
+        self.assertEqual(len(slow.records), 50)
+        self.assertTrue(slow.closed)
+        self.assertTrue(fast.close.called)
+
+    def test_policy_for_each_writer(self):
+        slow = SlowWriter()
+        fast = MagicMock()
+        dispatcher = WriterDispatcher(
+            [slow, fast], policy=lambda writer: BLOCK if writer is slow else DROP_OLDEST)
+        self.assertEqual([worker.policy for worker in dispatcher.workers],
+                         [BLOCK, DROP_OLDEST])
+        slow.release.set()
+        dispatcher.close()
+
+    def test_local_files_block(self):
+        path = mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.assertEqual(writer_policy_for(TextFileWriter(path, 'weather')), BLOCK)
+        self.assertEqual(writer_policy_for(MagicMock()), DROP_OLDEST)
+
+    def test_close_gives_up_on_stuck_writer(self):
+        stuck = SlowWriter()
+        fast = MagicMock()
+        dispatcher = WriterDispatcher([stuck, fast], max_queue=2, close_timeout=0.2)
+        for i in range(5):
+            dispatcher.write({'n': i})
+        t0 = time.monotonic()
+        dispatcher.close()
+        self.assertLess(time.monotonic() - t0, 1.0)
+        self.assertFalse(stuck.closed)
+        self.assertTrue(fast.close.called)
+        stuck.release.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import unittest
+import os.path
+from tempfile import mkdtemp
+import shutil
+import threading
+import base64
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from clocklogger.output.influxdb import InfluxDBWriter, InfluxDBError, encode_point
+from clocklogger.output.retry import RetryingWriter
+
+
+class StandInInfluxDB(ThreadingHTTPServer):
+    """Local HTTP server which records write requests"""
+
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self):
+        self.requests = []
+        self.status = 204
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), RecordingHandler)
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def lines(self):
+        return [line for request in self.requests
+                for line in request['body'].splitlines()]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        url = urlparse(self.path)
+        self.server.requests.append({
+            'path': url.path,
+            'query': parse_qs(url.query),
+            'headers': dict(self.headers),
+            'body': body,
+            'client_port': self.client_address[1],
+        })
+        status = self.server.status
+        message = b'' if status == 204 else b'{"error":"nope"}'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(message)))
+        self.end_headers()
+        self.wfile.write(message)
+
+    def log_message(self, *args):
+        pass
+
+
+class InfluxDBWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInInfluxDB()
+        self.path = mkdtemp()
+        self.journal = os.path.join(self.path, 'influxdb.journal')
+        self.t = datetime(2014, 2, 3, 10, 30, 0)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.path)
+
+    def _make_writer(self, **kwargs):
+        kwargs.setdefault('journal', self.journal)
+        return InfluxDBWriter('pendulum', ['time', 'drift', 'amplitude'],
+                              port=self.server.port, **kwargs)
+
+    def _write(self, writer, n):
+        for i in range(n):
+            writer.write({'time': self.t, 'drift': 0.25, 'amplitude': 46.0})
+            self.t += timedelta(seconds=3)
+
+    def test_encode_point(self):
+        data = {'time': datetime(2014, 2, 3), 'drift': -1.5, 'amplitude': float('nan'),
+                'odd key': 2}
+        self.assertEqual(encode_point('clock', data, ['time', 'drift', 'amplitude']),
+                         'clock drift=-1.5 1391385600')
+        self.assertEqual(encode_point('a,b', data, ['odd key']),
+                         'a\\,b odd\\ key=2.0 1391385600')
+        self.assertIsNone(encode_point('clock', data, ['time', 'amplitude']))
+        self.assertEqual(encode_point('clock', data, ['time', 'drift'], 'weather.'),
+                         'clock weather.drift=-1.5 1391385600')
+
+    def test_batches_by_count_over_one_connection(self):
+        writer = self._make_writer(batch_size=10, username='user', password='pw')
+        self._write(writer, 25)
+        self.assertEqual(len(self.server.requests), 2)
+        writer.close()
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.server.lines), 25)
+        # The same schema as the old client library's writes
+        self.assertEqual(self.server.lines[0],
+                         'clock pendulum.drift=0.25,pendulum.amplitude=46.0 1391423400')
+        self.assertEqual(writer.points_sent, 25)
+
+        request = self.server.requests[0]
+        self.assertEqual(request['path'], '/write')
+        self.assertEqual(request['query'], {'db': ['clock'], 'precision': ['s']})
+        self.assertEqual(request['headers']['Authorization'],
+                         'Basic ' + base64.b64encode(b'user:pw').decode('ascii'))
+        # One HTTP session for all the requests
+        self.assertEqual(len(set(r['client_port'] for r in self.server.requests)), 1)
+
+    def test_batches_by_age(self):
+        writer = self._make_writer(batch_size=1000, max_age=30)
+        self._write(writer, 10)
+        self.assertEqual(len(self.server.requests), 0)
+        self._write(writer, 1)  # 30 seconds after the first point
+        self.assertEqual(len(self.server.lines), 11)
+
+    def test_journal_when_server_is_down(self):
+        writer = self._make_writer(batch_size=5)
+        self.server.status = 503
+        self._write(writer, 12)
+        self.assertEqual(len(self.server.requests), 2)  # second goes straight to journal
+        with open(self.journal) as f:
+            self.assertEqual(len(f.readlines()), 10)
+
+        # Server back again: journal is replayed before the new batch
+        self.server.status = 204
+        self._write(writer, 3)
+        self.assertFalse(os.path.exists(self.journal))
+        times = [int(line.split()[-1]) for line in self.server.lines[-15:]]
+        self.assertEqual(times, sorted(times))
+        self.assertEqual(writer.points_sent, 15)
+
+    def test_journal_replayed_by_new_writer_after_connection_failure(self):
+        self.server.stop()
+        writer = self._make_writer(batch_size=5, timeout=1.0)
+        self._write(writer, 5)
+        self.assertTrue(os.path.exists(self.journal))
+
+        self.server = StandInInfluxDB()
+        writer = self._make_writer(batch_size=5, max_request_lines=3)
+        self._write(writer, 5)
+        self.assertEqual(len(self.server.lines), 10)
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertFalse(os.path.exists(self.journal))
+
+    def test_rejected_points_are_not_journalled(self):
+        writer = self._make_writer(batch_size=5)
+        self.server.status = 400
+        with self.assertRaises(InfluxDBError):
+            self._write(writer, 5)
+        self.assertFalse(os.path.exists(self.journal))
+
+    def test_without_journal_errors_are_raised(self):
+        writer = self._make_writer(batch_size=5, journal=None)
+        self.server.status = 500
+        with self.assertRaises(InfluxDBError):
+            self._write(writer, 5)
+
+    def test_behind_retrying_writer(self):
+        clock = [1000.0]
+        writer = RetryingWriter(self._make_writer(journal=None), batch_size=5,
+                                initial_delay=10, clock=lambda: clock[0])
+        self.server.status = 503
+        self._write(writer, 7)
+        self.assertEqual(writer.pending, 7)
+        self.server.status = 204
+        clock[0] += 10
+        self._write(writer, 3)
+        self.assertEqual(len(self.server.requests), 3)  # one 503, then two batches
+        self.assertEqual(len(self.server.lines), 15)
+        self.assertEqual(writer.pending, 0)
+        writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import unittest
+import mock
+from collections import namedtuple
+import os.path
+from tempfile import mkdtemp
+import shutil
+from datetime import datetime, timedelta
+
+from clocklogger.output.retry import RetryingWriter
+
+
+MockResponse = namedtuple('MockResponse', ['status', 'error'])
+
+
+class MockRemoteWriter(object):
+    """Writer with a mock client, sending batches like TempoDBWriter"""
+
+    def __init__(self):
+        self.client = mock.MagicMock()
+        self.client.write_multi.return_value = MockResponse(200, 'ok')
+        self.sent = []
+
+    def write_batch(self, records):
+        points = [data['n'] for data in records]
+        resp = self.client.write_multi(points)
+        if resp.status != 200:
+            raise Exception("Remote error [%d] %s" % (resp.status, resp.error))
+        self.sent.extend(points)
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RetryingWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.overflow = os.path.join(self.path, 'overflow')
+        self.remote = MockRemoteWriter()
+        self.clock = Clock()
+        self.n = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _make_writer(self, **kwargs):
+        return RetryingWriter(self.remote, clock=self.clock, **kwargs)
+
+    def _write(self, writer, count, interval=3.0):
+        for i in range(count):
+            writer.write({'time': datetime(2014, 2, 3) + timedelta(seconds=3 * self.n),
+                          'n': self.n})
+            self.n += 1
+            self.clock.now += interval
+
+    def _fail(self, fail=True):
+        status = MockResponse(503, 'down') if fail else MockResponse(200, 'ok')
+        self.remote.client.write_multi.return_value = status
+
+    def test_coalesces_records(self):
+        writer = self._make_writer(batch_size=5)
+        self._write(writer, 12)
+        self.assertEqual(self.remote.client.write_multi.call_count, 2)
+        self.assertEqual(self.remote.sent, list(range(10)))
+        self.assertEqual(writer.pending, 2)
+        writer.close()
+        self.assertEqual(self.remote.sent, list(range(12)))
+        self.assertEqual(writer.metrics()['lag_last'], 6.0)
+        self.assertEqual(writer.metrics()['lag_max'], 12.0)
+
+    def test_batch_sent_when_old_enough(self):
+        writer = self._make_writer(batch_size=100, max_age=30)
+        self._write(writer, 10)
+        self.assertEqual(self.remote.sent, [])
+        self._write(writer, 1)
+        self.assertEqual(self.remote.sent, list(range(11)))
+
+    def test_retries_with_exponential_backoff(self):
+        writer = self._make_writer(batch_size=1, initial_delay=10, max_delay=40)
+        self._fail()
+        calls = []
+        for i in range(60):
+            self._write(writer, 1, interval=1.0)
+            calls.append(self.remote.client.write_multi.call_count)
+        # Attempts after 0, 10, 30, 70, 110 seconds...
+        attempts = [i for i in range(60) if i == 0 or calls[i] != calls[i - 1]]
+        self.assertEqual(attempts, [0, 10, 30])
+        self.assertEqual(writer.metrics()['retry_delay'], 40)
+        self.assertEqual(writer.failures, 3)
+        self.assertEqual(writer.pending, 60)
+
+        self._fail(False)
+        self.clock.now += 40
+        self._write(writer, 1)
+        self.assertEqual(self.remote.sent[-61:], list(range(61)))
+        self.assertEqual(writer.pending, 0)
+        self.assertEqual(writer.metrics()['retry_delay'], 0)
+        self.assertEqual(writer.delay, 10)
+
+    def test_bounded_backlog_drops_oldest_without_overflow(self):
+        writer = self._make_writer(batch_size=1, max_backlog=5, initial_delay=1000)
+        self._fail()
+        self._write(writer, 20)
+        self.assertEqual(writer.pending, 5)
+        self.assertEqual(writer.dropped, 15)
+        self._fail(False)
+        writer.close()
+        self.assertEqual(self.remote.sent[-5:], list(range(15, 20)))
+
+    def test_overflow_to_disk(self):
+        writer = self._make_writer(batch_size=4, max_backlog=5, initial_delay=1000,
+                                   overflow=self.overflow)
+        self._fail()
+        self._write(writer, 20)
+        self.assertEqual(len(writer.backlog), 5)
+        self.assertEqual(writer.pending, 20)
+        self.assertTrue(os.path.exists(self.overflow))
+
+        # Still down when closed: everything is saved to disk...
+        writer.close()
+        self.assertEqual(len(writer.backlog), 0)
+
+        # ... and delivered in order by the next writer
+        self._fail(False)
+        self.remote.sent = []
+        writer = self._make_writer(batch_size=4, overflow=self.overflow)
+        self.assertEqual(writer.pending, 20)
+        self._write(writer, 2)
+        self.assertEqual(self.remote.sent, list(range(20)))
+        self.assertFalse(os.path.exists(self.overflow))
+        writer.close()
+        self.assertEqual(self.remote.sent, list(range(22)))
+        # Lag is measured from when the record was first received
+        self.assertEqual(writer.lag_max, 60.0)
+
+    def test_partly_delivered_overflow_is_kept(self):
+        writer = self._make_writer(batch_size=4, max_backlog=2, initial_delay=1,
+                                   overflow=self.overflow)
+        self._fail()
+        self._write(writer, 10)
+        self.remote.client.write_multi.side_effect = [
+            MockResponse(200, 'ok'), MockResponse(503, 'down')]
+        self.clock.now += 100
+        writer.send()
+        self.assertEqual(self.remote.sent[-4:], [0, 1, 2, 3])
+        self.assertEqual(writer.pending, 6)
+        self.remote.client.write_multi.side_effect = None
+        self._fail(False)
+        writer.close()
+        self.assertEqual(self.remote.sent[-6:], [4, 5, 6, 7, 8, 9])
+
+    def test_writer_without_write_batch(self):
+        remote = mock.MagicMock(spec=['write'])
+        writer = RetryingWriter(remote, batch_size=3, clock=self.clock)
+        self._write(writer, 3)
+        self.assertEqual(remote.write.call_count, 3)
+
+    def test_records_written_before_a_failure_are_not_sent_again(self):
+        remote = mock.MagicMock(spec=['write'])
+        remote.write.side_effect = [None, None, Exception("down"), None, None, None]
+        writer = RetryingWriter(remote, batch_size=4, initial_delay=1, clock=self.clock)
+        self._write(writer, 4, interval=0)
+        self.assertEqual(writer.pending, 2)
+        self.assertEqual(writer.delivered, 2)
+        self.clock.now += 10
+        writer.send()
+        sent = [call[0][0]['n'] for call in remote.write.call_args_list]
+        self.assertEqual(sent, [0, 1, 2, 2, 3])
+        self.assertEqual(writer.pending, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
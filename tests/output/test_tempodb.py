@@ -50,3 +50,17 @@ class TempoDBWriterTestCase(unittest.TestCase):
         data = {'time': datetime.now(), 'a': 2.3, 'b': 4.3, 'c': 3.4}
 
         self.assertRaises(Exception, writer.write, data)
+
+    def test_write_batch_method(self):
+        writer = self._make_writer(['a', 'b'])
+        writer.client.write_multi.return_value = MockResponse(200, 'ok')
+        records = [{'time': datetime(2014, 2, 3, 0, 0, 3 * i), 'a': i, 'b': -i}
+                   for i in range(3)]
+        writer.write_batch(records)
+
+        # One request for all the records
+        args, kwargs = writer.client.write_multi.call_args
+        self.assertEqual(writer.client.write_multi.call_count, 1)
+        self.assertEqual(len(args[0]), 6)
+        self.assertEqual(set([point.t for point in args[0]]),
+                         set([data['time'] for data in records]))
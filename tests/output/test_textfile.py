@@ -2,11 +2,13 @@ import unittest
 from mock import patch, mock_open, call, MagicMock
 import os
 import os.path
+import signal
 from tempfile import mkdtemp
 import shutil
 from datetime import datetime, timedelta
 import numpy as np
 
+from clocklogger.output import exit_on_sigterm, close_writers
 from clocklogger.output.textfile import TextFileWriter
 
 
@@ -86,3 +88,94 @@ class TextFileWriterTestCase(unittest.TestCase):
         filename = os.path.join(self.path, '1970/01/prefix-1970-01-01.txt')
         with open(filename) as f:
             self.assertEqual(f.readlines(), expected_output)
+
+
+class BufferedTextFileWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.filename = os.path.join(self.path, '2014/02/prefix2014-02-03.txt')
+        self.data = {'time': datetime(2014, 2, 3, 23, 59, 51), 'a': 2.5}
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _write(self, writer, n):
+        for i in range(n):
+            writer.write(self.data)
+            self.data['time'] += timedelta(seconds=3)
+
+    def _read(self, filename=None):
+        with open(filename or self.filename) as f:
+            return f.readlines()
+
+    def test_unbuffered_by_default(self):
+        writer = TextFileWriter(self.path, 'prefix', ['time', 'a'])
+        self._write(writer, 1)
+        self.assertEqual(self._read(), ["1391471991 2.500000\n"])
+
+    def test_flushes_after_record_count(self):
+        writer = TextFileWriter(self.path, 'prefix', ['time', 'a'], flush_records=2)
+        self._write(writer, 1)
+        self.assertEqual(self._read(), [])
+        self._write(writer, 1)
+        self.assertEqual(len(self._read()), 2)
+
+    def test_flushes_after_interval(self):
+        writer = TextFileWriter(self.path, 'prefix', ['time', 'a'], flush_interval=6)
+        with patch('clocklogger.output.textfile.monotonic') as monotonic:
+            monotonic.return_value = 100.0
+            self._write(writer, 1)
+            # Going by the wall clock, not the records' timestamps
+            monotonic.return_value = 105.0
+            self._write(writer, 1)
+            self.assertEqual(self._read(), [])
+            monotonic.return_value = 106.0
+            self._write(writer, 1)
+            self.assertEqual(len(self._read()), 3)
+
+    def test_flush_if_due_without_new_records(self):
+        writer = TextFileWriter(self.path, 'prefix', ['time', 'a'], flush_interval=6)
+        with patch('clocklogger.output.textfile.monotonic') as monotonic:
+            monotonic.return_value = 100.0
+            self._write(writer, 2)
+            writer.flush_if_due()
+            self.assertEqual(self._read(), [])
+            monotonic.return_value = 106.0
+            writer.flush_if_due()
+            self.assertEqual(len(self._read()), 2)
+
+    def test_flushes_when_date_changes_and_on_close(self):
+        writer = TextFileWriter(self.path, 'prefix', ['time', 'a'], flush_records=100)
+        self._write(writer, 5)
+        # Records before midnight are flushed when the next file is opened
+        self.assertEqual(len(self._read()), 3)
+        filename2 = os.path.join(self.path, '2014/02/prefix2014-02-04.txt')
+        self.assertEqual(self._read(filename2), [])
+        writer.close()
+        self.assertEqual(len(self._read(filename2)), 2)
+        self.assertIsNone(writer.file)
+
+    def test_fsync(self):
+        writer = TextFileWriter(self.path, 'prefix', ['time', 'a'],
+                                flush_records=2, fsync=True)
+        with patch('clocklogger.output.textfile.os.fsync') as fsync:
+            self._write(writer, 1)
+            self.assertFalse(fsync.called)
+            self._write(writer, 1)
+            fsync.assert_called_once_with(writer.file.fileno())
+
+    def test_sigterm_flushes_buffer(self):
+        writer = TextFileWriter(self.path, 'prefix', ['time', 'a'], flush_records=100)
+        previous = signal.getsignal(signal.SIGTERM)
+        try:
+            exit_on_sigterm()
+            with self.assertRaises(SystemExit):
+                try:
+                    self._write(writer, 2)
+                    os.kill(os.getpid(), signal.SIGTERM)
+                    self._write(writer, 1)
+                finally:
+                    close_writers([writer])
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+        self.assertEqual(len(self._read()), 2)
@@ -0,0 +1,224 @@
+import unittest
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from clocklogger.analysis import (ClockAnalyser, DataError, schmitt_edges,
+                                  decay_fit_projector, interpolate_crossings,
+                                  raw_threshold, negate, INT16_SCALE)
+from clocklogger.recording import float_to_int16
+from clocklogger.synthetic import clock_signal, SyntheticDataSource
+
+
+class MockSource(object):
+    CHANNEL_TICK = 0
+    CHANNEL_PPS = 1
+    fs = 1000
+
+
+def records(source):
+    """Records of ``source`` with fitted decays, starting again after
+    errors like the logger"""
+    source.i = 0
+    analyser = ClockAnalyser(source)
+    out = []
+    while True:
+        try:
+            out.extend(analyser.process(pps_edge='down', fit_decay=True))
+            return out
+        except DataError:
+            pass
+
+
+class EdgeDetectionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.analyser = ClockAnalyser(MockSource())
+
+    def test_finds_positive_and_negative_edges(self):
+        y = np.zeros(200)
+        y[50:60] = 0.5
+        y[120:130] = -0.5
+        i_pos, i_neg = self.analyser.find_edges(y)
+        assert_array_equal(i_pos, [49])
+        assert_array_equal(i_neg, [119])
+
+    def test_debounce_is_measured_from_accepted_edges(self):
+        # 20 ms debounce interval at 1 kHz
+        edges = np.array([0, 5, 15, 21, 30, 40, 41, 70])
+        assert_array_equal(self.analyser.debounce(edges), [0, 21, 41, 70])
+        assert_array_equal(self.analyser.debounce(np.array([], dtype=int)), [])
+
+    def test_hysteresis_ignores_chatter_around_level(self):
+        y = np.zeros(200)
+        y[50:100:2] = 0.12   # signal chattering around the threshold
+        y[51:100:2] = 0.08
+        y[150] = 0.5
+        self.analyser.debounce_interval = 0.002
+        self.assertEqual(len(self.analyser.find_edges(y)[0]), 26)
+
+        self.analyser.edge_hysteresis = 0.05
+        i_pos, i_neg = self.analyser.find_edges(y)
+        assert_array_equal(i_pos, [49, 149])
+
+    def test_schmitt_edges(self):
+        on = np.array([0, 1, 0, 0, 1, 1, 0, 0, 0, 1], dtype=bool)
+        off = np.array([1, 0, 0, 1, 0, 0, 0, 1, 0, 0], dtype=bool)
+        assert_array_equal(schmitt_edges(on), [0, 3, 8])
+        assert_array_equal(schmitt_edges(on, off), [0, 3, 8])
+        off[3] = False
+        assert_array_equal(schmitt_edges(on, off), [0, 8])
+
+    def test_ringing_signal(self):
+        source = MockSource()
+        source.fs = 44100
+        analyser = ClockAnalyser(source)
+        y = clock_signal(44100, 6.0, noise=0.0001, ringing=1.0, seed=1)
+        i_pos, i_neg = analyser.find_edges(y[:, MockSource.CHANNEL_PPS])
+        self.assertEqual(len(i_pos), 6)
+        self.assertEqual(len(i_neg), 6)
+        assert_array_equal(np.round(np.diff(i_pos) / 44100.0), 1)
+
+
+
+class DecayFitTestCase(unittest.TestCase):
+    def setUp(self):
+        self.analyser = ClockAnalyser(MockSource())
+        self.analyser.decay_fit_duration = 0.05
+        self.analyser.decay_fit_delay = 0.003
+
+    def _decays(self, edges, tau=0.008, sign=1):
+        t = np.arange(1000) / 1000.0
+        y = np.zeros_like(t)
+        for i in edges:
+            y[i + 1:] += sign * 0.8 * np.exp(-(t[i + 1:] - t[i]) / tau)
+        return y
+
+    def test_finds_threshold_crossing_of_fitted_decay(self):
+        y = self._decays([100, 400])
+        refined = self.analyser.fit_decays(y, np.array([100, 400]))
+        # 0.8 exp(-t / 8 ms) crosses 0.5 after 3.76 ms
+        np.testing.assert_allclose(refined, [103.76, 403.76], atol=0.01)
+
+    def test_negative_edges(self):
+        y = self._decays([100, 400], sign=-1)
+        refined = self.analyser.fit_decays(y, np.array([100, 400]), sign=-1)
+        np.testing.assert_allclose(refined, [103.76, 403.76], atol=0.01)
+
+    def test_non_positive_samples_are_masked(self):
+        y = self._decays([100, 400])
+        y[130:140] = -0.01    # a glitch in the first segment
+        y[403:460] = 0        # the second segment is lost entirely
+        refined = self.analyser.fit_decays(y, np.array([100, 400]))
+        np.testing.assert_allclose(refined, [103.76, np.nan], atol=0.01)
+
+    def test_groups_with_unfitted_ticks_are_dropped(self):
+        source = SyntheticDataSource(8000, 30.0, seed=3, noise=0.001, rise=1e-4)
+        clean = records(source)
+        i_pos, i_neg = ClockAnalyser(source).find_edges(source.y[:, 0])
+        for i in i_pos[[4, 9]]:
+            source.y[i + 20:i + 430, 0] = 0    # the decays are lost
+        corrupted = records(source)
+        self.assertEqual(len(corrupted), len(clean) - 3)
+        drifts = {data['time']: data['drift'] for data in clean}
+        for data in corrupted:
+            self.assertEqual(data['drift'], drifts[data['time']])
+
+    def test_fits_far_from_edge_are_ignored(self):
+        # A small, slowly decaying segment (like noise) crosses the
+        # threshold long before the edge
+        y = self._decays([100])
+        y[403:453] = 0.01 * np.exp(-np.arange(50) / 500.0)
+        refined = self.analyser.fit_decays(y, np.array([100, 400]))
+        np.testing.assert_allclose(refined, [103.76, np.nan], atol=0.01)
+
+    def test_edges_without_complete_segment_are_dropped(self):
+        y = self._decays([100, 980])
+        self.assertEqual(len(self.analyser.fit_decays(y, np.array([100, 980]))), 1)
+        self.assertEqual(len(self.analyser.fit_decays(y, np.array([], dtype=int))), 0)
+
+    def test_projector_is_cached(self):
+        self.assertIs(decay_fit_projector(50), decay_fit_projector(50))
+
+
+class EdgeInterpolationTestCase(unittest.TestCase):
+    def test_linear(self):
+        y = np.r_[np.zeros(10), np.linspace(0, 1, 11), np.ones(10)]
+        assert_array_equal(schmitt_edges(y > 0.25), [12])
+        np.testing.assert_allclose(interpolate_crossings(y, [12], 0.25), [12.5])
+        np.testing.assert_allclose(interpolate_crossings(-y, [12], 0.25, sign=-1), [12.5])
+
+    def test_cubic_is_exact_for_cubics(self):
+        x = np.arange(10.0)
+        y = 0.01 * (x - 2) ** 3 + 0.1 * x
+        true = 4.4
+        level = 0.01 * (true - 2) ** 3 + 0.1 * true
+        i = np.flatnonzero(y > level)[0] - 1
+        self.assertNotAlmostEqual(interpolate_crossings(y, [i], level)[0], true, places=3)
+        self.assertAlmostEqual(interpolate_crossings(y, [i], level, 'cubic')[0], true, places=5)
+
+    def test_cubic_falls_back_to_linear_at_ends(self):
+        y = np.array([0.0, 1.0, 1.0])
+        np.testing.assert_allclose(interpolate_crossings(y, [0], 0.5, 'cubic'), [0.5])
+        with self.assertRaises(ValueError):
+            interpolate_crossings(y, [0], 0.5, 'quadratic')
+
+    def test_drift_resolution(self):
+        # The clock gains 37 s/day, so the ticks fall at every fraction of a
+        # sample; the pulses rise over 100 us so their edges can be timed
+        records = {}
+        for mode in [None, 'linear', 'cubic']:
+            source = SyntheticDataSource(44100, 60.0, seed=1, phase=0.4, rate=37.0,
+                                         noise=0.0001, rise=1e-4)
+            analyser = ClockAnalyser(source)
+            analyser.edge_interpolation = mode
+            records[mode] = list(analyser.process(pps_edge='down'))
+        step = 3.0 * 37.0 / (86400 + 37.0)
+        for mode, max_error in [(None, 30e-6), ('linear', 2e-6), ('cubic', 2e-6)]:
+            drift = np.array([data['drift'] for data in records[mode]])
+            swings = np.round(np.diff(drift) / step)
+            errors = np.diff(drift) - swings * step
+            self.assertLess(abs(errors).max(), max_error, mode)
+
+
+class RawSamplesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.analyser = ClockAnalyser(MockSource())
+        signal = clock_signal(1000, 6.0, noise=0.02, ringing=1.0, rise=1e-3, seed=1)
+        self.raw = float_to_int16(signal[:, MockSource.CHANNEL_TICK])
+        self.y = self.raw * INT16_SCALE
+
+    def test_raw_threshold(self):
+        y = np.arange(-2**15, 2**15)
+        for level in [0.1, 0.5, -0.05, 3276 * INT16_SCALE, 0.0]:
+            t = raw_threshold(level)
+            x = y * INT16_SCALE
+            assert_array_equal(y > t, x > level)
+            assert_array_equal(y <= t, x <= level)
+            assert_array_equal(y < -t, x < -level)
+            assert_array_equal(y >= -t, x >= -level)
+
+    def test_same_edges_as_floats(self):
+        for hysteresis in [0.0, 0.05]:
+            self.analyser.edge_hysteresis = hysteresis
+            for a, b in zip(self.analyser.find_edges(self.raw),
+                            self.analyser.find_edges(self.y)):
+                self.assertGreater(len(a), 0)
+                assert_array_equal(a, b)
+
+    def test_refined_edges_same_as_floats(self):
+        i_pos, i_neg = self.analyser.find_edges(self.y)
+        for edges, sign in [(i_pos, 1), (i_neg, -1)]:
+            assert_array_equal(self.analyser.fit_decays(self.raw, edges, sign),
+                               self.analyser.fit_decays(self.y, edges, sign))
+            for method in ['linear', 'cubic']:
+                self.analyser.edge_interpolation = method
+                assert_array_equal(self.analyser.interpolate_edges(self.raw, edges, sign),
+                                   self.analyser.interpolate_edges(self.y, edges, sign))
+
+    def test_negate_saturates(self):
+        y = np.array([-2**15, -1, 0, 2**15 - 1], dtype=np.int16)
+        assert_array_equal(negate(y), [2**15 - 1, 1, 0, -2**15 + 1])
+        assert_array_equal(negate(y * 1.0), -(y * 1.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
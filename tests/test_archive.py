@@ -0,0 +1,118 @@
+import unittest
+from mock import patch
+import os
+import os.path
+from tempfile import mkdtemp
+import shutil
+from datetime import datetime, timedelta
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from clocklogger.archive import TextArchive, FileIndex, build_index, parse_records
+from clocklogger.output.binary import record_dtype
+from clocklogger.output.textfile import TextFileWriter
+
+REF_DATA = os.path.join(os.path.dirname(__file__), '..', 'ref_data')
+
+
+class TextArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        writer = TextFileWriter(self.path, 'clock', ['time', 'drift', 'amplitude'],
+                                flush_records=1000)
+        start = datetime(2014, 2, 3, 23)
+        for i in range(2400):  # 2 hours, over midnight
+            writer.write({'time': start + timedelta(seconds=3 * i),
+                          'drift': 0.001 * i, 'amplitude': 46.0})
+        writer.close()
+        self.archive = TextArchive(self.path)
+        self.filename = os.path.join(self.path, '2014/02/clock2014-02-03.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_query_across_files(self):
+        start = datetime(2014, 2, 3, 23, 30)
+        blocks = list(self.archive.query(start, start + timedelta(minutes=45)))
+        self.assertEqual([len(b) for b in blocks], [600, 300])
+        records = np.concatenate(blocks)
+        self.assertEqual(records['time'][0], 1391470200)
+        self.assertTrue(np.all(np.diff(records['time']) == 3))
+        self.assertAlmostEqual(records['drift'][0], 0.001 * 600)
+        self.assertEqual(len(self.archive.load(start, start)), 0)
+        self.assertEqual(len(self.archive.load(datetime(2014, 1, 1), datetime(2014, 1, 2))), 0)
+
+    def test_index_is_cached_next_to_file(self):
+        self.archive.load(datetime(2014, 2, 3), datetime(2014, 2, 4))
+        self.assertTrue(os.path.exists(self.filename + '.idx'))
+        index = FileIndex(self.filename, record_dtype())
+        assert_array_equal(index.entries, [[1391468400, 0]])
+
+        with patch('clocklogger.archive.build_index') as mock_build:
+            FileIndex(self.filename, record_dtype())
+            TextArchive(self.path).load(datetime(2014, 2, 3), datetime(2014, 2, 4))
+            self.assertFalse(mock_build.called)
+
+    def test_index_is_rebuilt_when_file_changes(self):
+        archive = TextArchive(self.path)
+        day = (datetime(2014, 2, 3), datetime(2014, 2, 4))
+        self.assertEqual(len(archive.load(*day)), 1200)
+        with open(self.filename, 'a') as f:
+            f.write("1391472000 1.0 46.0\n1391472003 1.1")  # last line incomplete
+        records = archive.load(*day)
+        self.assertEqual(len(records), 1200)
+        self.assertEqual(len(TextArchive(self.path).load(day[0], day[1] + timedelta(hours=1))),
+                         1200 + 1200 + 1)
+
+    def test_index_is_extended_when_file_grows(self):
+        filename = os.path.join(self.path, 'growing.txt')
+        lines = ["%d %f 46.0\n" % (3 * i, 0.001 * i) for i in range(4000)]
+        with open(filename, 'w') as f:
+            f.write(''.join(lines[:2500]) + lines[2500][:7])  # last line incomplete
+        index = FileIndex(filename, record_dtype())
+        self.assertEqual(len(index.entries), 3)
+        with open(filename, 'a') as f:
+            f.write(lines[2500][7:] + ''.join(lines[2501:]))
+        with patch('clocklogger.archive.build_index', wraps=build_index) as mock_build:
+            index.update()
+        # Only the last indexed hour is read again
+        begin = len(''.join(lines[:2400]))
+        self.assertEqual(len(mock_build.call_args[0][0]), os.path.getsize(filename) - begin)
+        with open(filename, 'rb') as f:
+            expected = build_index(f.read(), record_dtype())
+        assert_array_equal(index.entries, expected)
+        assert_array_equal(FileIndex(filename, record_dtype()).entries, expected)
+
+    def test_build_index(self):
+        data = b"3599 1 2\n3600 1 2\n3603 1 2\n7300 1 2\n"
+        assert_array_equal(build_index(data, record_dtype()),
+                           [[0, 0], [3600, 9], [7200, 27]])
+        self.assertEqual(build_index(b"", record_dtype()).shape, (0, 2))
+
+    def test_truncated_lines_are_skipped(self):
+        data = b"100 0.1 1.0\n103 0.2\n106 0.3 3.0\n109 0.4 4.0\n"
+        records = parse_records(data, record_dtype())
+        assert_array_equal(records['time'], [100, 106, 109])
+        assert_array_equal(records['drift'], [0.1, 0.3, 0.4])
+        assert_array_equal(records['amplitude'], [1.0, 3.0, 4.0])
+        data = b"3599 1 2\n3600 1\n3603 1 2\n7300 1 2\n"
+        assert_array_equal(build_index(data, record_dtype()),
+                           [[0, 0], [3600, 16], [7200, 25]])
+
+    def test_reference_data(self):
+        path = os.path.join(self.path, 'ref')
+        os.makedirs(path)
+        shutil.copy(os.path.join(REF_DATA, 'clock2013-04-01.txt'), path)
+        expected = np.loadtxt(os.path.join(path, 'clock2013-04-01.txt'))
+        start = datetime(2013, 4, 1, 5, 20)
+        end = datetime(2013, 4, 1, 17, 1, 1)
+        records = TextArchive(path).load(start, end)
+        t0, t1 = (start - datetime(1970, 1, 1)).total_seconds(), (end - datetime(1970, 1, 1)).total_seconds()
+        selected = expected[(expected[:, 0] >= t0) & (expected[:, 0] < t1)]
+        assert_array_equal(records['time'], selected[:, 0])
+        assert_array_equal(records['drift'], selected[:, 1])
+        assert_array_equal(records['amplitude'], selected[:, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+from mock import patch
+import os.path
+from tempfile import mkdtemp
+import shutil
+from datetime import datetime, timedelta
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from clocklogger.capture import CallbackCapture, ReplayStream
+from clocklogger.input import SoundCardDataSource
+
+
+class CaptureTestCase(unittest.TestCase):
+    fs = 2000
+
+    def setUp(self):
+        self.path = mkdtemp()
+        self.filename = os.path.join(self.path, 'recording.npz')
+        t = np.arange(self.fs) / self.fs
+        self.signal = np.c_[0.5 * np.sin(2 * np.pi * 3 * t),
+                            np.round(t % 0.5) * 0.25]
+        np.savez(self.filename, fs=self.fs, signal=self.signal, start_time=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _make_source(self, speed=20.0, **kwargs):
+        def open_replay_stream(source, frames_per_buffer, stream_callback=None):
+            return ReplayStream(self.filename, frames_per_buffer,
+                                stream_callback, speed=speed)
+        with patch.object(SoundCardDataSource, '_open_stream', open_replay_stream):
+            return SoundCardDataSource(self.fs, **kwargs)
+
+    def test_replays_recording_through_callback(self):
+        source = self._make_source(frames_per_buffer=128, buffer_duration=1)
+        source.capture.timeout = 0.5
+        samples = source.get_samples(1500)
+        assert_array_equal(samples, np.round(self.signal[:1500] * 2**15) / 2**15)
+        source.consume(1000)
+        samples = source.get_samples(1000)
+        assert_array_equal(samples, np.round(self.signal[1000:] * 2**15) / 2**15)
+        self.assertEqual(source.capture.overruns, 0)
+
+        # No more data
+        source.consume(1000)
+        with self.assertRaises(EOFError):
+            source.get_samples(10)
+        self.assertEqual(source.capture.underruns, 1)
+
+    def test_raw_frames(self):
+        source = self._make_source(frames_per_buffer=128, buffer_duration=1, raw=True)
+        source.capture.timeout = 0.5
+        samples = source.get_samples(1500)
+        self.assertEqual(samples.dtype, np.int16)
+        assert_array_equal(samples, np.round(self.signal[:1500] * 2**15))
+
+    def test_timestamps_follow_sample_index(self):
+        source = self._make_source(speed=1.0, frames_per_buffer=200, buffer_duration=1)
+        source.get_samples(400)
+        self.assertTrue(source.timebase.hardware)
+        t0 = source.time
+        source.consume(300)
+        self.assertAlmostEqual((source.time - t0).total_seconds(), 300 / self.fs, places=5)
+        self.assertLess(abs(datetime.utcnow() - t0), timedelta(seconds=1))
+
+    def test_replays_recording_with_blocking_reads(self):
+        source = self._make_source(asynchronous=False, buffer_duration=1)
+        self.assertIsNone(source.capture)
+        samples = source.get_samples(1000)
+        assert_array_equal(samples, np.round(self.signal[:1000] * 2**15) / 2**15)
+
+    def test_slow_consumer_causes_overruns_not_blocking(self):
+        capture = CallbackCapture(channels=2, max_blocks=3, timeout=0.5)
+        stream = ReplayStream(self.filename, 100, capture.callback, speed=100.0)
+        stream.thread.join()
+        self.assertEqual(capture.frames_captured, self.fs)
+        self.assertEqual(capture.depth, 3)
+        self.assertEqual(capture.overruns, 17)
+        self.assertEqual(capture.frames_dropped, 1700)
+
+        # The most recent blocks are kept
+        index, frames = capture.read(1000)
+        self.assertEqual(index, 1700)
+        self.assertEqual(frames.shape, (100, 2))
+        assert_array_equal(frames / 2**15,
+                           np.round(self.signal[1700:1800] * 2**15) / 2**15)
+
+    def test_overflow_status_is_counted(self):
+        capture = CallbackCapture(channels=2)
+        frames = np.zeros((10, 2), dtype=np.int16)
+        capture.callback(frames.tobytes(), 10, {}, 2)  # paInputOverflow
+        self.assertEqual(capture.overruns, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
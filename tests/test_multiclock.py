@@ -0,0 +1,93 @@
+import logging
+import unittest
+from mock import patch
+import numpy as np
+
+from clocklogger.analysis import ClockAnalyser, DataError
+from clocklogger.multiclock import SharedSource, SharedPPSClockAnalyser, run_clocks
+from clocklogger.streaming import EdgeDetector
+from clocklogger.synthetic import SyntheticDataSource, clock_signal
+
+FS = 8000
+DURATION = 60.0
+
+
+def records(analyser):
+    out = []
+    while True:
+        try:
+            out.extend(analyser.process(pps_edge='down'))
+            return out
+        except DataError:
+            pass
+
+
+class MultiClockTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        signals = [clock_signal(FS, DURATION, seed=k, phase=0.5 * k, rate=5.0 * k,
+                                noise=0.001, missing_ticks=0.02 * k)
+                   for k in range(3)]
+        self.pps = signals[0][:, 1]
+        self.ticks = [signal[:, 0] for signal in signals]
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def _source(self, y):
+        source = SyntheticDataSource(FS, 1.0)
+        source.y = y
+        source.stop = len(y)
+        return source
+
+    def _run(self, capacity=None, analyser_classes=None, output=None):
+        source = self._source(np.column_stack(self.ticks + [self.pps]))
+        shared = SharedSource(source, pps_channel=3, capacity=capacity)
+        classes = analyser_classes or [SharedPPSClockAnalyser] * 3
+        analysers = {'clock%d' % k: classes[k](shared.clock(k)) for k in range(3)}
+        output = {name: [] for name in analysers} if output is None else output
+        def write(data):
+            output[data.pop('clock')].append(data)
+        run_clocks(analysers, write)
+        return shared, output
+
+    def test_same_records_as_one_clock_at_a_time(self):
+        shared, output = self._run()
+        for k, tick in enumerate(self.ticks):
+            expected = records(ClockAnalyser(self._source(np.c_[tick, self.pps])))
+            self.assertGreater(len(expected), 10)
+            self.assertEqual(output['clock%d' % k], expected)
+
+    def test_pps_is_searched_once(self):
+        scanned = []
+        class CountingDetector(EdgeDetector):
+            def scan(self, y, offset):
+                scanned.append(len(y))
+                super().scan(y, offset)
+        with patch('clocklogger.multiclock.EdgeDetector', CountingDetector):
+            shared, output = self._run()
+        # Once by each of the positive and negative edge detectors
+        self.assertEqual(sum(scanned), 2 * len(self.pps))
+
+    def test_clocks_wait_for_each_other(self):
+        shared, output = self._run(capacity=int(7 * FS))
+        self.assertEqual(output, self._run()[1])
+
+    def test_failing_clock_stops_the_others(self):
+        class FailingAnalyser(SharedPPSClockAnalyser):
+            def calculate_drift(self, *args):
+                raise RuntimeError("analysis failed")
+        full = self._run()[1]
+        output = {name: [] for name in full}
+        with self.assertRaises(RuntimeError):
+            self._run(capacity=int(7 * FS), output=output, analyser_classes=[
+                SharedPPSClockAnalyser, SharedPPSClockAnalyser, FailingAnalyser])
+        self.assertEqual(output['clock2'], [])
+        # The other clocks stopped soon after
+        for name in ['clock0', 'clock1']:
+            self.assertLess(len(output[name]), len(full[name]) // 2)
+            self.assertEqual(output[name], full[name][:len(output[name])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+import os.path
+import glob
+import shutil
+from tempfile import mkdtemp
+from datetime import datetime, timedelta
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from clocklogger.pyramid import PyramidWriter, Pyramid, backfill, level_filename
+from clocklogger.archive import TextArchive
+from clocklogger.output.binary import record_dtype
+
+REF_DATA = os.path.join(os.path.dirname(__file__), '..', 'ref_data')
+
+
+def make_records(start, n, interval=3):
+    rng = np.random.RandomState(7)
+    records = np.zeros(n, record_dtype())
+    t0 = int((start - datetime(1970, 1, 1)).total_seconds())
+    records['time'] = t0 + interval * np.arange(n)
+    records['drift'] = np.cumsum(1e-4 * rng.randn(n))
+    records['amplitude'] = 46 + rng.randn(n)
+    return records
+
+
+def as_dicts(records):
+    for r in records:
+        yield {'time': datetime(1970, 1, 1) + timedelta(seconds=int(r['time'])),
+               'drift': r['drift'], 'amplitude': r['amplitude']}
+
+
+class PyramidTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.pyramid = Pyramid(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _check_level(self, records, interval):
+        level = self.pyramid.level(interval)
+        starts = records['time'] - records['time'] % interval
+        assert_array_equal(level['time'], np.unique(starts))
+        for row in level:
+            these = records[starts == row['time']]
+            self.assertEqual(row['count'], len(these))
+            assert_allclose(row['drift_mean'], these['drift'].mean(), rtol=1e-9, atol=1e-15)
+            self.assertEqual(row['drift_min'], these['drift'].min())
+            self.assertEqual(row['amplitude_max'], these['amplitude'].max())
+
+    def test_levels(self):
+        records = make_records(datetime(2014, 2, 3, 22, 0, 0), 2 * 28800)
+        writer = PyramidWriter(self.path)
+        for data in as_dicts(records):
+            writer.write(data)
+        writer.close()
+        for interval in [60, 900, 3600, 86400]:
+            self._check_level(records, interval)
+        self.assertEqual(len(self.pyramid.level(86400)), 3)
+
+    def test_restart_carries_on_interval(self):
+        records = make_records(datetime(2014, 2, 3, 10, 0, 0), 2000)
+        writer = PyramidWriter(self.path)
+        for data in as_dicts(records[:1010]):
+            writer.write(data)
+        writer.close()
+        writer = PyramidWriter(self.path)
+        for data in as_dicts(records[1010:]):
+            writer.write(data)
+        writer.close()
+        for interval in [60, 900, 3600, 86400]:
+            self._check_level(records, interval)
+
+    def test_flush_without_close(self):
+        # As after a crash: the intervals in progress are lost, but the
+        # rest is consistent
+        records = make_records(datetime(2014, 2, 3, 10, 0, 0), 1000)
+        writer = PyramidWriter(self.path)
+        for data in as_dicts(records[:600]):
+            writer.write(data)
+        writer.flush()
+        writer = PyramidWriter(self.path)
+        for data in as_dicts(records[600:]):
+            writer.write(data)
+        writer.close()
+        self._check_level(records, 60)
+        self._check_level(records, 3600)
+
+    def test_write_records_matches_write(self):
+        records = make_records(datetime(2014, 2, 3, 23, 0, 0), 5000)
+        writer = PyramidWriter(self.path, 'blocks')
+        for block in np.array_split(records, 7):
+            writer.write_records(block)
+        writer.write_records(records[:100])  # already there
+        writer.close()
+        writer = PyramidWriter(self.path, 'single')
+        for data in as_dicts(records):
+            writer.write(data)
+        writer.close()
+        for interval in [60, 900, 3600, 86400]:
+            assert_allclose(Pyramid(self.path, 'blocks').level(interval).tolist(),
+                            Pyramid(self.path, 'single').level(interval).tolist())
+
+    def test_replayed_records_are_not_counted_twice(self):
+        records = make_records(datetime(2014, 2, 3, 10, 0, 0), 2000)
+        writer = PyramidWriter(self.path)
+        writer.write_records(records[:1010])
+        writer.write_records(records[1000:1500])
+        writer.close()
+        writer = PyramidWriter(self.path)
+        writer.write_records(records[:1600])
+        for data in as_dicts(records[1550:]):
+            writer.write(data)
+        writer.close()
+        for interval in [60, 900, 3600, 86400]:
+            self._check_level(records, interval)
+
+    def test_coarse_levels_are_flushed(self):
+        records = make_records(datetime(2014, 2, 3, 10, 0, 0), 500)
+        writer = PyramidWriter(self.path, flush_interval=0)
+        for data in as_dicts(records):
+            writer.write(data)
+        # Not closed, but the intervals in progress are all on disk
+        for interval in [60, 900, 3600, 86400]:
+            self._check_level(records, interval)
+        writer.close()
+
+    def test_query_chooses_coarsest_level(self):
+        records = make_records(datetime(2014, 1, 1), 60 * 28800)
+        writer = PyramidWriter(self.path)
+        writer.write_records(records)
+        writer.close()
+
+        start = datetime(2014, 1, 1)
+        self.assertEqual(self.pyramid.choose_level(start, start + timedelta(days=60), 50), 86400)
+        self.assertEqual(self.pyramid.choose_level(start, start + timedelta(days=60), 1000), 3600)
+        self.assertEqual(self.pyramid.choose_level(start, start + timedelta(days=1), 1000), 60)
+        interval, level = self.pyramid.query(start + timedelta(days=10),
+                                             start + timedelta(days=20), 200)
+        self.assertEqual(interval, 3600)
+        self.assertEqual(len(level), 240)
+        self.assertEqual(level['time'][0], 1388534400 + 10 * 86400)
+
+    def test_backfill_ref_data(self):
+        text_path = mkdtemp()
+        self.addCleanup(shutil.rmtree, text_path)
+        for fn in glob.glob(os.path.join(REF_DATA, 'clock*.txt')):
+            shutil.copy(fn, text_path)
+        archive = TextArchive(text_path)
+        start, end = datetime(2012, 10, 1), datetime(2013, 5, 1)
+        num_records = backfill(archive, start, end, self.path)
+        records = archive.load(start, end)
+        self.assertEqual(num_records, len(records))
+        self._check_level(records, 900)
+        self.assertTrue(os.path.exists(level_filename(self.path, 'clock', 86400)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import os.path
+from tempfile import mkdtemp
+import shutil
+import numpy as np
+
+from clocklogger.input import PrerecordedDataSource
+from clocklogger.analysis import ClockAnalyser
+from clocklogger.reanalyse import reanalyse, join_segments
+from clocklogger.synthetic import clock_signal
+
+
+class ReanalyseTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.path = mkdtemp()
+        cls.filename = os.path.join(cls.path, 'recording.npz')
+        signal = clock_signal(8000, 150.0, noise=0.0001, seed=1, phase=0.4)
+        signal[int(70.5 * 8000):int(82 * 8000)] = 0  # signal lost for a while
+        np.savez(cls.filename, fs=8000, signal=signal, start_time=1e9)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.path)
+
+    def test_parallel_output_is_identical_to_serial(self):
+        options = {'initial_drift': 3.0}
+        serial = list(reanalyse(self.filename, options, jobs=1))
+        parallel = list(reanalyse(self.filename, options, jobs=3,
+                                  segment_duration=20.0, overlap=10.0))
+        self.assertGreater(len(serial), 35)
+        self.assertEqual(parallel, serial)
+
+        # Same as processing it live, apart from restarting after the gap
+        analyser = ClockAnalyser(PrerecordedDataSource(self.filename), initial_drift=3.0)
+        direct = list(analyser.process(pps_edge='down'))
+        self.assertEqual(direct, serial[:len(direct)])
+
+    def test_settings_are_applied(self):
+        down = list(reanalyse(self.filename, {}, jobs=2,
+                              segment_duration=30.0, overlap=10.0))
+        options = {'pps_edge': 'up', 'edge_level': 0.2, 'fit_decay': True}
+        up = list(reanalyse(self.filename, options, jobs=2,
+                            segment_duration=30.0, overlap=10.0))
+        self.assertEqual(len(up), len(down))
+        # Rising PPS edges are 0.1 s before the falling ones
+        for a, b in zip(down, up):
+            self.assertAlmostEqual(a['drift'] - b['drift'], 0.1, places=3)
+
+    def test_join_segments(self):
+        first = [(10, 'a'), (20, 'b'), (30, 'c')]
+        self.assertEqual(join_segments(first, [(25, 'x'), (30, 'y'), (40, 'd')]),
+                         [(10, 'a'), (20, 'b'), (30, 'c'), (40, 'd')])
+        self.assertEqual(join_segments(first, [(35, 'x')]), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import os.path
+from tempfile import mkdtemp
+import shutil
+import io
+import contextlib
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from clocklogger.recording import (RawRecording, RawRecordingWriter, convert_npz,
+                                   is_raw_recording, float_to_int16, ALIGNMENT)
+from clocklogger.input import PrerecordedDataSource
+from clocklogger.analysis import ClockAnalyser
+from clocklogger.synthetic import clock_signal
+
+
+class RawRecordingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.npz = os.path.join(self.path, 'recording.npz')
+        self.raw = os.path.join(self.path, 'recording.raw')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_write_and_read(self):
+        frames = np.arange(20, dtype=np.int16).reshape((-1, 2))
+        with RawRecordingWriter(self.raw, 8000, 1e9, {'tick': 1, 'pps': 0}) as writer:
+            writer.write(frames[:4])
+            writer.write(frames[4:])
+        self.assertTrue(is_raw_recording(self.raw))
+        self.assertEqual((os.path.getsize(self.raw) - frames.nbytes) % ALIGNMENT, 0)
+
+        recording = RawRecording(self.raw)
+        self.assertEqual(recording.fs, 8000)
+        self.assertEqual(recording.start_time, 1e9)
+        self.assertEqual(recording.channel_map, {'tick': 1, 'pps': 0})
+        self.assertEqual(len(recording), 10)
+        self.assertIsInstance(recording.frames, np.memmap)
+        assert_array_equal(recording.frames, frames)
+
+        source = PrerecordedDataSource(self.raw)
+        self.assertEqual(source.CHANNEL_TICK, 1)
+        self.assertEqual(source.CHANNEL_PPS, 0)
+
+    def test_empty_recording(self):
+        RawRecordingWriter(self.raw, 8000, 0).close()
+        self.assertEqual(len(RawRecording(self.raw)), 0)
+
+    def test_convert_npz(self):
+        signal = np.c_[np.linspace(-1, 1, 100), np.linspace(0.5, -0.5, 100)]
+        np.savez(self.npz, fs=1000, signal=signal, start_time=1e9)
+        self.assertFalse(is_raw_recording(self.npz))
+        self.assertEqual(convert_npz(self.npz, self.raw, block_size=30), 100)
+
+        recording = RawRecording(self.raw)
+        self.assertEqual(recording.fs, 1000)
+        assert_array_equal(recording.frames, float_to_int16(signal))
+        self.assertEqual(recording.frames.max(), 2**15 - 1)
+
+        npz_source = PrerecordedDataSource(self.npz)
+        raw_source = PrerecordedDataSource(self.raw)
+        self.assertEqual(raw_source.start_time, npz_source.start_time)
+        self.assertEqual(raw_source.num_samples, 100)
+        raw_source.consume(10)
+        np.testing.assert_allclose(raw_source.get_samples(50), signal[10:60], atol=2**-15)
+
+        # Raw frames are read as they are stored, or converted from floats
+        for source in (PrerecordedDataSource(self.raw, raw=True),
+                       PrerecordedDataSource(self.npz, raw=True)):
+            samples = source.get_samples(50)
+            self.assertEqual(samples.dtype, np.int16)
+            assert_array_equal(samples, float_to_int16(signal[:50]))
+
+    def test_analysis_matches_npz(self):
+        signal = clock_signal(8000, 30.0, noise=0.0001, seed=1)
+        np.savez(self.npz, fs=8000, signal=signal, start_time=1e9)
+        convert_npz(self.npz, self.raw)
+        results = []
+        for filename in (self.npz, self.raw):
+            analyser = ClockAnalyser(PrerecordedDataSource(filename))
+            with contextlib.redirect_stdout(io.StringIO()):
+                results.append(list(analyser.process()))
+        self.assertEqual(len(results[1]), len(results[0]))
+        for a, b in zip(*results):
+            self.assertEqual(a['time'], b['time'])
+            self.assertAlmostEqual(a['drift'], b['drift'], places=4)
+
+    def test_raw_analysis_matches_float(self):
+        signal = clock_signal(8000, 30.0, noise=0.0001, seed=1)
+        np.savez(self.npz, fs=8000, signal=signal, start_time=1e9)
+        convert_npz(self.npz, self.raw)
+        results = []
+        for raw in (False, True):
+            analyser = ClockAnalyser(PrerecordedDataSource(self.raw, raw=raw))
+            with contextlib.redirect_stdout(io.StringIO()):
+                results.append(list(analyser.process(fit_decay=True)))
+        self.assertGreater(len(results[0]), 5)
+        self.assertEqual(results[1], results[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import os.path
+import json
+import shutil
+import argparse
+import contextlib
+import io
+from tempfile import mkdtemp
+import numpy as np
+
+from clocklogger import regression
+from clocklogger.output.binary import record_dtype
+from clocklogger.synthetic import clock_signal
+
+
+class CompareTestCase(unittest.TestCase):
+    def _records(self, n):
+        records = np.zeros(n, record_dtype())
+        records['time'] = 1000 + 3 * np.arange(n)
+        records['drift'] = 0.4 + 1e-3 * np.arange(n)
+        records['amplitude'] = 46.0
+        return records
+
+    def test_identical(self):
+        result = regression.compare(self._records(10), self._records(10))
+        self.assertTrue(result['ok'])
+        self.assertEqual(result['records'], 10)
+        self.assertEqual(result['drift']['max'], 0)
+
+    def test_differences(self):
+        golden = self._records(10)
+        output = self._records(11)[1:]
+        output['drift'][4] += 1e-5
+        output['amplitude'] += 1e-6
+        result = regression.compare(output, golden)
+        self.assertFalse(result['ok'])
+        self.assertEqual(result['missing'], 1)
+        self.assertEqual(result['extra'], 1)
+        self.assertEqual(result['drift']['failed'], 1)
+        self.assertEqual(result['drift']['first_failure'], output['time'][4])
+        self.assertAlmostEqual(result['drift']['max'], 1e-5)
+        self.assertEqual(result['amplitude']['failed'], 0)
+
+
+class RegressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.recording = os.path.join(self.path, 'synthetic.npz')
+        signal = clock_signal(8000, 60.0, noise=0.0001, seed=1, phase=0.4, rate=20.0)
+        np.savez(self.recording, fs=8000, signal=signal, start_time=1e9)
+
+    def _run(self, *argv):
+        parser = argparse.ArgumentParser()
+        regression.add_arguments(parser)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            ok = regression.run(parser.parse_args(argv))
+        return ok, out.getvalue()
+
+    def test_update_then_check(self):
+        ok, out = self._run(self.path, '--update')
+        golden = regression.load_golden(os.path.join(self.path, 'synthetic.txt'))
+        self.assertGreater(len(golden), 15)
+
+        results = os.path.join(self.path, 'results.json')
+        ok, out = self._run(self.path, '--json', results)
+        self.assertTrue(ok)
+        self.assertIn('1 of 1 cases passed', out)
+        with open(results) as f:
+            result, = json.load(f)
+        self.assertEqual(result['drift']['max'], 0)
+        self.assertIn('find_edges', result['timing']['stages'])
+        self.assertGreater(result['throughput'], 0)
+
+    def test_changed_settings_fail(self):
+        self._run(self.recording, '--update')
+        with open(os.path.join(self.path, 'synthetic.json'), 'wt') as f:
+            json.dump({'pps_edge': 'up'}, f)
+        ok, out = self._run(self.recording)
+        self.assertFalse(ok)
+        self.assertIn('FAILED', out)
+
+    def test_unknown_option(self):
+        with open(os.path.join(self.path, 'synthetic.json'), 'wt') as f:
+            json.dump({'edge_levle': 0.2}, f)
+        with self.assertRaises(ValueError):
+            regression.load_options(self.recording)
+
+
+if __name__ == '__main__':
+    unittest.main()
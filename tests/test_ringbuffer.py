@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from clocklogger.ringbuffer import RingBuffer
+
+
+class RingBufferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.buffer = RingBuffer(10, channels=2)
+
+    def _frames(self, start, stop):
+        return np.c_[np.arange(start, stop), -np.arange(start, stop)]
+
+    def test_write_and_view(self):
+        self.buffer.write(self._frames(0, 4))
+        self.assertEqual(len(self.buffer), 4)
+        self.assertEqual(self.buffer.free, 6)
+        assert_array_equal(self.buffer.view(3), self._frames(0, 3))
+        assert_array_equal(self.buffer.view(), self._frames(0, 4))
+
+    def test_views_are_contiguous_across_wraparound(self):
+        # Fill and consume repeatedly so the data wraps around several times
+        self.buffer.write(self._frames(0, 3))
+        n = 3
+        for i in range(7):
+            self.buffer.write(self._frames(n, n + 6))
+            n += 6
+            view = self.buffer.view()
+            assert_array_equal(view, self._frames(n - 9, n))
+            self.assertTrue(np.shares_memory(view, self.buffer.data))
+            self.buffer.consume(6)
+
+    def test_scale_converts_raw_frames(self):
+        raw = np.array([[2**14, -2**15], [0, 2**15 - 1]], dtype=np.int16)
+        self.buffer.write(raw, scale=1.0 / 2**15)
+        assert_array_equal(self.buffer.view(), raw / 2**15)
+
+    def test_overflow_raises_error(self):
+        self.buffer.write(self._frames(0, 8))
+        with self.assertRaises(ValueError):
+            self.buffer.write(self._frames(8, 11))
+
+    def test_cannot_consume_more_than_buffered(self):
+        self.buffer.write(self._frames(0, 3))
+        with self.assertRaises(ValueError):
+            self.buffer.consume(4)
+
+    def test_steady_state_does_not_reallocate(self):
+        data = self.buffer.data
+        for i in range(20):
+            self.buffer.write(self._frames(0, 5))
+            self.buffer.consume(5)
+        self.assertIs(self.buffer.data, data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+import json
+import shutil
+import os.path
+import http.client
+from tempfile import mkdtemp
+from datetime import datetime, timedelta
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from clocklogger.server import QueryServer, LatestSample, downsample, parse_time
+from clocklogger.output.binary import BinaryFileWriter, BinaryFileReader
+from clocklogger.pyramid import PyramidWriter, Pyramid
+
+
+class QueryServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.start = datetime(2014, 2, 3)
+        self.latest = LatestSample()
+        writers = [BinaryFileWriter(self.path, 'clock'),
+                   PyramidWriter(os.path.join(self.path, 'pyramid')), self.latest]
+        for i in range(28800):
+            data = {'time': self.start + timedelta(seconds=3 * i),
+                    'drift': 1e-3 * i, 'amplitude': 46.0 + (i % 2)}
+            for writer in writers:
+                writer.write(data)
+        for writer in writers[:2]:
+            writer.close()
+
+        self.server = QueryServer(self.latest, BinaryFileReader(self.path, 'clock'),
+                                  Pyramid(os.path.join(self.path, 'pyramid')), port=0)
+        self.server.start()
+        self.connection = http.client.HTTPConnection('127.0.0.1', self.server.port)
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.close()
+        shutil.rmtree(self.path)
+
+    def _get(self, target):
+        self.connection.request('GET', target)
+        response = self.connection.getresponse()
+        return response, response.read()
+
+    def test_latest(self):
+        response, body = self._get('/latest')
+        self.assertEqual(response.status, 200)
+        latest = json.loads(body.decode('utf-8'))
+        self.assertEqual(latest['time'], 1391385600 + 3 * 28799)
+        self.assertEqual(latest['iso_time'], '2014-02-03T23:59:57Z')
+        self.assertAlmostEqual(latest['drift'], 28.799)
+
+    def test_range_json(self):
+        response, body = self._get('/range?start=2014-02-03T10:00:00&end=2014-02-03T10:01:00')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Content-Type'), 'application/json')
+        data = json.loads(body.decode('utf-8'))
+        self.assertEqual(len(data['time']), 20)
+        self.assertEqual(data['time'][0], 1391421600)
+        self.assertAlmostEqual(data['drift'][0], 12.0)
+
+    def test_range_csv_and_binary(self):
+        query = '/range?start=1391421600&end=1391421660'
+        response, body = self._get(query + '&format=csv')
+        lines = body.decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'time,drift,amplitude')
+        self.assertEqual(lines[1], '1391421600,12,46')
+        self.assertEqual(len(lines), 21)
+
+        response, body = self._get(query + '&format=bin')
+        dtype = np.dtype([tuple(d) for d in json.loads(response.getheader('X-Dtype'))])
+        records = np.frombuffer(body, dtype)
+        self.assertEqual(len(records), 20)
+        assert_allclose(records['drift'], 12.0 + 1e-3 * np.arange(20))
+
+    def test_downsampled_from_files(self):
+        # Too short for the pyramid to give 100 points
+        response, body = self._get('/range?start=2014-02-03T10:00:00'
+                                   '&end=2014-02-03T11:00:00&points=100')
+        data = json.loads(body.decode('utf-8'))
+        self.assertEqual(len(data['time']), 100)
+        self.assertEqual(sum(data['count']), 1200)
+        self.assertEqual(data['amplitude_min'][0], 46.0)
+        self.assertEqual(data['amplitude_max'][0], 47.0)
+
+    def test_downsampled_from_pyramid(self):
+        response, body = self._get('/range?start=2014-02-03&end=2014-02-04&points=20')
+        data = json.loads(body.decode('utf-8'))
+        self.assertEqual(len(data['time']), 24)  # hourly
+        self.assertEqual(data['count'][0], 1200)
+        self.assertAlmostEqual(data['amplitude_mean'][0], 46.5)
+
+    def test_responses_are_cached(self):
+        target = '/range?start=2014-02-03&end=2014-02-04&points=10'
+        first = self._get(target)[1]
+        self.assertEqual(self.server.cache_hits, 0)
+        self.assertEqual(self._get(target)[1], first)
+        self.assertEqual(self.server.cache_hits, 1)
+
+    def test_errors(self):
+        self.server.max_points = 1000
+        for target, status in [('/nowhere', 404),
+                               ('/range?start=2014-02-03', 400),
+                               ('/range?start=x&end=y', 400),
+                               ('/range?start=2014-02-04&end=2014-02-03', 400),
+                               ('/range?start=2014-02-03&end=2014-02-04&format=xml', 400),
+                               ('/range?start=2014-02-03&end=2014-02-04', 400),
+                               ('/range?start=2014-02-03&end=2014-02-04&points=0', 400)]:
+            response, body = self._get(target)
+            self.assertEqual(response.status, status, target)
+            self.assertIn('error', json.loads(body.decode('utf-8')))
+
+    def test_port_in_use(self):
+        server = QueryServer(self.latest, BinaryFileReader(self.path, 'clock'),
+                             port=self.server.port)
+        with self.assertRaises(OSError):
+            server.start()
+        server.close()
+        # The first server is still serving
+        response, body = self._get('/latest')
+        self.assertEqual(response.status, 200)
+
+    def test_no_data_yet(self):
+        self.latest.data = None
+        response, body = self._get('/latest')
+        self.assertEqual(response.status, 503)
+
+
+class HelpersTestCase(unittest.TestCase):
+    def test_parse_time(self):
+        self.assertEqual(parse_time('1391385600'), datetime(2014, 2, 3))
+        self.assertEqual(parse_time('2014-02-03T10:30'), datetime(2014, 2, 3, 10, 30))
+
+    def test_downsample(self):
+        records = np.zeros(10, [('time', '<i8'), ('drift', '<f8')])
+        records['time'] = np.arange(10)
+        records['drift'] = np.arange(10.0)
+        result = downsample(records, 3, ['drift'])
+        assert_array_equal(result['time'], [0, 3, 6])
+        assert_array_equal(result['count'], [3, 3, 4])
+        assert_array_equal(result['drift_max'], [2, 5, 9])
+        assert_allclose(result['drift_mean'], [1, 4, 7.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
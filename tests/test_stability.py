@@ -0,0 +1,119 @@
+import unittest
+import os.path
+import glob
+import shutil
+from tempfile import mkdtemp
+from datetime import datetime
+import numpy as np
+from numpy.testing import assert_allclose
+
+from clocklogger.stability import (Stability, stability, oadev, mdev, tdev,
+                                   regularise, octave_factors, archive_stability)
+from clocklogger.archive import TextArchive
+
+REF_DATA = os.path.join(os.path.dirname(__file__), '..', 'ref_data')
+
+
+def direct_oadev(x, tau0, m):
+    """Textbook overlapping ADEV, leaving out terms with missing samples"""
+    terms = [x[i + 2 * m] - 2 * x[i + m] + x[i] for i in range(len(x) - 2 * m)]
+    terms = np.array([t for t in terms if np.isfinite(t)])
+    return np.sqrt(np.sum(terms**2) / (2 * (m * tau0)**2 * len(terms)))
+
+
+def direct_mdev(x, tau0, m):
+    terms = []
+    for j in range(len(x) - 3 * m + 1):
+        terms.append(sum(x[i + 2 * m] - 2 * x[i + m] + x[i] for i in range(j, j + m)))
+    terms = np.array([t for t in terms if np.isfinite(t)])
+    return np.sqrt(np.sum(terms**2) / (2 * m**2 * (m * tau0)**2 * len(terms)))
+
+
+class StabilityTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(3)
+
+    def test_matches_direct_definitions(self):
+        x = np.cumsum(self.rng.randn(300)) * 1e-4 + 1e-5 * self.rng.randn(300)
+        x[[40, 41, 200]] = np.nan
+        result = stability(x, 3.0, [1, 2, 5, 16])
+        for r in result:
+            m = int(round(r['tau'] / 3.0))
+            assert_allclose(r['adev'], direct_oadev(x, 3.0, m), rtol=1e-9)
+            assert_allclose(r['mdev'], direct_mdev(x, 3.0, m), rtol=1e-9)
+            assert_allclose(r['tdev'], r['tau'] / np.sqrt(3) * r['mdev'])
+        self.assertEqual(result['n_adev'][0], 298 - 7)
+
+    def test_blocks_give_same_result(self):
+        x = np.cumsum(self.rng.randn(5000)) * 1e-4
+        x[1000:1010] = np.nan
+        factors = octave_factors(512)
+        whole = stability(x, 3.0, factors)
+        s = Stability(3.0, factors, block_size=0)
+        for block in np.array_split(x, 37):
+            s.add(block)
+        assert_allclose(s.result()['adev'], whole['adev'], rtol=1e-9)
+        assert_allclose(s.result()['mdev'], whole['mdev'], rtol=1e-9)
+        self.assertTrue(np.all(s.result()['n_mdev'] == whole['n_mdev']))
+
+    def test_long_gap(self):
+        x = self.rng.randn(100)
+        s = Stability(1.0, [1, 4])
+        s.add(x[:50])
+        s.skip(1000)
+        s.add(x[50:])
+        gapped = np.r_[x[:50], np.full(1000, np.nan), x[50:]]
+        assert_allclose(s.result()['adev'], stability(gapped, 1.0, [1, 4])['adev'])
+        self.assertEqual(s.num_samples, 1100)
+
+    def test_white_phase_noise(self):
+        # ADEV = sqrt(3) sigma / tau and TDEV = sigma / sqrt(m)
+        sigma = 1e-4
+        x = sigma * self.rng.randn(200000)
+        taus, adev = oadev(x, 3.0, [1, 10, 100])
+        assert_allclose(adev, np.sqrt(3) * sigma / taus, rtol=0.05)
+        taus, dev = tdev(x, 3.0, [16, 64])
+        assert_allclose(dev, sigma / np.sqrt([16, 64]), rtol=0.1)
+
+    def test_white_frequency_noise(self):
+        # ADEV = sigma_y / sqrt(m) and MDEV = ADEV / sqrt(2) for large m
+        sigma_y = 1e-5
+        x = np.cumsum(sigma_y * 3.0 * self.rng.randn(200000))
+        taus, adev = oadev(x, 3.0, [1, 10, 100])
+        assert_allclose(adev, sigma_y / np.sqrt([1, 10, 100]), rtol=0.05)
+        taus, dev = mdev(x, 3.0, [32, 128])
+        assert_allclose(dev, sigma_y / np.sqrt(2 * np.array([32, 128])), rtol=0.1)
+
+    def test_regularise(self):
+        # Timestamps are rounded, so occasionally two are the same: the
+        # later one is moved on if the next slot is free, else dropped
+        times = [0, 3, 6, 6, 12, 15, 15, 15, 24]
+        slots, values = regularise(times, np.arange(9.0))
+        self.assertEqual(list(slots), [0, 1, 2, 3, 4, 5, 6, 8])
+        self.assertEqual(list(values), [0, 1, 2, 3, 4, 5, 7, 8])
+
+    def test_ref_data(self):
+        # Work on a copy, so the index files aren't left in ref_data/
+        path = mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        for fn in glob.glob(os.path.join(REF_DATA, 'clock*.txt')):
+            shutil.copy(fn, path)
+        archive = TextArchive(path)
+        start, end = datetime(2013, 3, 30), datetime(2013, 4, 2)
+        factors = octave_factors(4096)
+        result = archive_stability(archive, start, end, factors=factors)
+        records = archive.load(start, end)
+        slots, values = regularise(records['time'], records['drift'])
+        x = np.full(slots[-1] + 1, np.nan)
+        x[slots] = values
+        assert_allclose(result['adev'], stability(x, 3.0, factors)['adev'], rtol=1e-9)
+        for r in result[[0, 3]]:
+            m = int(round(r['tau'] / 3.0))
+            assert_allclose(r['adev'], direct_oadev(x, 3.0, m), rtol=1e-9)
+        # The pendulum keeps time to a few milliseconds over a day
+        self.assertTrue(np.all(result['tdev'] < 0.01))
+        self.assertTrue(np.all(result['n_adev'] > 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+import mock
+import os.path
+from tempfile import mkdtemp
+import shutil
+from datetime import datetime, timedelta
+import numpy as np
+from numpy.testing import assert_allclose
+
+from clocklogger.stats import RunningStats, WindowStats, OnlineStats, stats_columns
+
+
+def make_records(n, start=datetime(2014, 2, 3, 10, 0, 0), interval=3, rate=2.0):
+    """Records with drift changing by ``rate`` seconds per day, plus noise"""
+    rng = np.random.RandomState(42)
+    records = []
+    for i in range(n):
+        t = i * interval
+        records.append({
+            'time': start + timedelta(seconds=t),
+            'drift': 0.5 + rate * t / 86400 + 1e-3 * rng.randn(),
+            'amplitude': 46 + rng.randn(),
+        })
+    return records
+
+
+class RunningStatsTestCase(unittest.TestCase):
+    def test_matches_numpy(self):
+        rng = np.random.RandomState(1)
+        x = np.arange(500) * 3.0
+        y = 1e6 + 0.01 * x + rng.randn(500)
+        stats = RunningStats()
+        for xi, yi in zip(x, y):
+            stats.add(yi, xi)
+        self.assertEqual(stats.n, 500)
+        assert_allclose(stats.mean, y.mean())
+        assert_allclose(stats.var, y.var(), rtol=1e-6)
+        self.assertEqual(stats.min, y.min())
+        self.assertEqual(stats.max, y.max())
+        assert_allclose(stats.slope, np.polyfit(x, y, 1)[0], rtol=1e-6)
+
+    def test_slope_needs_two_points(self):
+        stats = RunningStats()
+        stats.add(3.0, 0.0)
+        self.assertTrue(np.isnan(stats.slope))
+        self.assertEqual(stats.var, 0.0)
+
+
+class WindowStatsTestCase(unittest.TestCase):
+    def test_rollup_when_window_ends(self):
+        records = make_records(45)   # 10:00:00 to 10:02:12
+        window = WindowStats(60)
+        rollups = [window.add(data) for data in records]
+        emitted = [(i, r) for i, r in enumerate(rollups) if r is not None]
+        self.assertEqual([i for i, r in emitted], [20, 40])
+
+        first = emitted[0][1]
+        self.assertEqual(first['time'], datetime(2014, 2, 3, 10, 0, 0))
+        self.assertEqual(first['count'], 20)
+        drift = np.array([data['drift'] for data in records[:20]])
+        amplitude = np.array([data['amplitude'] for data in records[:20]])
+        assert_allclose(first['drift_mean'], drift.mean())
+        assert_allclose(first['drift_var'], drift.var(), rtol=1e-6)
+        assert_allclose(first['amplitude_max'], amplitude.max())
+        t = np.arange(20) * 3.0
+        assert_allclose(first['drift_rate'], np.polyfit(t, drift, 1)[0] * 86400, rtol=1e-6)
+        self.assertNotIn('amplitude_rate', first)
+        self.assertEqual(sorted(first), sorted(stats_columns()))
+
+        # The window in progress
+        self.assertEqual(window.rollup()['count'], 5)
+        self.assertEqual(window.rollup()['time'], datetime(2014, 2, 3, 10, 2, 0))
+
+    def test_windows_aligned_to_epoch(self):
+        window = WindowStats(3600)
+        records = make_records(3, start=datetime(2014, 2, 3, 10, 59, 57))
+        self.assertIsNone(window.add(records[0]))
+        rollup = window.add(records[1])
+        self.assertEqual(rollup['time'], datetime(2014, 2, 3, 10, 0, 0))
+        self.assertEqual(rollup['count'], 1)
+        self.assertEqual(window.start, 1391425200)
+
+    def test_gap_skips_empty_windows(self):
+        window = WindowStats(60)
+        window.add(make_records(1)[0])
+        rollup = window.add(make_records(1, start=datetime(2014, 2, 3, 12, 0, 0))[0])
+        self.assertEqual(rollup['time'], datetime(2014, 2, 3, 10, 0, 0))
+        self.assertEqual(window.start, 1391428800)
+
+
+class OnlineStatsTestCase(unittest.TestCase):
+    def test_drift_rate_over_day(self):
+        writers = {'1h': mock.MagicMock(), '1day': mock.MagicMock()}
+        stats = OnlineStats(writers, windows=[('1h', 3600), ('1day', 86400)])
+        records = make_records(28801, start=datetime(2014, 2, 3), rate=-1.5)
+        for data in records:
+            stats.write(data)
+        self.assertEqual(writers['1h'].write.call_count, 24)
+        self.assertEqual(writers['1day'].write.call_count, 1)
+        day = writers['1day'].write.call_args[0][0]
+        self.assertEqual(day['count'], 28800)
+        assert_allclose(day['drift_rate'], -1.5, atol=1e-3)
+        for args, kwargs in writers['1h'].write.call_args_list:
+            assert_allclose(args[0]['drift_rate'], -1.5, atol=0.1)
+            self.assertEqual(args[0]['count'], 1200)
+        self.assertEqual(stats.current()['1day']['count'], 1)
+
+    def test_windows_without_writers_are_kept(self):
+        stats = OnlineStats({})
+        for data in make_records(30):
+            stats.write(data)
+        self.assertEqual(sorted(stats.current()), ['1day', '1h', '1min'])
+
+    def test_close_closes_writers(self):
+        writer = mock.MagicMock()
+        stats = OnlineStats({'1min': writer})
+        stats.close()
+        writer.close.assert_called_once_with()
+
+    def test_windows_carry_on_after_restart(self):
+        path = mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        state_filename = os.path.join(path, 'stats.json')
+        windows = [('1min', 60), ('1h', 3600)]
+        records = make_records(2000)
+        expected = {'1min': mock.MagicMock(), '1h': mock.MagicMock()}
+        stats = OnlineStats(expected, windows)
+        for data in records:
+            stats.write(data)
+
+        writers = {'1min': mock.MagicMock(), '1h': mock.MagicMock()}
+        for part in (records[:1010], records[1010:]):
+            stats = OnlineStats(writers, windows, state_filename=state_filename)
+            for data in part:
+                stats.write(data)
+            stats.close()
+        for name in writers:
+            self.assertEqual(writers[name].write.call_args_list,
+                             expected[name].write.call_args_list)
+        restarted = OnlineStats({}, windows, state_filename=state_filename)
+        self.assertEqual(restarted.current(), stats.current())
+        # Saved windows are only carried on with once
+        restarted = OnlineStats({}, windows, state_filename=state_filename)
+        self.assertEqual(restarted.current(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
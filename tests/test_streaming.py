@@ -0,0 +1,144 @@
+import logging
+import unittest
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from clocklogger.analysis import ClockAnalyser, DataError, schmitt_edges
+from clocklogger.streaming import EdgeDetector, StreamingClockAnalyser
+from clocklogger.synthetic import SyntheticDataSource
+
+
+def groups(analyser, fit_decay=False):
+    analyser.source.i = 0
+    return list(analyser.generate_edge_groups(fit_decay))
+
+
+def early(analyser):
+    analyser.group_duration = 3.5
+    return analyser
+
+
+def records(analyser):
+    analyser.source.i = 0
+    out = []
+    while True:
+        try:
+            out.extend(analyser.process(pps_edge='down'))
+            return out
+        except DataError:
+            pass
+
+
+class EdgeDetectorTestCase(unittest.TestCase):
+    def setUp(self):
+        rs = np.random.RandomState(2)
+        self.y = np.cumsum(rs.normal(0, 0.05, 5000))
+
+    def _scan(self, detector, splits):
+        bounds = [0] + list(splits) + [len(self.y)]
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            detector.scan(self.y[a:b], a)
+        return detector.window(0, len(self.y))
+
+    def test_same_edges_in_any_blocks(self):
+        expected = schmitt_edges(self.y > 0.1)
+        for splits in [[], [1, 2, 3], range(7, 5000, 13), [2500]]:
+            assert_array_equal(self._scan(EdgeDetector(0.1), splits), expected)
+
+    def test_hysteresis(self):
+        expected = schmitt_edges(self.y > 0.1, self.y <= -0.1)
+        for splits in [[], range(5, 5000, 11)]:
+            assert_array_equal(self._scan(EdgeDetector(0.1, -0.1), splits), expected)
+        expected = schmitt_edges(self.y < -0.1, self.y >= 0.1)
+        assert_array_equal(self._scan(EdgeDetector(0.1, -0.1, sign=-1), range(3, 5000, 17)),
+                           expected)
+
+    def test_window(self):
+        detector = EdgeDetector(0.1, -0.1)
+        detector.scan(self.y, 0)
+        for start, stop in [(100, 2000), (1234, 4321)]:
+            y = self.y[start:stop]
+            assert_array_equal(detector.window(start, stop),
+                               schmitt_edges(y > 0.1, y <= -0.1))
+        detector.discard(1234)
+        y = self.y[1234:]
+        assert_array_equal(detector.window(1234, 5000), schmitt_edges(y > 0.1, y <= -0.1))
+
+
+class StreamingClockAnalyserTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.source = SyntheticDataSource(44100, 45.0, seed=3, phase=0.4, rate=17.0,
+                                          noise=0.001, rise=1e-4)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def assertGroupsEqual(self, a, b):
+        self.assertEqual(len(a), len(b))
+        for x, y in zip(a, b):
+            self.assertEqual(x[0], y[0])
+            for channel_x, channel_y in zip(x[1:], y[1:]):
+                for edges_x, edges_y in zip(channel_x, channel_y):
+                    assert_array_equal(edges_x, edges_y)
+
+    def test_whole_windows_give_same_groups(self):
+        for invert, interpolation, fit_decay in [(False, None, False), (True, None, False),
+                                                 (False, 'cubic', False), (False, None, True)]:
+            if invert:
+                self.source.y = -self.source.y
+            batch = ClockAnalyser(self.source, invert=invert)
+            streaming = StreamingClockAnalyser(self.source, invert=invert)
+            for analyser in (batch, streaming):
+                analyser.edge_interpolation = interpolation
+                analyser.edge_hysteresis = 0.03
+            self.assertGroupsEqual(groups(streaming, fit_decay), groups(batch, fit_decay))
+            if invert:
+                self.source.y = -self.source.y
+
+    def test_early_groups_give_same_records(self):
+        batch = records(ClockAnalyser(self.source))
+        self.assertEqual(records(early(StreamingClockAnalyser(self.source))), batch)
+        self.assertGreater(len(batch), 10)
+
+    def test_early_groups_are_sooner(self):
+        read = []
+        get_samples = self.source.get_samples
+        def spy(n):
+            samples = get_samples(n)
+            read.append(self.source.i + len(samples))
+            return samples
+        self.source.get_samples = spy
+        self.source.i = 0
+        t, pps, tick = next(early(StreamingClockAnalyser(self.source)).generate_edge_groups())
+        # Read no more than 4 s past the reference tick, not 6 s
+        self.assertLess(max(read), tick[0][0] + 4 * 44100)
+
+    def test_unfitted_ticks(self):
+        analyser = early(StreamingClockAnalyser(self.source))
+        pps = (np.array([5.0, 15.0, 25.0]), np.array([6.0, 16.0, 26.0]))
+        tick = (np.array([1.0, 11.0, 21.0, 31.0, np.nan, 41.0, 51.0]),
+                np.array([12.0, 22.0, np.nan]))
+        group = analyser.early_edge_group(10, 45, pps, tick)
+        assert_array_equal(group[1][0], [11.0, 21.0, 31.0, 41.0])
+        assert_array_equal(group[1][1], [12.0, 22.0])
+        tick = (np.array([1.0, 11.0, np.nan, 21.0, 31.0]), tick[1])
+        self.assertIsNone(analyser.early_edge_group(10, 45, pps, tick))
+
+    def test_missing_ticks_wait_for_whole_window(self):
+        source = SyntheticDataSource(44100, 45.0, seed=3, phase=0.4, noise=0.001,
+                                     missing_ticks=0.1)
+        batch = records(ClockAnalyser(source))
+        self.assertEqual(len(records(early(StreamingClockAnalyser(source)))), len(batch))
+
+    def test_same_records_from_noisy_pps(self):
+        # Early groups would see too few PPS edges to fail the sanity check
+        source = SyntheticDataSource(44100, 45.0, seed=4, phase=0.4, noise=0.01,
+                                     missing_pps=0.1, rise=1e-4)
+        batch = records(ClockAnalyser(source))
+        self.assertGreater(len(batch), 5)
+        self.assertEqual(records(StreamingClockAnalyser(source)), batch)
+
+
+if __name__ == '__main__':
+    unittest.main()
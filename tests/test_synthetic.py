@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+
+from clocklogger.analysis import ClockAnalyser
+from clocklogger.synthetic import (SyntheticDataSource, clock_signal,
+                                   drop_pulses, pps_edges)
+
+
+class DropPulsesTestCase(unittest.TestCase):
+    def test_nothing_dropped(self):
+        times, signs = pps_edges(10.0, 0.3)
+        t, s = drop_pulses(times, signs, 0.0, np.random.RandomState(1))
+        self.assertIs(t, times)
+
+    def test_pairs_are_dropped_together(self):
+        times, signs = pps_edges(100.0, 0.3)
+        t, s = drop_pulses(times, signs, 0.3, np.random.RandomState(1), pairs=True)
+        self.assertLess(len(t), len(times))
+        self.assertEqual(len(t) % 2, 0)
+        np.testing.assert_array_equal(s[0::2], 1)
+        np.testing.assert_array_equal(s[1::2], -1)
+
+
+class ClockSignalTestCase(unittest.TestCase):
+    def test_same_seed_same_signal(self):
+        a = clock_signal(8000, 10.0, noise=0.01, missing_ticks=0.1, seed=3)
+        b = clock_signal(8000, 10.0, noise=0.01, missing_ticks=0.1, seed=3)
+        np.testing.assert_array_equal(a, b)
+
+    def test_missing_pps(self):
+        y = clock_signal(8000, 20.0, missing_pps=1.0, seed=1)
+        self.assertEqual(abs(y[:, 1]).max(), 0)
+        self.assertGreater(abs(y[:, 0]).max(), 0.5)
+
+
+class SyntheticDataSourceTestCase(unittest.TestCase):
+    def test_drift_follows_rate(self):
+        source = SyntheticDataSource(8000, 60.0, seed=1, phase=0.4, rate=100.0,
+                                     noise=0.0001)
+        self.assertEqual(source.fs, 8000)
+        self.assertEqual(source.num_samples, 8000 * 60)
+        analyser = ClockAnalyser(source)
+        records = list(analyser.process(pps_edge='down'))
+        self.assertGreater(len(records), 15)
+        drift = np.array([r['drift'] for r in records])
+        # 100 s/day is 3.47 ms per 3 s swing
+        step = np.median(np.diff(drift))
+        self.assertAlmostEqual(step / 3.0 * 86400, 100.0, delta=2.0)
+        self.assertEqual(records[0]['time'].date(), source.start_time.date())
+
+
+if __name__ == '__main__':
+    unittest.main()
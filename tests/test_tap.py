@@ -0,0 +1,88 @@
+import unittest
+import os.path
+from tempfile import mkdtemp
+import shutil
+import threading
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from clocklogger.tap import RecordingTap
+from clocklogger.recording import RawRecording
+from clocklogger.input import PrerecordedDataSource
+
+
+class RecordingTapTestCase(unittest.TestCase):
+    fs = 1000
+
+    def setUp(self):
+        self.path = mkdtemp()
+        self.directory = os.path.join(self.path, 'raw')
+        rng = np.random.RandomState(1)
+        self.frames = rng.randint(-2**15, 2**15, (5000, 2)).astype(np.int16)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _feed(self, tap, start, stop, block=250, t0=1e9):
+        for i in range(start, stop, block):
+            tap.put(i, self.frames[i:i + block], t0 + i / self.fs)
+
+    def test_chunks_can_be_replayed(self):
+        tap = RecordingTap(self.directory, self.fs, chunk_duration=2.0)
+        self._feed(tap, 0, 5000)
+        tap.close()
+
+        files = tap.chunk_files()
+        self.assertEqual(len(files), 3)
+        self.assertEqual(tap.chunks_written, 3)
+        self.assertEqual(tap.frames_written, 5000)
+        self.assertEqual(tap.bytes_written, self.frames.nbytes)
+        self.assertEqual(tap.depth, 0)
+        recordings = [RawRecording(filename) for filename in files]
+        assert_array_equal(np.concatenate([r.frames for r in recordings]), self.frames)
+        self.assertEqual([r.start_time for r in recordings], [1e9, 1e9 + 2, 1e9 + 4])
+
+        source = PrerecordedDataSource(files[1])
+        source.consume(100)
+        assert_array_equal(source.get_samples(10), self.frames[2100:2110] / 2**15)
+
+    def test_gap_starts_new_chunk(self):
+        tap = RecordingTap(self.directory, self.fs, chunk_duration=10.0)
+        self._feed(tap, 0, 1000)
+        self._feed(tap, 2000, 3000)
+        tap.close()
+        recordings = [RawRecording(filename) for filename in tap.chunk_files()]
+        assert_array_equal(recordings[0].frames, self.frames[:1000])
+        assert_array_equal(recordings[1].frames, self.frames[2000:3000])
+
+    def test_retention_size(self):
+        tap = RecordingTap(self.directory, self.fs, chunk_duration=1.0,
+                           max_bytes=12000)
+        self._feed(tap, 0, 5000)
+        tap.close()
+        files = tap.chunk_files()
+        self.assertLess(len(files), 5)
+        self.assertEqual(tap.chunks_deleted, 5 - len(files))
+        self.assertLessEqual(sum(os.path.getsize(f) for f in files), 12000)
+        # The most recent chunks are kept
+        assert_array_equal(RawRecording(files[-1]).frames, self.frames[4000:])
+
+    def test_full_queue_drops_blocks(self):
+        tap = RecordingTap(self.directory, self.fs, max_blocks=2)
+        # Hold up the writer thread so the queue fills up
+        blocked = threading.Event()
+        write = tap._write
+        def slow_write(*args):
+            blocked.wait()
+            write(*args)
+        tap._write = slow_write
+        self._feed(tap, 0, 2000)
+        self.assertGreater(tap.frames_dropped, 0)
+        self.assertLessEqual(tap.depth, 2)
+        blocked.set()
+        tap.close()
+        self.assertEqual(tap.frames_written + tap.frames_dropped, 2000)
+
+
+if __name__ == '__main__':
+    unittest.main()
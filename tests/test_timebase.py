@@ -0,0 +1,75 @@
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+
+from clocklogger.timebase import TimeBase
+
+
+class TimeBaseTestCase(unittest.TestCase):
+    fs = 44100
+
+    def test_no_time_before_first_observation(self):
+        timebase = TimeBase(self.fs)
+        self.assertIsNone(timebase.time_at(0))
+
+    def test_adc_timestamps_anchor_exactly(self):
+        timebase = TimeBase(self.fs)
+        timebase.observe_adc(1000, 1364601603.0)
+        self.assertEqual(timebase.time_at(1000), datetime(2013, 3, 30, 0, 0, 3))
+        self.assertEqual(timebase.time_at(1000 + 3 * self.fs),
+                         datetime(2013, 3, 30, 0, 0, 6))
+
+    def test_fits_noisy_wall_clock_readings(self):
+        # Sound card runs 20 ppm fast; readings jitter by up to 10 ms
+        rate = self.fs * (1 + 20e-6)
+        timebase = TimeBase(self.fs, min_fit_span=60)
+        np.random.seed(1)
+        for i in range(200):
+            n = int(i * 3 * self.fs)
+            t = 1e9 + n / rate + np.random.uniform(0, 0.01)
+            timebase.observe(n, t)
+        self.assertAlmostEqual(timebase.drift_ppm, 20, delta=2)
+        n = 200 * 3 * self.fs
+        self.assertAlmostEqual(timebase.timestamp_at(n), 1e9 + n / rate + 0.005,
+                               delta=0.002)
+
+    def test_observations_are_thinned(self):
+        timebase = TimeBase(self.fs, interval=1.0)
+        for i in range(100):
+            timebase.observe_adc(i * 441, 1e9 + i * 0.01)
+        self.assertEqual(len(timebase.observations), 1)
+        # The ADC clock is anchored once
+        self.assertEqual(timebase.anchor_sample, 0)
+
+    def test_callback_jitter_is_averaged_out(self):
+        # The stream clock is 1000 s behind the wall clock; each block's
+        # wall-clock reading is late by up to 20 ms
+        timebase = TimeBase(self.fs)
+        rng = np.random.RandomState(2)
+        stream_t0 = 5000.0
+        times = []
+        for i in range(400):
+            n = i * 1024
+            adc_time = stream_t0 + n / self.fs
+            stream_time = adc_time + 0.005
+            timebase.observe_adc(n, adc_time, stream_time,
+                                 stream_time + 1000.0 + rng.uniform(0, 0.02))
+            times.append(timebase.timestamp_at(100000))
+        self.assertLess(np.ptp(times[200:]), 0.002)
+        self.assertAlmostEqual(times[-1], stream_t0 + 1000.01 + 100000 / self.fs,
+                               delta=0.002)
+
+    def test_pps_calibrates_rate(self):
+        timebase = TimeBase(self.fs)
+        timebase.observe_adc(0, 1e9)
+        timebase.observe_pps_rate(self.fs + 4.41)
+        self.assertAlmostEqual(timebase.drift_ppm, 100)
+        self.assertAlmostEqual(timebase.timestamp_at(self.fs + 4.41), 1e9 + 1)
+
+        # Subsequent measurements are smoothed
+        timebase.observe_pps_rate(self.fs)
+        self.assertAlmostEqual(timebase.drift_ppm, 90)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import json
+import os.path
+import shutil
+from tempfile import mkdtemp
+import numpy as np
+
+from clocklogger.timing import Timers, StageTimer, NULL_TIMING, timers
+from clocklogger.input import PrerecordedDataSource
+from clocklogger.analysis import ClockAnalyser
+from clocklogger.synthetic import clock_signal
+
+
+class StageTimerTestCase(unittest.TestCase):
+    def test_statistics_and_quantiles(self):
+        timer = StageTimer('x')
+        for duration in [1e-4] * 90 + [1e-2] * 9 + [1.0]:
+            timer.add(duration)
+        snapshot = timer.snapshot()
+        self.assertEqual(snapshot['count'], 100)
+        self.assertAlmostEqual(snapshot['total'], 1.0 + 0.09 + 0.009)
+        self.assertEqual(snapshot['min'], 1e-4)
+        self.assertEqual(snapshot['max'], 1.0)
+        self.assertAlmostEqual(snapshot['p50'], 1e-4)
+        self.assertAlmostEqual(snapshot['p99'], 1e-2)
+        self.assertEqual(snapshot['histogram'], {'0.0001': 90, '0.01': 9, '1': 1})
+
+    def test_out_of_range_durations(self):
+        timer = StageTimer('x')
+        timer.add(0.0)
+        timer.add(1e-9)
+        timer.add(1e4)
+        self.assertEqual(sum(timer.buckets), 3)
+        self.assertEqual(timer.buckets[0], 2)
+        self.assertEqual(timer.quantile(1.0), 1e4)
+
+
+class TimersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_disabled_does_nothing(self):
+        t = Timers()
+        self.assertIs(t.time('read'), NULL_TIMING)
+        with t.time('read'):
+            pass
+        t.add('read', 1.0)
+        self.assertEqual(t.snapshot()['stages'], {})
+
+    def test_enabled(self):
+        t = Timers(enabled=True)
+        for i in range(3):
+            with t.time('read'):
+                pass
+        t.add('write', 0.5)
+        stages = t.snapshot()['stages']
+        self.assertEqual(stages['read']['count'], 3)
+        self.assertEqual(stages['write']['max'], 0.5)
+        t.reset()
+        self.assertEqual(t.snapshot()['stages'], {})
+
+    def test_exceptions_pass_through(self):
+        t = Timers(enabled=True)
+        with self.assertRaises(ValueError):
+            with t.time('read'):
+                raise ValueError()
+        self.assertEqual(t.stages['read'].count, 1)
+
+    def test_export(self):
+        filename = os.path.join(self.path, 'metrics', 'timing.json')
+        t = Timers(enabled=True)
+        t.add('read', 0.25)
+        t.start_export(filename, interval=1000)
+        t.stop_export()
+        with open(filename) as f:
+            data = json.load(f)
+        self.assertEqual(data['stages']['read']['mean'], 0.25)
+        self.assertFalse(os.path.exists(filename + '.tmp'))
+
+
+class AnalysisTimingTestCase(unittest.TestCase):
+    def test_stages_are_timed(self):
+        path = mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        filename = os.path.join(path, 'recording.npz')
+        signal = clock_signal(8000, 30.0, noise=0.0001, seed=1, phase=0.4)
+        np.savez(filename, fs=8000, signal=signal, start_time=1e9)
+
+        timers.reset()
+        timers.enabled = True
+        self.addCleanup(setattr, timers, 'enabled', False)
+        analyser = ClockAnalyser(PrerecordedDataSource(filename))
+        records = list(analyser.process(pps_edge='down', fit_decay=True))
+        stages = timers.snapshot()['stages']
+        self.assertEqual(set(stages), {'read', 'find_edges', 'fit_decays', 'drift_amplitude'})
+        self.assertEqual(stages['drift_amplitude']['count'], len(records))
+        self.assertGreaterEqual(stages['read']['count'], len(records))
+
+
+if __name__ == '__main__':
+    unittest.main()